@@ -0,0 +1,351 @@
+import asyncio
+import inspect
+import logging
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from functools import cache, wraps
+from typing import Any, Callable, Optional
+
+from fastapi_cache import FastAPICache
+from fastapi_cache.types import Backend
+from starlette.requests import Request
+from starlette.responses import Response
+
+from . import compression, metrics, serialization
+from .cache_backends import TierStats
+from .singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Path params that are matched case-insensitively by the upstream sites
+CASE_INSENSITIVE_PARAMS = {"query"}
+
+
+def _normalize(name: str, value: Any) -> str:
+    if isinstance(value, str):
+        value = " ".join(value.split())
+        if name in CASE_INSENSITIVE_PARAMS:
+            value = value.lower()
+    return str(value)
+
+
+@cache
+def _signature(func: Callable[..., Any]) -> inspect.Signature:
+    return inspect.signature(func)
+
+
+def key_builder(
+    func: Callable[..., Any],
+    namespace: str = "",
+    *,
+    request: Optional[Request] = None,
+    response: Optional[Response] = None,
+    args: tuple[Any, ...],
+    kwargs: dict[str, Any],
+) -> str:
+    """Builds `{prefix}:{provider}:v{version}:{route}:{params}` cache keys.
+
+    Arguments are bound to the signature of `func` with their defaults, so
+    a call gets the same key however it passes them. Only plain path/query
+    values take part in the key, so injected dependencies such as the
+    upstream session never make it unique.
+    """
+    bound = _signature(func).bind(*args, **kwargs)
+    bound.apply_defaults()
+    params = "&".join(
+        f"{name}={_normalize(name, value)}"
+        for name, value in sorted(bound.arguments.items())
+        if value is None or isinstance(value, (str, int, float, bool))
+    )
+    return f"{namespace}:{func.__module__}.{func.__qualname__}:{params}"
+
+
+def namespace(provider: str, version: int) -> str:
+    return f"{provider}:v{version}"
+
+
+class CacheStats:
+    def __init__(self):
+        self.hits: dict[str, int] = defaultdict(int)
+        self.misses: dict[str, int] = defaultdict(int)
+        self.errors: dict[str, int] = defaultdict(int)
+        # The same counters by "{provider}.{route function}"
+        self.routes: dict[str, TierStats] = defaultdict(TierStats)
+
+    def hit_ratio(self, provider: str) -> float:
+        total = self.hits[provider] + self.misses[provider]
+        return self.hits[provider] / total if total else 0.0
+
+    def as_dict(self) -> dict[str, dict[str, float]]:
+        return {
+            provider: {
+                "hits": self.hits[provider],
+                "misses": self.misses[provider],
+                "errors": self.errors[provider],
+                "hit_ratio": self.hit_ratio(provider),
+            }
+            for provider in sorted({*self.hits, *self.misses, *self.errors})
+        }
+
+
+stats = CacheStats()
+
+
+def _provider(key: str) -> str:
+    # Keys look like "{prefix}:{provider}:v{version}:..."
+    parts = key.split(":", 2)
+    return parts[1] if len(parts) > 2 else ""
+
+
+def _function(key: str) -> str:
+    # "{prefix}:{provider}:v{version}:{module}.{function}:{params}"
+    parts = key.split(":", 4)
+    return parts[3].rsplit(".", 1)[-1] if len(parts) == 5 else ""
+
+
+def _route(key: str) -> str:
+    function = _function(key)
+    return f"{_provider(key)}.{function}" if function else ""
+
+
+class StatsBackend(Backend):
+    """Counts hits and misses per provider namespace for a wrapped backend.
+
+    Kept in `stats` and exported as the `stremio_cache_lookups` counter.
+    """
+
+    def __init__(self, backend: Backend):
+        self.backend = backend
+
+    async def get_with_ttl(self, key: str) -> tuple[int, Optional[bytes]]:
+        provider = _provider(key)
+        route = stats.routes[_route(key)]
+        try:
+            ttl, value = await self.backend.get_with_ttl(key)
+        except Exception:
+            stats.errors[provider] += 1
+            stats.misses[provider] += 1
+            route.errors += 1
+            route.misses += 1
+            metrics.count_cache_lookup(provider, _function(key), "error")
+            raise
+        if value is None:
+            stats.misses[provider] += 1
+            route.misses += 1
+        else:
+            stats.hits[provider] += 1
+            route.hits += 1
+        metrics.count_cache_lookup(provider, _function(key), "miss" if value is None else "hit")
+        return ttl, value
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self.backend.get(key)
+
+    async def set(self, key: str, value: bytes, expire: Optional[int] = None) -> None:
+        await self.backend.set(key, value, expire)
+
+    async def clear(self, namespace: Optional[str] = None, key: Optional[str] = None) -> int:
+        return await self.backend.clear(namespace, key)
+
+
+class Uncacheable(Exception):
+    """Raised by a cached route to answer with `result` without storing it.
+
+    For results known to be incomplete, such as a meta missing the seasons
+    that didn't load in time: the next request computes them again.
+    """
+
+    def __init__(self, result: Any):
+        super().__init__(result)
+        self.result = result
+
+
+# Background revalidations and cold fills, at most one per cache key
+revalidations = SingleFlight("cache")
+_background: set[asyncio.Task] = set()
+
+
+# Stored entries: a "swr1 {fresh_until} {encoding}" line, then the compressed JSON body
+ENTRY_FORMAT = b"swr1"
+
+
+@dataclass(frozen=True)
+class Entry:
+    fresh_until: float
+    encoding: str
+    body: bytes
+
+    @classmethod
+    def build(cls, fresh_until: float, value: Any) -> "Entry":
+        with metrics.timed("compress"):
+            body = serialization.dumps(value)
+            encoding = compression.best()
+            return cls(fresh_until, encoding, compression.compress(body, encoding, stored=True))
+
+    def pack(self) -> bytes:
+        return b"%s %r %s\n" % (ENTRY_FORMAT, self.fresh_until, self.encoding.encode()) + self.body
+
+    @classmethod
+    def unpack(cls, data: bytes) -> Optional["Entry"]:
+        """None for entries of an older format or an encoding not installed here."""
+        header, newline, body = data.partition(b"\n")
+        parts = header.split(b" ")
+        if not newline or len(parts) != 3 or parts[0] != ENTRY_FORMAT or parts[2].decode() not in compression.CODECS:
+            return None
+        return cls(float(parts[1]), parts[2].decode(), body)
+
+    def value(self) -> Any:
+        return serialization.loads(compression.decompress(self.body, self.encoding))
+
+    def response(self) -> Response:
+        """The stored bytes as they are when the client takes their encoding, else just inflated."""
+        if compression.negotiate(compression.accepted.get(), [self.encoding]):
+            return Response(
+                self.body,
+                media_type="application/json",
+                headers={"Content-Encoding": self.encoding, "Vary": "Accept-Encoding"},
+            )
+        return Response(
+            compression.decompress(self.body, self.encoding),
+            media_type="application/json",
+            headers={"Vary": "Accept-Encoding"},
+        )
+
+
+def _cached(func: Callable, namespace: str, lifetime: Callable[[Any], tuple[float, float]], respond: bool):
+    """Wraps a route in the cache; `lifetime(result)` gives (fresh, kept) seconds.
+
+    With `respond`, calls made while serving a request get the stored
+    payload as a ready Response instead of the decoded value.
+    """
+
+    def make_refresh(args, kwargs):
+        backend = FastAPICache.get_backend()
+        key = FastAPICache.get_key_builder()(
+            func, f"{FastAPICache.get_prefix()}:{namespace}", args=args, kwargs=kwargs
+        )
+
+        async def refresh() -> tuple[Any, Optional[Entry]]:
+            try:
+                result = await func(*args, **kwargs)
+            except Uncacheable as e:
+                return e.result, None
+            fresh, kept = lifetime(result)
+            if kept < 1:
+                # Goes bad before anyone could be served it
+                return result, None
+            entry = Entry.build(time.time() + fresh, result)
+            try:
+                await backend.set(key, entry.pack(), int(kept))
+            except Exception:
+                logger.warning(f"Error setting cache key '{key}' in backend:", exc_info=True)
+            return result, entry
+
+        return key, backend, refresh
+
+    def serve(result: Any, entry: Optional[Entry]) -> Any:
+        if entry is None:
+            return result
+        if respond and compression.accepted.get() is not None:
+            return entry.response()
+        return result if result is not None else entry.value()
+
+    async def uncached(*args, **kwargs):
+        try:
+            return await func(*args, **kwargs)
+        except Uncacheable as e:
+            return e.result
+
+    @wraps(func)
+    async def inner(*args, **kwargs):
+        if not FastAPICache.get_enable():
+            return await uncached(*args, **kwargs)
+
+        key, backend, refresh = make_refresh(args, kwargs)
+        try:
+            _, cached = await backend.get_with_ttl(key)
+        except Exception:
+            logger.warning(f"Error retrieving cache key '{key}' from backend:", exc_info=True)
+            cached = None
+
+        entry = Entry.unpack(cached) if cached is not None else None
+        if entry is None:
+            return serve(*await revalidations.do(key, refresh))
+
+        if entry.fresh_until < time.time():
+            _revalidate(key, refresh)
+        return serve(None, entry)
+
+    async def refresh_now(*args, **kwargs):
+        if not FastAPICache.get_enable():
+            return await uncached(*args, **kwargs)
+        key, _, refresh = make_refresh(args, kwargs)
+        result, _ = await revalidations.do(key, refresh)
+        return result
+
+    inner.refresh = refresh_now
+    return inner
+
+
+def cache_swr(expire: int, stale: int, namespace: str = ""):
+    """Caches a route with stale-while-revalidate semantics.
+
+    Entries are fresh for `expire` seconds. For `stale` more seconds the
+    stored payload is still returned immediately while one background call
+    of the route refreshes it, so clients only wait on a cold key.
+
+    Entries are stored as compressed JSON bodies. A hit is sent as those
+    bytes when the client accepts their encoding, without being decoded,
+    validated and encoded again.
+
+    The decorated route gets a `refresh(**kwargs)` coroutine that recomputes
+    and stores the entry regardless of its age, for cache warm-up.
+    """
+
+    def wrapper(func):
+        return _cached(func, namespace, lambda _: (expire, expire + stale), respond=True)
+
+    return wrapper
+
+
+def cache_until(
+    expire: int,
+    expires: Callable[[Any], Optional[float]],
+    namespace: str = "",
+    refresh_ahead: float = 0.2,
+    margin: float = 60,
+):
+    """Caches a route whose result stops working at a time it carries itself.
+
+    `expires(result)` returns that Unix time (say, from signed stream URLs),
+    or None when the result doesn't say. The entry is kept until `margin`
+    seconds before it, and never longer than `expire` seconds. Requests in
+    the last `refresh_ahead` share of that lifetime still get the entry
+    while it is resolved again in the background, so links are replaced
+    before they die and clients rarely wait on a re-resolve.
+    """
+
+    def lifetime(result) -> tuple[float, float]:
+        kept = expire
+        deadline = expires(result)
+        if deadline is not None:
+            kept = min(kept, deadline - margin - time.time())
+        return kept * (1 - refresh_ahead), kept
+
+    def wrapper(func):
+        return _cached(func, namespace, lifetime, respond=False)
+
+    return wrapper
+
+
+def _revalidate(key: str, refresh: Callable):
+    async def run():
+        try:
+            await revalidations.do(key, refresh)
+        except Exception:
+            logger.warning(f"Background refresh of '{key}' failed, keeping the stale entry", exc_info=True)
+
+    task = asyncio.ensure_future(run())
+    _background.add(task)
+    task.add_done_callback(_background.discard)
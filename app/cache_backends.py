@@ -0,0 +1,192 @@
+import logging
+import sys
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Generic, Optional, TypeVar
+
+from fastapi_cache.types import Backend
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+def _sizeof(value: Any) -> int:
+    return len(value) if isinstance(value, (bytes, str)) else sys.getsizeof(value)
+
+
+class TTLCache(Generic[T]):
+    """In-process cache bounded by entry count and approximate size in bytes.
+
+    `eviction` is "lru" (hits move an entry to the back) or "fifo"
+    (insertion order only, cheaper for write-once data).
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int, eviction: str = "lru"):
+        if eviction not in ("lru", "fifo"):
+            raise ValueError(f"Unknown eviction policy: {eviction}")
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.eviction = eviction
+        self.bytes = 0
+        self._data: OrderedDict[Any, tuple[float, int, T]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get_with_ttl(self, key: Any) -> tuple[float, Optional[T]]:
+        item = self._data.get(key)
+        if item is None:
+            return 0, None
+        expires_at, _, value = item
+        now = time.monotonic()
+        if expires_at <= now:
+            self.pop(key)
+            return 0, None
+        if self.eviction == "lru":
+            self._data.move_to_end(key)
+        return expires_at - now, value
+
+    def get(self, key: Any) -> Optional[T]:
+        return self.get_with_ttl(key)[1]
+
+    def set(self, key: Any, value: T, ttl: float):
+        size = _sizeof(value)
+        if size > self.max_bytes:
+            return
+        self.pop(key)
+        self._data[key] = (time.monotonic() + ttl, size, value)
+        self.bytes += size
+        while len(self._data) > self.max_entries or self.bytes > self.max_bytes:
+            _, (_, evicted_size, _) = self._data.popitem(last=False)
+            self.bytes -= evicted_size
+
+    def pop(self, key: Any) -> Optional[T]:
+        item = self._data.pop(key, None)
+        if item is None:
+            return None
+        self.bytes -= item[1]
+        return item[2]
+
+    def keys(self) -> list[Any]:
+        now = time.monotonic()
+        return [key for key, (expires_at, _, _) in self._data.items() if expires_at > now]
+
+    def clear(self, prefix: Optional[str] = None) -> int:
+        keys = [key for key in self._data if prefix is None or str(key).startswith(prefix)]
+        for key in keys:
+            self.pop(key)
+        return len(keys)
+
+
+@dataclass
+class TierStats:
+    hits: int = 0
+    misses: int = 0
+    errors: int = 0
+
+
+class MemoryBackend(Backend):
+    def __init__(self, cache: TTLCache[bytes], max_ttl: int):
+        self.cache = cache
+        self.max_ttl = max_ttl
+
+    async def get_with_ttl(self, key: str) -> tuple[int, Optional[bytes]]:
+        ttl, value = self.cache.get_with_ttl(key)
+        return int(ttl), value
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return self.cache.get(key)
+
+    async def set(self, key: str, value: bytes, expire: Optional[int] = None) -> None:
+        self.cache.set(key, value, min(expire or self.max_ttl, self.max_ttl))
+
+    async def clear(self, namespace: Optional[str] = None, key: Optional[str] = None) -> int:
+        if key:
+            return int(self.cache.pop(key) is not None)
+        return self.cache.clear(namespace)
+
+
+class LayeredBackend(Backend):
+    """Bounded in-process tier in front of a shared (Redis) tier.
+
+    When the shared tier fails it is skipped for `retry_interval` seconds
+    and the app keeps serving from memory instead of failing requests.
+    """
+
+    def __init__(self, memory: MemoryBackend, shared: Backend, retry_interval: float = 30):
+        self.memory = memory
+        self.shared = shared
+        self.retry_interval = retry_interval
+        self.stats = {"memory": TierStats(), "redis": TierStats()}
+        self._shared_down_until = 0.0
+
+    @property
+    def shared_available(self) -> bool:
+        return time.monotonic() >= self._shared_down_until
+
+    def _shared_failed(self, action: str):
+        self.stats["redis"].errors += 1
+        if self.shared_available:
+            logger.warning(
+                f"Redis cache {action} failed, serving from memory for {self.retry_interval}s", exc_info=True
+            )
+        self._shared_down_until = time.monotonic() + self.retry_interval
+
+    async def get_with_ttl(self, key: str) -> tuple[int, Optional[bytes]]:
+        started = time.perf_counter()
+        ttl, value = await self.memory.get_with_ttl(key)
+        result = "miss" if value is None else "hit"
+        metrics.observe_cache("memory", "get", result, time.perf_counter() - started)
+        if value is not None:
+            self.stats["memory"].hits += 1
+            return ttl, value
+        self.stats["memory"].misses += 1
+
+        if not self.shared_available:
+            return 0, None
+        started = time.perf_counter()
+        try:
+            ttl, value = await self.shared.get_with_ttl(key)
+        except Exception:
+            metrics.observe_cache("redis", "get", "error", time.perf_counter() - started)
+            self._shared_failed("read")
+            return 0, None
+        result = "miss" if value is None else "hit"
+        metrics.observe_cache("redis", "get", result, time.perf_counter() - started)
+        if value is None:
+            self.stats["redis"].misses += 1
+            return 0, None
+        self.stats["redis"].hits += 1
+        await self.memory.set(key, value, ttl if ttl > 0 else None)
+        return ttl, value
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return (await self.get_with_ttl(key))[1]
+
+    async def set(self, key: str, value: bytes, expire: Optional[int] = None) -> None:
+        started = time.perf_counter()
+        await self.memory.set(key, value, expire)
+        metrics.observe_cache("memory", "set", "ok", time.perf_counter() - started)
+        if not self.shared_available:
+            return
+        started = time.perf_counter()
+        try:
+            await self.shared.set(key, value, expire)
+        except Exception:
+            metrics.observe_cache("redis", "set", "error", time.perf_counter() - started)
+            self._shared_failed("write")
+        else:
+            metrics.observe_cache("redis", "set", "ok", time.perf_counter() - started)
+
+    async def clear(self, namespace: Optional[str] = None, key: Optional[str] = None) -> int:
+        count = await self.memory.clear(namespace, key)
+        if self.shared_available:
+            try:
+                count = await self.shared.clear(namespace, key)
+            except Exception:
+                self._shared_failed("clear")
+        return count
@@ -0,0 +1,30 @@
+from urllib.parse import parse_qsl
+
+from . import search
+from .schemas import Preview
+
+# Catalog extras answered from the index tags of the same name
+FILTERS = ("genre", "year")
+
+
+def parse_extra(extra: str) -> dict[str, str]:
+    """`genre=Драма&skip=20`, as Stremio puts extras into the path."""
+    return dict(parse_qsl(extra))
+
+
+async def manifest_extra(provider: str, catalog: str) -> list[dict]:
+    """Genre and year options of a catalog, from what has been indexed so far."""
+    within = f"catalog:{catalog}"
+    return [
+        {"name": "genre", "options": await search.index.tag_values(provider, "genre", within)},
+        {"name": "year", "options": sorted(await search.index.tag_values(provider, "year", within), reverse=True)},
+        {"name": "skip"},
+    ]
+
+
+async def browse(provider: str, catalog: str, type_: str, extra: str, limit: int) -> dict[str, list[Preview]]:
+    """A filtered catalog page, answered from the index without asking the site."""
+    values = parse_extra(extra)
+    tags = [f"catalog:{catalog}"] + [f"{name}:{values[name]}" for name in FILTERS if values.get(name)]
+    skip = int(values["skip"]) if values.get("skip", "").isdigit() else 0
+    return {"metas": await search.index.browse(provider, tags, type_, skip, limit)}
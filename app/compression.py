@@ -0,0 +1,137 @@
+import gzip
+from collections.abc import Callable, Iterable
+from contextvars import ContextVar
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Content-Encoding -> (compress(data, level), decompress(data), level for cache entries, level on the fly)
+# Entries are compressed on the request that fills the cache, so both are mid
+# levels: the top ones (zstd 19, br 11) cost many times the CPU for a few
+# percent smaller bodies
+CODECS: dict[str, tuple[Callable[[bytes, int], bytes], Callable[[bytes], bytes], int, int]] = {}
+if zstandard is not None:
+    CODECS["zstd"] = (
+        lambda data, level: zstandard.ZstdCompressor(level=level).compress(data),
+        lambda data: zstandard.ZstdDecompressor().decompress(data),
+        6,
+        3,
+    )
+if brotli is not None:
+    CODECS["br"] = (lambda data, level: brotli.compress(data, quality=level), brotli.decompress, 5, 4)
+CODECS["gzip"] = (lambda data, level: gzip.compress(data, level, mtime=0), gzip.decompress, 6, 6)
+
+# Media is compressed already
+EXCLUDED_TYPES = ("video/", "audio/", "image/", "application/gzip", "application/zip")
+
+# Accept-Encoding of the request being served, None outside of one
+accepted: ContextVar[Optional[str]] = ContextVar("accept_encoding", default=None)
+
+
+def best() -> str:
+    """The strongest encoding installed, cache entries are stored with it."""
+    return next(iter(CODECS))
+
+
+def compress(data: bytes, encoding: str, stored: bool = False) -> bytes:
+    codec, _, stored_level, level = CODECS[encoding]
+    return codec(data, stored_level if stored else level)
+
+
+def decompress(data: bytes, encoding: str) -> bytes:
+    return CODECS[encoding][1](data)
+
+
+def negotiate(accept_encoding: Optional[str], available: Iterable[str]) -> Optional[str]:
+    """The encoding of `available` the client prefers, None for identity."""
+    if not accept_encoding:
+        return None
+    weights = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[name.strip().lower()] = q
+    wildcard = weights.get("*", 0.0)
+    # Ties go to the server's order, strongest first
+    candidates = [(weights.get(name, wildcard), -rank, name) for rank, name in enumerate(available)]
+    q, _, name = max(candidates, default=(0.0, 0, None))
+    return name if q > 0 else None
+
+
+class CompressionMiddleware:
+    """Compresses whole response bodies with the encoding the client prefers.
+
+    Responses that already have a Content-Encoding (cache hits sent as they
+    were stored) and streamed ones (proxied segments) pass through.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 500):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept_encoding = Headers(scope=scope).get("accept-encoding", "")
+        token = accepted.set(accept_encoding)
+        try:
+            encoding = negotiate(accept_encoding, CODECS)
+            if encoding is None:
+                await self.app(scope, receive, send)
+            else:
+                await self.app(scope, receive, _Responder(send, encoding, self.minimum_size).send)
+        finally:
+            accepted.reset(token)
+
+
+class _Responder:
+    def __init__(self, send: Send, encoding: str, minimum_size: int):
+        self._send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.start: Optional[Message] = None
+        self.passthrough = False
+
+    async def send(self, message: Message):
+        if self.passthrough:
+            await self._send(message)
+        elif message["type"] == "http.response.start":
+            self.start = message
+        elif message["type"] == "http.response.body":
+            headers = MutableHeaders(raw=self.start["headers"])
+            body = message.get("body", b"")
+            if (
+                message.get("more_body", False)
+                or "content-encoding" in headers
+                or len(body) < self.minimum_size
+                or headers.get("content-type", "").startswith(EXCLUDED_TYPES)
+            ):
+                self.passthrough = True
+            else:
+                body = compress(body, self.encoding)
+                headers["Content-Encoding"] = self.encoding
+                headers["Content-Length"] = str(len(body))
+                headers.add_vary_header("Accept-Encoding")
+                message = {**message, "body": body}
+            await self._send(self.start)
+            await self._send(message)
+        else:
+            await self._send(message)
@@ -0,0 +1,14 @@
+import sqlite3
+
+
+def connect(path: str, schema: str) -> sqlite3.Connection:
+    """Opens a SQLite database shared by the event loop and worker threads.
+
+    Autocommit mode, callers wrap multi-statement writes in BEGIN/COMMIT
+    and serialize access with their own lock.
+    """
+    db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.executescript(schema)
+    return db
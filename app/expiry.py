@@ -0,0 +1,67 @@
+import re
+import time
+from typing import Iterable, Optional
+from urllib.parse import parse_qsl, urlsplit
+
+# Query params holding the Unix time a signed URL stops working
+EXPIRES_PARAMS = {"expires", "expire", "expiry", "exp", "valid_until", "validto", "deadline"}
+# Query params holding how many seconds it still works
+TTL_PARAMS = {"ttl", "max_age", "lifetime"}
+# Tokens made of key=value pairs themselves, e.g. Akamai's hdnts=st=...~exp=...~hmac=...
+TOKEN_PARAMS = {"hdnts", "hdntl", "__token__", "token"}
+TIMESTAMP = re.compile(r"\d{10}(\d{3})?")
+# Timestamps in signed paths (/hls/{hash}/{expires}/index.m3u8) further out
+# than this are something else, ids or dates
+PATH_HORIZON = 7 * 24 * 60 * 60
+
+
+def _timestamp(value: str) -> Optional[float]:
+    if not TIMESTAMP.fullmatch(value):
+        return None
+    # Milliseconds when 13 digits long
+    return int(value) / 1000 if len(value) == 13 else float(value)
+
+
+def expires_at(url: str, now: Optional[float] = None) -> Optional[float]:
+    """Unix time a signed URL stops working, None when it doesn't say."""
+    now = time.time() if now is None else now
+    parts = urlsplit(url)
+    found = []
+    for name, value in parse_qsl(parts.query):
+        name = name.lower()
+        if name in EXPIRES_PARAMS:
+            found.append(_timestamp(value))
+        elif name in TTL_PARAMS and value.isdigit():
+            found.append(now + int(value))
+        elif name in TOKEN_PARAMS:
+            for pair in re.split(r"[~&,]", value):
+                key, _, value = pair.partition("=")
+                if key.lower() in EXPIRES_PARAMS:
+                    found.append(_timestamp(value))
+    if not any(found):
+        for segment in parts.path.split("/"):
+            stamp = _timestamp(segment)
+            if stamp is not None and now < stamp <= now + PATH_HORIZON:
+                found.append(stamp)
+    found = [stamp for stamp in found if stamp is not None]
+    return min(found) if found else None
+
+
+def earliest(urls: Iterable[str], now: Optional[float] = None) -> Optional[float]:
+    """When the first of `urls` stops working."""
+    stamps = [stamp for stamp in (expires_at(url, now) for url in urls) if stamp is not None]
+    return min(stamps) if stamps else None
+
+
+def streams_expire(response: dict) -> Optional[float]:
+    """When the first stream of a `{"streams": [...]}` response stops working.
+
+    A response without any link is a failed resolve, it is expired already.
+    """
+    urls = []
+    for stream in response.get("streams", []):
+        url = stream.url
+        urls.extend([url] if isinstance(url, str) else url or [])
+    if not urls:
+        return time.time()
+    return earliest(urls)
@@ -0,0 +1,184 @@
+import asyncio
+import logging
+import random
+import time
+from dataclasses import dataclass
+from typing import Any, Iterable, Optional
+
+from .cache_backends import TTLCache
+from .schemas import Stream
+from .settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Health:
+    ok: bool
+    # Seconds until the first byte of the body, None when the probe failed
+    ttfb: Optional[float]
+    checked: float
+    # Probes failed in a row
+    failures: int = 0
+
+
+def _urls(stream: Stream) -> list[str]:
+    if isinstance(stream.url, list):
+        return stream.url
+    return [stream.url] if stream.url else []
+
+
+class Prober:
+    """Checks stream URLs in the background and ranks streams by the results.
+
+    TV channels are watched for good, resolved provider URLs for `watch_ttl`
+    seconds after they were last handed out. Every `interval` seconds each
+    watched URL gets a GET with a `timeout`, at most `concurrency` at once;
+    the time to the first byte of the body is the latency of a stream.
+    """
+
+    def __init__(
+        self,
+        interval: float,
+        timeout: float,
+        concurrency: int,
+        watch_ttl: float = 60 * 60,
+        max_watched: int = 1024,
+    ):
+        self.interval = interval
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self.watch_ttl = watch_ttl
+        self.health: dict[str, Health] = {}
+        self._static: dict[str, Optional[dict]] = {}
+        self._dynamic: TTLCache[Optional[dict]] = TTLCache(max_watched, 16 * 1024 * 1024)
+        self._session: Any = None
+        self._task: Optional[asyncio.Task] = None
+
+    def watch(self, url: str, headers: Optional[dict] = None, permanent: bool = False):
+        if permanent:
+            self._static[url] = headers
+        else:
+            self._dynamic.set(url, headers, self.watch_ttl)
+
+    def watch_streams(self, streams: Iterable[Stream], headers: Optional[dict] = None, permanent: bool = False):
+        for stream in streams:
+            for url in _urls(stream):
+                self.watch(url, headers, permanent=permanent)
+
+    def watched(self) -> dict[str, Optional[dict]]:
+        urls = {url: self._dynamic.get(url) for url in self._dynamic.keys()}
+        urls.update(self._static)
+        return urls
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            # Only needed once something is watched, and every provider that
+            # watches streams has loaded aiohttp already
+            import aiohttp
+
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=None, sock_connect=self.timeout, sock_read=self.timeout),
+                connector=aiohttp.TCPConnector(limit=self.concurrency, force_close=True),
+            )
+        return self._session
+
+    async def _first_chunk(self, url: str, headers: Optional[dict]) -> bool:
+        async with self._get_session().get(url, headers=headers, allow_redirects=True) as response:
+            # Live streams never end, the first chunk is enough
+            return response.status < 400 and bool(await response.content.readany())
+
+    async def probe(self, url: str, headers: Optional[dict] = None) -> Health:
+        started = time.perf_counter()
+        ok, ttfb = False, None
+        try:
+            ok = await asyncio.wait_for(self._first_chunk(url, headers), self.timeout)
+            ttfb = time.perf_counter() - started if ok else None
+        except Exception as e:
+            logger.debug("Probe of %s failed: %r", url, e)
+
+        previous = self.health.get(url)
+        failures = 0 if ok else (previous.failures + 1 if previous else 1)
+        health = self.health[url] = Health(ok=ok, ttfb=ttfb, checked=time.time(), failures=failures)
+        return health
+
+    async def run_once(self):
+        watched = self.watched()
+        # Forget what is no longer handed out
+        for url in self.health.keys() - watched.keys():
+            del self.health[url]
+        if not watched:
+            return
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def probe(url: str, headers: Optional[dict]):
+            async with semaphore:
+                return await self.probe(url, headers)
+
+        results = await asyncio.gather(*(probe(url, headers) for url, headers in watched.items()))
+        logger.info(f"Probed {len(results)} streams, {sum(not health.ok for health in results)} down")
+
+    def _key(self, stream: Stream) -> tuple[int, float]:
+        healths = [self.health[url] for url in _urls(stream) if url in self.health]
+        if not healths:
+            return 1, 0.0
+        best = min((health.ttfb for health in healths if health.ok), default=None)
+        if best is None:
+            return 2, 0.0
+        return 0, best
+
+    def rank(self, streams: list[Stream], drop_dead: bool = False) -> list[Stream]:
+        """Working streams by latency, then unprobed ones, then failing ones.
+
+        With `drop_dead` failing streams are left out, unless nothing else is left.
+        """
+        ranked = sorted(streams, key=self._key)
+        if drop_dead:
+            alive = [stream for stream in ranked if self._key(stream)[0] < 2]
+            if alive:
+                return alive
+        return ranked
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception:
+                logger.warning("Stream health probing failed", exc_info=True)
+            # A bit of jitter so instances don't probe the same servers in lockstep
+            await asyncio.sleep(self.interval * random.uniform(0.9, 1.1))
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+prober = Prober(
+    interval=settings.health_interval,
+    timeout=settings.health_timeout,
+    concurrency=settings.health_concurrency,
+    watch_ttl=settings.health_watch_ttl,
+    max_watched=settings.health_max_watched,
+)
+
+
+def rank(streams: list[Stream], headers: Optional[dict] = None) -> list[Stream]:
+    """Orders `streams` by measured health and keeps probing their URLs.
+
+    `headers` go with the probes, for CDNs that refuse requests without
+    the player's Referer or User-Agent.
+    """
+    prober.watch_streams(streams, headers)
+    return prober.rank(streams, settings.health_drop_dead)
@@ -0,0 +1,267 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import re
+import secrets
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from typing import Optional
+from urllib.parse import urljoin, urlsplit
+
+import aiohttp
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+
+from . import upstream
+from .cache_backends import TTLCache
+from .metrics import InstrumentedRoute
+from .schemas import Stream
+from .settings import settings
+
+logger = logging.getLogger(__name__)
+
+PLAYLIST = "playlist"
+SEGMENT = "segment"
+PLAYLIST_TYPE = "application/vnd.apple.mpegurl"
+# Upstream response headers a player needs to see
+FORWARDED_HEADERS = ("Content-Type", "Content-Length", "Content-Range", "Accept-Ranges", "Last-Modified", "ETag")
+URI_ATTRIBUTE = re.compile(r'URI="([^"]*)"')
+
+upstream.register("proxy", upstream.UpstreamSettings(_env_prefix="PROXY_", main_url=""))
+
+# Provider -> headers its CDN expects (Referer, User-Agent)
+_headers: dict[str, dict[str, str]] = {}
+
+
+def register(provider: str, headers: dict[str, str]):
+    """Lets `wrap` route the streams of `provider` through the proxy."""
+    _headers[provider] = headers
+
+
+def headers(provider: str) -> Optional[dict[str, str]]:
+    """Headers the CDN of `provider` expects, None when it registered none."""
+    return _headers.get(provider)
+
+
+# Without PROXY_SECRET links only work on the process that handed them out
+_secret = (settings.proxy_secret or secrets.token_hex(32)).encode()
+
+
+def _sign(payload: bytes) -> str:
+    return base64.urlsafe_b64encode(hmac.digest(_secret, payload, hashlib.sha256)[:16]).decode().rstrip("=")
+
+
+def encode_token(provider: str, stream: str, kind: str, url: str) -> str:
+    payload = json.dumps([provider, stream, kind, url], separators=(",", ":")).encode()
+    return f"{base64.urlsafe_b64encode(payload).decode().rstrip('=')}.{_sign(payload)}"
+
+
+def decode_token(token: str) -> tuple[str, str, str, str]:
+    """Returns (provider, stream, kind, url), ValueError when it wasn't signed here."""
+    data, _, signature = token.partition(".")
+    payload = base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+    if not hmac.compare_digest(_sign(payload), signature):
+        raise ValueError("Bad proxy token signature")
+    provider, stream, kind, url = json.loads(payload)
+    return provider, stream, kind, url
+
+
+def proxy_url(base_url: str, provider: str, stream: str, kind: str, url: str) -> str:
+    name = urlsplit(url).path.rsplit("/", 1)[-1] or "index.m3u8"
+    return f"{base_url.rstrip('/')}/proxy/{encode_token(provider, stream, kind, url)}/{name}"
+
+
+def wrap(provider: str, streams: list[Stream], base_url: str) -> list[Stream]:
+    """Points the HLS streams of a registered provider at the proxy."""
+    if not settings.proxy_enabled or provider not in _headers:
+        return streams
+    base_url = settings.proxy_base_url or base_url
+    return [
+        stream.model_copy(update={"url": proxy_url(base_url, provider, _stream_key(stream.url), PLAYLIST, stream.url)})
+        if isinstance(stream.url, str) and ".m3u8" in stream.url
+        else stream
+        for stream in streams
+    ]
+
+
+def _stream_key(url: str) -> str:
+    # Everything fetched for one stream (variants, segments, keys) shares a key
+    return hashlib.sha1(url.encode()).hexdigest()[:16]
+
+
+def rewrite(text: str, playlist_url: str, base_url: str, provider: str, stream: str) -> str:
+    """Points every URI of a playlist at the proxy, resolved against `playlist_url`."""
+    master = "#EXT-X-STREAM-INF" in text
+
+    def proxied(uri: str, kind: str) -> str:
+        return proxy_url(base_url, provider, stream, kind, urljoin(playlist_url, uri))
+
+    lines = []
+    for line in text.splitlines():
+        stripped = line.strip()
+        if not stripped:
+            lines.append(line)
+        elif stripped.startswith("#"):
+            # Alternative renditions and I-frame playlists are playlists, keys and init sections plain files
+            kind = PLAYLIST if stripped.startswith(("#EXT-X-MEDIA", "#EXT-X-I-FRAME-STREAM-INF")) else SEGMENT
+            lines.append(URI_ATTRIBUTE.sub(lambda match: f'URI="{proxied(match.group(1), kind)}"', line))
+        else:
+            lines.append(proxied(stripped, PLAYLIST if master else SEGMENT))
+    return "\n".join(lines) + "\n"
+
+
+class StreamBusy(Exception):
+    """No slot of a stream freed up within the queue timeout."""
+
+
+class _StreamSlots:
+    def __init__(self, limit: int):
+        self.semaphore = asyncio.Semaphore(limit)
+        # Requests holding a slot, and those holding or waiting for one
+        self.in_flight = 0
+        self.users = 0
+
+
+class StreamLimits:
+    """At most `limit` upstream requests in flight per stream, the rest wait up to `timeout`."""
+
+    def __init__(self, limit: int, timeout: float):
+        self.limit = limit
+        self.timeout = timeout
+        self._streams: dict[str, _StreamSlots] = {}
+
+    def in_flight(self, stream: str) -> int:
+        slots = self._streams.get(stream)
+        return slots.in_flight if slots else 0
+
+    async def acquire(self, stream: str):
+        slots = self._streams.setdefault(stream, _StreamSlots(self.limit))
+        slots.users += 1
+        try:
+            await asyncio.wait_for(slots.semaphore.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            self._forget(stream, slots)
+            raise StreamBusy(f"{self.limit} requests of stream {stream} in flight") from None
+        except BaseException:
+            self._forget(stream, slots)
+            raise
+        slots.in_flight += 1
+
+    def release(self, stream: str):
+        slots = self._streams[stream]
+        slots.in_flight -= 1
+        slots.semaphore.release()
+        self._forget(stream, slots)
+
+    def _forget(self, stream: str, slots: _StreamSlots):
+        slots.users -= 1
+        if not slots.users:
+            del self._streams[stream]
+
+    @asynccontextmanager
+    async def hold(self, stream: str) -> AsyncIterator[None]:
+        await self.acquire(stream)
+        try:
+            yield
+        finally:
+            self.release(stream)
+
+
+limits = StreamLimits(settings.proxy_stream_concurrency, settings.proxy_queue_timeout)
+# Upstream playlist bodies; live ones change every few seconds, VOD ones never
+playlists: TTLCache[str] = TTLCache(1024, 32 * 1024 * 1024)
+
+router = APIRouter(prefix="/proxy", route_class=InstrumentedRoute)
+
+
+async def _playlist(provider: str, stream: str, url: str) -> str:
+    text = playlists.get(url)
+    if text is None:
+        async with limits.hold(stream):
+            text = await upstream.fetch_text(upstream.get_session("proxy"), url, headers=_headers[provider])
+        vod = "#EXT-X-ENDLIST" in text
+        playlists.set(url, text, settings.proxy_vod_playlist_ttl if vod else settings.proxy_playlist_ttl)
+    return text
+
+
+async def _segment(provider: str, stream: str, url: str, request: Request) -> Response:
+    headers = dict(_headers[provider])
+    if "range" in request.headers:
+        headers["Range"] = request.headers["range"]
+
+    await limits.acquire(stream)
+    try:
+        response = await upstream.get_session("proxy").get(
+            url,
+            headers=headers,
+            # Big segments over slow links take a while, only a stalled read is an error
+            timeout=aiohttp.ClientTimeout(total=None, sock_connect=10, sock_read=30),
+        )
+    except BaseException:
+        limits.release(stream)
+        raise
+    return _SegmentResponse(response, stream)
+
+
+class _SegmentResponse(StreamingResponse):
+    """Streams an upstream segment, giving its stream slot back however the response ends.
+
+    The body generator alone can't: it never runs when the client is gone
+    before the first chunk.
+    """
+
+    def __init__(self, response: aiohttp.ClientResponse, stream: str):
+        self.upstream = response
+        self.stream = stream
+        self.closed = False
+        super().__init__(
+            self._body(),
+            status_code=response.status,
+            headers={name: response.headers[name] for name in FORWARDED_HEADERS if name in response.headers},
+        )
+
+    async def _body(self) -> AsyncIterator[bytes]:
+        async for chunk in self.upstream.content.iter_chunked(settings.proxy_chunk_size):
+            yield chunk
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.upstream.release()
+            limits.release(self.stream)
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.close()
+
+
+@router.get("/{token}/{name}", include_in_schema=False)
+async def proxy(token: str, name: str, request: Request) -> Response:
+    try:
+        provider, stream, kind, url = decode_token(token)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Unknown stream")
+    if provider not in _headers:
+        raise HTTPException(status_code=404, detail="Unknown stream")
+
+    try:
+        if kind == PLAYLIST:
+            text = await _playlist(provider, stream, url)
+            base_url = settings.proxy_base_url or str(request.base_url)
+            return Response(rewrite(text, url, base_url, provider, stream), media_type=PLAYLIST_TYPE)
+        return await _segment(provider, stream, url, request)
+    except StreamBusy as e:
+        logger.warning(f"{e}, rejecting {name}")
+        raise HTTPException(status_code=503, detail="Too many requests for this stream", headers={"Retry-After": "1"})
+    except asyncio.TimeoutError:
+        # aiohttp's own timeouts, the CDN didn't answer in time
+        raise HTTPException(status_code=504, detail="Upstream timeout")
+    except aiohttp.ClientResponseError as e:
+        raise HTTPException(status_code=e.status if e.status < 500 else 502, detail="Upstream error")
+    except aiohttp.ClientError:
+        raise HTTPException(status_code=502, detail="Upstream error")
@@ -0,0 +1,141 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+from typing import Any, Optional, TextIO
+
+from .settings import Settings
+
+# Attributes every LogRecord has; anything else came in through `extra=`
+_STANDARD = set(logging.makeLogRecord({}).__dict__) | {"message", "asctime", "sampled"}
+
+
+def truncate(value: Any, limit: int) -> Any:
+    if isinstance(value, str) and len(value) > limit:
+        return f"{value[:limit]}… (+{len(value) - limit} chars)"
+    return value
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps only `rate` of the records logged with `extra={"sampled": True}`.
+
+    For debug events that fire on every request (player scripts, playlists)
+    and would otherwise drown everything else.
+    """
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return not getattr(record, "sampled", False) or random.random() < self.rate
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line; `extra=` fields are kept, long strings truncated."""
+
+    def __init__(self, payload_limit: int):
+        super().__init__()
+        self.payload_limit = payload_limit
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": truncate(record.getMessage(), self.payload_limit),
+        }
+        for name, value in record.__dict__.items():
+            if name in _STANDARD:
+                continue
+            if not isinstance(value, (int, float, bool, type(None))):
+                value = truncate(str(value), self.payload_limit)
+            entry[name] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self, payload_limit: int):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+        self.payload_limit = payload_limit
+
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        fields = " ".join(
+            f"{name}={truncate(str(value), self.payload_limit)!r}"
+            for name, value in record.__dict__.items()
+            if name not in _STANDARD
+        )
+        record.message = truncate(record.message, self.payload_limit)
+        line = super().formatMessage(record)
+        return f"{line} {fields}" if fields else line
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Unlike the stock handler this keeps `extra=` values as they are and
+        # leaves all formatting (and truncation) to the listener thread
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def _level(name: str) -> int:
+    level = logging.getLevelName(name.upper())
+    if not isinstance(level, int):
+        raise ValueError(f"Unknown log level: {name}")
+    return level
+
+
+def setup(settings: Settings, stream: Optional[TextIO] = None):
+    """Routes every log record through a queue to a background writer thread.
+
+    The event loop only enqueues records; formatting and the blocking
+    stderr write happen in the listener.
+    """
+    global _listener
+    stop()
+
+    formatter = (JSONFormatter if settings.log_format == "json" else TextFormatter)(settings.log_payload_limit)
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(formatter)
+
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(records, output, respect_handler_level=True)
+    _listener.start()
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    handler = _QueueHandler(records)
+    # Dropped before they are queued, so sampled events cost next to nothing
+    handler.addFilter(SamplingFilter(settings.log_sample_rate))
+    root.addHandler(handler)
+    root.setLevel(_level(settings.log_level))
+
+    # Provider names are shorthands for their package loggers
+    for name, level in settings.log_levels.items():
+        logger_name = name if "." in name else f"app.parsers.{name}"
+        logging.getLogger(logger_name).setLevel(_level(level))
+
+
+def stop():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop)
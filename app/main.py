@@ -1,8 +1,10 @@
 from collections.abc import AsyncIterator
 from contextlib import asynccontextmanager
+from functools import partial
 
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 
 from fastapi_cache import FastAPICache
 from fastapi_cache.backends.redis import RedisBackend
@@ -11,15 +13,46 @@ from fastapi_cache.decorator import cache
 from redis import asyncio as aioredis
 import logging
 
+from . import health, logs, metrics, providers, search, store, warmup, workers
+from .cache import StatsBackend, key_builder
+from .compression import CompressionMiddleware
+from .cache_backends import LayeredBackend, MemoryBackend, TTLCache
+from .settings import settings
 
-logging.basicConfig(level=logging.DEBUG)
+
+logs.setup(settings)
+logger = logging.getLogger(__name__)
+registry = providers.create_registry(settings)
 
 
 @asynccontextmanager
 async def lifespan(_: FastAPI) -> AsyncIterator[None]:
-    redis = aioredis.from_url("redis://localhost")
-    FastAPICache.init(RedisBackend(redis), prefix="stremio-cache")
+    redis = aioredis.from_url(settings.redis_url, socket_connect_timeout=1)
+    memory = MemoryBackend(
+        TTLCache(
+            settings.memory_cache_max_entries,
+            settings.memory_cache_max_bytes,
+            settings.memory_cache_eviction,
+        ),
+        settings.memory_cache_ttl,
+    )
+    backend = LayeredBackend(memory, RedisBackend(redis), settings.redis_retry_interval)
+    FastAPICache.init(StatsBackend(backend), prefix="stremio-cache", key_builder=key_builder)
+    if settings.providers_eager:
+        await registry.load_all()
+    scheduler = warmup.create_scheduler(partial(registry.load_all, settings.warmup_providers))
+    if settings.warmup_enabled:
+        scheduler.start()
+    if settings.health_enabled:
+        health.prober.start()
     yield
+    await health.prober.stop()
+    await scheduler.stop()
+    await providers.close_sessions()
+    workers.pool.shutdown()
+    search.index.close()
+    store.metadata.close()
+    await redis.aclose()
 
 app = FastAPI(lifespan=lifespan)
 app.add_middleware(
@@ -29,23 +62,22 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(CompressionMiddleware, minimum_size=settings.compression_minimum_size)
 
 
-def register_tv():
-    from .parsers.tv.api import router
-    app.include_router(router)
-
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    return metrics.metrics_response()
 
-def register_eneyida():
-    from .parsers.eneyida.api import router
-    app.include_router(router)
 
+@app.exception_handler(workers.ParsePoolFull)
+async def parse_pool_full(_: Request, exc: workers.ParsePoolFull) -> JSONResponse:
+    logger.warning(str(exc))
+    return JSONResponse({"detail": "Server is busy"}, status_code=503, headers={"Retry-After": "1"})
 
-def register_uakino():
-    from .parsers.uakino.api import router
-    app.include_router(router)
 
+if settings.proxy_enabled:
+    from . import hls
 
-register_tv()
-register_eneyida()
-register_uakino()
+    app.include_router(hls.router)
+registry.install(app)
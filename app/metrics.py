@@ -0,0 +1,153 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from functools import wraps
+from inspect import iscoroutinefunction
+from typing import Any, Callable, Iterator
+
+from fastapi import Request, Response
+from fastapi.routing import APIRoute
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+# Request stages, from the client's point of view:
+#   request = endpoint + serialize
+#   endpoint = cache_* + upstream + decode + queue_wait + parse + extract (+ awaiting shared work)
+# `serialize` is FastAPI validating the return value against the response
+# model and dumping it to JSON, which pydantic does in a single pass.
+STAGES = Histogram(
+    "stremio_stage_seconds",
+    "Time spent in each stage of handling a request",
+    ["provider", "route", "stage"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+UPSTREAM = Histogram(
+    "stremio_upstream_request_seconds",
+    "Upstream requests by host and response status",
+    ["provider", "route", "host", "status"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20),
+)
+CACHE = Histogram(
+    "stremio_cache_seconds",
+    "Response cache operations by tier and result",
+    ["provider", "route", "tier", "operation", "result"],
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1),
+)
+# By the cached function, which isn't always the route serving the request;
+# result is "hit", "miss" or "error" (the backend failed, served as a miss)
+CACHE_LOOKUPS = Counter(
+    "stremio_cache_lookups",
+    "Response cache lookups by cached function and result",
+    ["provider", "function", "result"],
+)
+# Calls of each SingleFlight group: "started" ones ran, "collapsed" ones
+# joined a call already in flight for the same key
+SINGLEFLIGHT = Counter(
+    "stremio_singleflight_calls",
+    "Calls through single-flight groups by group and result",
+    ["group", "result"],
+)
+SINGLEFLIGHT_INFLIGHT = Gauge(
+    "stremio_singleflight_inflight",
+    "Calls in flight in single-flight groups",
+    ["group"],
+)
+
+
+@dataclass
+class Labels:
+    provider: str = "none"
+    route: str = "none"
+    # Seconds spent inside the route function, shared with its threadpool copy
+    endpoint: float = 0.0
+
+
+# The route being served by the current task; background work started from a
+# request (cache revalidation, coalesced fetches) inherits it
+current: ContextVar[Labels] = ContextVar("metrics_labels", default=Labels())
+
+
+def label(provider: str, route: str):
+    current.set(Labels(provider, route))
+
+
+def observe(stage: str, seconds: float):
+    labels = current.get()
+    STAGES.labels(labels.provider, labels.route, stage).observe(seconds)
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - started)
+
+
+def observe_upstream(host: str, status: str, seconds: float):
+    labels = current.get()
+    UPSTREAM.labels(labels.provider, labels.route, host, status).observe(seconds)
+
+
+def observe_cache(tier: str, operation: str, result: str, seconds: float):
+    labels = current.get()
+    CACHE.labels(labels.provider, labels.route, tier, operation, result).observe(seconds)
+
+
+def count_cache_lookup(provider: str, function: str, result: str):
+    CACHE_LOOKUPS.labels(provider, function, result).inc()
+
+
+def _timed_endpoint(endpoint: Callable) -> Callable:
+    if iscoroutinefunction(endpoint):
+        @wraps(endpoint)
+        async def inner(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                current.get().endpoint += time.perf_counter() - started
+    else:
+        @wraps(endpoint)
+        def inner(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return endpoint(*args, **kwargs)
+            finally:
+                current.get().endpoint += time.perf_counter() - started
+
+    return inner
+
+
+class InstrumentedRoute(APIRoute):
+    """Labels everything a request does with its provider and route.
+
+    Use as `APIRouter(route_class=InstrumentedRoute)`. The provider is the
+    first path segment, the route the endpoint function name.
+    """
+
+    def __init__(self, path: str, endpoint: Callable[..., Any], **kwargs: Any):
+        super().__init__(path, _timed_endpoint(endpoint), **kwargs)
+        self.provider = path.strip("/").split("/")[0]
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def instrumented_handler(request: Request) -> Response:
+            labels = Labels(self.provider, self.name)
+            current.set(labels)
+            started = time.perf_counter()
+            try:
+                return await handler(request)
+            finally:
+                total = time.perf_counter() - started
+                STAGES.labels(labels.provider, labels.route, "request").observe(total)
+                STAGES.labels(labels.provider, labels.route, "endpoint").observe(labels.endpoint)
+                STAGES.labels(labels.provider, labels.route, "serialize").observe(max(0.0, total - labels.endpoint))
+
+        return instrumented_handler
+
+
+def metrics_response() -> Response:
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
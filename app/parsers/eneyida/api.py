@@ -1,24 +1,41 @@
 from fastapi import Depends, APIRouter
 from fastapi_cache.decorator import cache
 from app.schemas import Manifest, Catalogs, Preview, Series, Stream
+from app import catalogs, health, search, warmup
+from app.cache import cache_swr, cache_until, namespace
+from app.expiry import streams_expire
+from app.metrics import InstrumentedRoute
+from app.upstream import fetch_text
 
 from .settings import settings
 from .services import (
+    STREAM_HEADERS,
     get_session,
+    get_meta,
     get_previews_metadata,
-    get_series_metadata,
-    get_videos,
     get_streams,
 )
 
+from functools import partial
+from typing import Optional
 import aiohttp
 
-router = APIRouter(prefix="/eneyida")
+router = APIRouter(prefix="/eneyida", route_class=InstrumentedRoute)
+CACHE_NAMESPACE = namespace("eneyida", settings.cache_version)
+
+# Name, Stremio type and site section of every catalog
+CATALOGS = [
+    ["Фільми", "movie", "films"],
+    ["Серіали", "series", "series"],
+    ["Мультфильми", "movie", "cartoon"],
+    ["Мультсериали", "series", "cartoon-series"],
+    ["Аніме", "series", "anime"],
+]
 
 
 @router.get("/manifest.json", tags=[settings.name])
-@cache()
-def addon_manifest() -> Manifest:
+@cache(expire=60 * 60, namespace=CACHE_NAMESPACE)
+async def addon_manifest() -> Manifest:
     manifest = Manifest(
         id="ua.cakestwix.stremio.eneyida",
         version="1.1.0",
@@ -31,15 +48,10 @@ def addon_manifest() -> Manifest:
                 type=item[1],
                 id=f"eneyida_{item[2]}",
                 name=f"{item[0]}/Eneyida",
-                extra=[{"genres": "anime"}],
+                # Genres and years seen so far, refreshed with the manifest
+                extra=await catalogs.manifest_extra("eneyida", f"eneyida_{item[2]}"),
             )
-            for item in [
-                ["Фільми", "movie", "films"],
-                ["Серіали", "series", "series"],
-                ["Мультфильми", "movie", "cartoon"],
-                ["Мультсериали", "series", "cartoon-series"],
-                ["Аніме", "series", "anime"],
-            ]
+            for item in CATALOGS
         ],
         resources=[
             "catalog",
@@ -64,44 +76,43 @@ def addon_manifest() -> Manifest:
 
 # Catalog
 @router.get("/catalog/{type_}/eneyida_{value}.json", tags=[settings.name])
-@cache(expire=24 * 60)
+@cache_swr(expire=24 * 60, stale=settings.stale_ttl, namespace=CACHE_NAMESPACE)
 async def addon_catalog(
     type_: str,
     value: str,
     session: aiohttp.ClientSession = Depends(get_session),
 ) -> dict[str, list[Preview]]:
-    async with session.get(f"{settings.main_url}/{value}") as response: 
-        return await get_previews_metadata(await response.text(), type_)
+    previews = await get_previews_metadata(await fetch_text(session, f"{settings.main_url}/{value}"), type_)
+    await search.index.add("eneyida", previews["metas"], catalog=f"eneyida_{value}")
+    return previews
 
 
 # Pagination
 @router.get(
     "/catalog/{type_}/eneyida_{value}/skip={skip}.json", tags=[settings.name]
 )
-@cache(expire=24 * 60)
+@cache_swr(expire=24 * 60, stale=settings.stale_ttl, namespace=CACHE_NAMESPACE)
 async def addon_catalog_skip(
     type_: str,
     value: str,
     skip: int,
     session: aiohttp.ClientSession = Depends(get_session),
 ) -> dict[str, list[Preview]]:
-    async with session.get(f"{settings.main_url}/{value}/page/{int(skip / 24) + 1}/") as response: 
-        return await get_previews_metadata(await response.text(), type_)
+    previews = await get_previews_metadata(
+        await fetch_text(session, f"{settings.main_url}/{value}/page/{int(skip / 24) + 1}/"), type_
+    )
+    await search.index.add("eneyida", previews["metas"], catalog=f"eneyida_{value}")
+    return previews
 
 
 # Custom Metadata
 @router.get("/meta/{type_}/{id}.json", tags=[settings.name])
-@cache(expire=24 * 60)
+@cache_swr(expire=24 * 60, stale=settings.stale_ttl, namespace=CACHE_NAMESPACE)
 async def addon_meta(
     id: str, type_: str, session: aiohttp.ClientSession = Depends(get_session)
 ) -> dict[str, Series]:
-    async with session.get(f"{settings.main_url}/{id}.html") as response:
-        series_metadata = await get_series_metadata(
-            id,
-            await response.text(),
-            await get_videos(id, await response.text(), session),
-            type_,
-        )
+    series_metadata = await get_meta(id, type_, session)
+    await search.index.add("eneyida", [series_metadata["meta"]])
 
     return series_metadata
 
@@ -109,25 +120,79 @@ async def addon_meta(
 # Series
 @router.get("/stream/{type_}/{id}/{season}/{episode}.json", tags=[settings.name])
 @router.get("/stream/{type_}/{id}.json", tags=[settings.name])
-@cache(expire=24 * 60)
 async def addon_stream(
     id: str, season: str = None, episode: str = None, session: aiohttp.ClientSession = Depends(get_session)
 ) -> dict[str, list[Stream]]:
-    async with session.get(f"{settings.main_url}/{id}.html") as response:
-        streams = await get_streams(id, season, episode, session, await response.text())
-    return streams
+    streams = await resolve_streams(id=id, season=season, episode=episode, session=session)
+    # Ranked per request, probes keep changing while the links stay cached
+    ranked = health.rank([Stream.model_validate(stream) for stream in streams["streams"]], STREAM_HEADERS)
+    return {**streams, "streams": ranked}
+
+
+# Player links carry their own expiry, kept no longer than that
+@cache_until(expire=24 * 60, expires=streams_expire, namespace=CACHE_NAMESPACE)
+async def resolve_streams(
+    id: str, season: Optional[str], episode: Optional[str], session: aiohttp.ClientSession
+) -> dict[str, list[Stream]]:
+    return await get_streams(id, season, episode, session)
 
 
 # Search
 @router.get(
     "/catalog/series/eneyida_search/search={query}.json", tags=[settings.name]
 )
-@cache(expire=24 * 60)
 async def addon_search(
     query: str,
     session: aiohttp.ClientSession = Depends(get_session),
 ) -> dict[str, list[Preview]]:
-    async with session.post(f"{settings.main_url}", data={"do": "search", "subaction": "search", "story": query}) as response:
-        response_data = await response.text()
+    # Answered from the titles seen in catalogs and metas, the site only
+    # gets asked about what hasn't been crawled yet
+    local = await search.index.search("eneyida", query)
+    if local:
+        return {"metas": local}
+
+    response_data = await fetch_text(
+        session,
+        f"{settings.main_url}",
+        method="POST",
+        data={"do": "search", "subaction": "search", "story": query},
+    )
+    previews = await get_previews_metadata(response_data, "series")
+    # Search results carry no type, don't let them overwrite crawled ones
+    await search.index.add("eneyida", previews["metas"], replace=False)
+    return previews
+
+
+# Genre and year filters, from the index only
+@router.get("/catalog/{type_}/eneyida_{value}/{extra}.json", tags=[settings.name])
+async def addon_catalog_filtered(type_: str, value: str, extra: str) -> dict[str, list[Preview]]:
+    return await catalogs.browse("eneyida", f"eneyida_{value}", type_, extra, 24)
+
+
+# Warm-up
+async def warm_catalog(type_: str, value: str, page: int) -> dict[str, list[Preview]]:
+    session = await get_session()
+    if page == 1:
+        return await addon_catalog.refresh(type_=type_, value=value, session=session)
+    return await addon_catalog_skip.refresh(type_=type_, value=value, skip=24 * (page - 1), session=session)
+
+
+async def warm_meta(type_: str, id: str) -> dict[str, Series]:
+    return await addon_meta.refresh(id=id, type_=type_, session=await get_session())
+
+
+def warmup_pages(pages: int) -> list[warmup.CatalogPage]:
+    return [
+        warmup.CatalogPage(
+            provider="eneyida",
+            catalog=f"eneyida_{value}",
+            page=page,
+            load=partial(warm_catalog, type_, value, page),
+            meta=warm_meta,
+        )
+        for _, type_, value in CATALOGS
+        for page in range(1, pages + 1)
+    ]
+
 
-    return await get_previews_metadata(response_data, "series")
+warmup.register("eneyida", warmup_pages)
@@ -1,5 +1,13 @@
-from bs4 import BeautifulSoup
+import logging
+import sys
+from dataclasses import dataclass
+from typing import Optional
+
+from app.parsing import make_soup
 from app.schemas import Preview, Series, Stream, Videos
+from app import store, upstream, workers
+from app.cache_backends import TTLCache
+from app.singleflight import SingleFlight
 from .settings import settings
 
 import aiohttp
@@ -8,14 +16,68 @@ from .utils import extract_numbers
 import re
 
 
-async def get_session():
-    async with aiohttp.ClientSession() as session:
-        yield session
+logger = logging.getLogger(__name__)
 
+upstream.register("eneyida", settings)
+# The player CDN only answers requests coming from the player page
+STREAM_HEADERS = {"Referer": settings.stream_referer}
 
-async def get_previews_metadata(response_data, type_) -> dict[str, list[Preview]]:
+
+async def get_session() -> aiohttp.ClientSession:
+    return upstream.get_session("eneyida")
+
+
+# Coalesces detail page and player playlist fetch + parse for the same title
+extractions = SingleFlight("eneyida")
+
+
+@dataclass(frozen=True)
+class DetailPage:
+    """Everything the meta and stream paths need from a `{id}.html` page."""
+
+    title: str
+    poster: str
+    thumbnail: Optional[str]
+    genres: list[str]
+    description: str
+    iframe_src: str
+    player_kind: str  # "movie" or "series"
+    year: Optional[str] = None
+
+    @classmethod
+    def parse(cls, response_text: str) -> "DetailPage":
+        soup = make_soup(response_text)
+        full_info = soup.find("ul", class_="full_info").find_all("li")
+        iframe_src = soup.select_one(".tabs_b.visible iframe")["src"]
+        header_bg = soup.select_one(".full_header__bg-img")
+        return cls(
+            title=soup.find("div", class_="full_header-title").find("h1").text,
+            poster=f'{settings.main_url}{soup.find("div", class_="full_content-poster").find("img")["src"]}',
+            thumbnail=header_bg.get("style").split("(")[1][:-2] if header_bg else None,
+            genres=[tag.text for tag in full_info[1].find_all("a")],
+            description=soup.find("article", class_="full_content-desc").text,
+            iframe_src=iframe_src,
+            player_kind="movie" if "/vid/" in iframe_src else "series",
+            year=next((li.find("a").text for li in full_info if "Рік" in li.text and li.find("a")), None),
+        )
+
+
+async def _get_detail_page(id: str, session: aiohttp.ClientSession) -> DetailPage:
+    page = await workers.parse(DetailPage.parse, await upstream.fetch_text(session, f"{settings.main_url}/{id}.html"))
+    await store.metadata.put("eneyida", "page", id, page)
+    return page
+
+
+async def get_detail_page(id: str, session: aiohttp.ClientSession) -> DetailPage:
+    stored = await store.metadata.get("eneyida", "page", id, DetailPage)
+    if stored is not None and stored.age < settings.page_refresh:
+        return stored.value
+    return await extractions.do(("page", id), _get_detail_page, id, session)
+
+
+def parse_previews(response_data, type_) -> dict[str, list[Preview]]:
     previews_metadata = {"metas": []}
-    soup = BeautifulSoup(response_data, "html.parser")
+    soup = make_soup(response_data)
     for item in soup.find_all("article", class_="short"):
         previews_metadata["metas"].append(
             Preview(
@@ -25,141 +87,193 @@ async def get_previews_metadata(response_data, type_) -> dict[str, list[Preview]
                 genres=[],
                 poster=f"https://eneyida.tv{item.find('img')['data-src']}",
                 description=item.find("div", class_="short_subtitle").text,
+                releaseInfo=year.text if (year := item.select_one(".short_subtitle span")) else None,
             )
         )
 
     return previews_metadata
 
 
+async def get_previews_metadata(response_data, type_) -> dict[str, list[Preview]]:
+    return await workers.parse(parse_previews, response_data, type_)
+
+
 async def get_series_metadata(
-    id: str, response_text: str, videos: list[Videos], type_title: str
+    id: str, page: DetailPage, videos: list[Videos], type_title: str
 ) -> dict[str, Series]:
-    soup = BeautifulSoup(response_text, "html.parser")
-    full_info = soup.find("ul", class_="full_info").find_all("li")
     return {
         "meta": Series(
             id=f"{id}",
             type=type_title,
-            name=soup.find("div", class_="full_header-title").find("h1").text,
-            poster=f'{settings.main_url}{soup.find("div", class_="full_content-poster").find("img")["src"]}',
-            genres=[tag.text for tag in full_info[1].find_all("a")],
-            description=soup.find("article", class_="full_content-desc").text,
+            name=page.title,
+            poster=page.poster,
+            genres=page.genres,
+            description=page.description,
+            releaseInfo=page.year,
             director=[],
             runtime="",
-            background=f'{settings.main_url}{soup.find("div", class_="full_content-poster").find("img")["src"]}',
+            background=page.poster,
             videos=videos,
         )
     }
 
 
+def parse_movie_file(player_html: str) -> str:
+    plr_soup = make_soup(player_html)
+    script_tag = plr_soup.body.find("script")
+    if not script_tag:
+        raise ValueError("Script tag with Playerjs initialization not found.")
+    logger.debug("Movie player script", extra={"script": script_tag.text, "sampled": True})
+    file_url_match = re.search(r'file:\s*"(.*?)"', script_tag.text)
+    if not file_url_match:
+        raise ValueError("File URL not found in the script.")
+
+    return file_url_match.group(1)
+
+
+def parse_playlist(player_html: str) -> list[dict]:
+    plr_soup = make_soup(player_html)
+    script_tag = plr_soup.body.find("script")
+    if not script_tag:
+        raise ValueError("Script tag with Playerjs initialization not found.")
+    # Regex to extract the `file` value
+    file_match = re.search(r'file:\s*\'(\[.*?\])\'', script_tag.string, re.DOTALL)
+    if not file_match:
+        raise ValueError("File content not found in the script.")
+
+    # Extracted file content as a JSON string
+    file_content = file_match.group(1)
+    logger.debug("Series playlist", extra={"playlist": file_content, "sampled": True})
+
+    try:
+        return json.loads(file_content)
+    except json.JSONDecodeError as e:
+        raise ValueError("Failed to parse JSON data from the file field.") from e
+
+
+@dataclass(frozen=True)
+class PlaylistIndex:
+    """Decoded player data of one title.
+
+    `episodes` keeps the playlist order as (season, episode, poster) titles,
+    `streams` maps (season, episode) titles to their (dub, url) pairs. Movies
+    have a single (None, None) entry.
+    """
+
+    episodes: list[tuple[str, str, Optional[str]]]
+    streams: dict[tuple[Optional[str], Optional[str]], list[tuple[str, str]]]
+
+    @classmethod
+    def parse(cls, page: DetailPage, player_html: str) -> "PlaylistIndex":
+        if page.player_kind == "movie":
+            return cls(episodes=[], streams={(None, None): [("Фільм", parse_movie_file(player_html))]})
+
+        episodes = []
+        streams = {}
+        seen_titles = set()
+        for dub in parse_playlist(player_html):
+            for season in dub["folder"]:
+                for episode in season["folder"]:
+                    if episode["title"] not in seen_titles:
+                        seen_titles.add(episode["title"])
+                        episodes.append((season["title"], episode["title"], episode["poster"]))
+                    streams.setdefault((season["title"], episode["title"]), []).append(
+                        (dub["title"], episode["file"])
+                    )
+        return cls(episodes=episodes, streams=streams)
+
+
+# Player playlists by title id, shared by meta and stream requests
+playlists: TTLCache[PlaylistIndex] = TTLCache(settings.playlist_cache_size, sys.maxsize)
+
+
+def extract_videos(id: str, page: DetailPage, index: Optional[PlaylistIndex]) -> list[Videos]:
+    if page.player_kind == "movie":
+        return [
+            Videos(
+                id=f'{id}',
+                title=page.title,
+                thumbnail=page.thumbnail,
+                released=None,
+                season=None,
+                episode=None,
+            )
+        ]
+
+    return [
+        Videos(
+            id=f'{id}/{season_title}/{episode_title}',
+            title=episode_title,
+            thumbnail=poster,
+            released=None,
+            season=extract_numbers(season_title)[0],
+            episode=extract_numbers(episode_title)[0],
+        )
+        for season_title, episode_title, poster in index.episodes
+    ]
+
+
+def extract_streams(
+    index: PlaylistIndex, season_param: Optional[str], episode_param: Optional[str]
+) -> dict[str, list[Stream]]:
+    return {
+        "streams": [
+            Stream(name=dub, url=url)
+            for dub, url in index.streams.get((season_param, episode_param), [])
+        ]
+    }
+
+
+async def _get_playlist_index(
+    id: str, session: aiohttp.ClientSession, page: Optional[DetailPage]
+) -> PlaylistIndex:
+    if page is None:
+        page = await get_detail_page(id, session)
+    index = await workers.parse(PlaylistIndex.parse, page, await upstream.fetch_text(session, page.iframe_src))
+    playlists.set(id, index, settings.playlist_ttl)
+    return index
+
+
+async def get_playlist_index(
+    id: str, session: aiohttp.ClientSession, page: Optional[DetailPage] = None
+) -> PlaylistIndex:
+    index = playlists.get(id)
+    if index is None:
+        index = await extractions.do(("playlist", id), _get_playlist_index, id, session, page)
+    return index
+
+
 async def get_videos(
-    id: str, response_text: str, session: aiohttp.ClientSession
+    id: str, page: DetailPage, session: aiohttp.ClientSession
 ) -> list[Videos]:
-    videos = []
-
-    soup = BeautifulSoup(response_text, "html.parser")
-    async with session.get(soup.select_one(".tabs_b.visible iframe")["src"]) as response:
-        if "/vid/" in soup.select_one(".tabs_b.visible iframe")["src"]:
-            plr_soup = BeautifulSoup(await response.text(), "html.parser")
-            videos.append(
-                Videos(
-                    id=f'{id}',
-                    title=soup.find("div", class_="full_header-title").find("h1").text,
-                    thumbnail=soup.select_one(".full_header__bg-img").get('style').split("(")[1][:-2],
-                    released=None,
-                    season=None,
-                    episode=None,
-                )
-            )
-        else:
-            plr_soup = BeautifulSoup(await response.text(), "html.parser")
-            script_tag = plr_soup.body.find("script")
-            print(script_tag.text)
-            # Regex to extract the `file` value
-            file_match = re.search(r'file:\s*\'(\[.*?\])\'', script_tag.string, re.DOTALL)
-            if not file_match:
-                raise ValueError("File content not found in the script.")
-
-            # Extracted file content as a JSON string
-            file_content = file_match.group(1)
-            print("FILE MATCH")
-            print(file_content)
-#             plr_json = json.loads(plr_soup.body.find("script", type="text/javascript").text.split("file: '")[1].split("',")[0])
-
-            try:
-                plr_json = json.loads(file_match.group(1))
-            except json.JSONDecodeError as e:
-                raise ValueError("Failed to parse JSON data from the file field.") from e
-
-            seen_titles = set()
-            for dub in plr_json:
-                for season in dub["folder"]:
-                    for episode in season["folder"]:
-                        if episode["title"] not in seen_titles:
-                            seen_titles.add(episode["title"])
-                            videos.append(
-                                Videos(
-                                    id=f'{id}/{season["title"]}/{episode["title"]}',
-                                    title=episode["title"],
-                                    thumbnail=episode["poster"],
-                                    released=None,
-                                    season=extract_numbers(season["title"])[0],
-                                    episode=extract_numbers(episode["title"])[0],
-                                )
-                            )
-    return videos
+    # Movies are described by the detail page alone
+    if page.player_kind == "movie":
+        return extract_videos(id, page, None)
+    return extract_videos(id, page, await get_playlist_index(id, session, page))
+
+
+async def get_meta(id: str, type_: str, session: aiohttp.ClientSession) -> dict[str, Series]:
+    """The stored meta while it is fresh, otherwise rebuilt and stored again.
+
+    The detail page comes from the store too, so refreshing a series only
+    fetches its player playlist and refreshing a movie fetches nothing.
+    """
+    stored = await store.metadata.get("eneyida", "meta", id, Series)
+    if stored is not None and stored.age < settings.meta_refresh:
+        return {"meta": stored.value}
+    try:
+        page = await get_detail_page(id, session)
+        meta = await get_series_metadata(id, page, await get_videos(id, page, session), type_)
+    except Exception:
+        if stored is None:
+            raise
+        logger.warning(f"Refreshing meta of {id} failed, serving the stored one", exc_info=True)
+        return {"meta": stored.value}
+    await store.metadata.put("eneyida", "meta", id, meta["meta"])
+    return meta
 
 
 async def get_streams(
-    id: str, season_param: str, episode_param: str, session: aiohttp.ClientSession, response_text
+    id: str, season_param: Optional[str], episode_param: Optional[str], session: aiohttp.ClientSession
 ) -> dict[str, list[Stream]]:
-    streams = {"streams": []}
-
-    soup = BeautifulSoup(response_text, "html.parser")
-    async with session.get(soup.select_one(".tabs_b.visible iframe")["src"]) as response:
-
-        plr_soup = BeautifulSoup(await response.text(), "html.parser")
-        if "/vid/" in soup.select_one(".tabs_b.visible iframe")["src"]:
-            script_tag = plr_soup.body.find("script")
-            print(script_tag)
-            if not script_tag:
-                raise ValueError("Script tag with Playerjs initialization not found.")
-            file_url_match = re.search(r'file:\s*"(.*?)"', script_tag.text)
-            if not file_url_match:
-                raise ValueError("File URL not found in the script.")
-
-            plr_url = file_url_match.group(1)
-            streams["streams"].append(
-                Stream(
-                    name="Фільм",
-                    url=plr_url,
-                )
-            )
-        else:
-            script_tag = plr_soup.body.find("script")
-            if not script_tag:
-                raise ValueError("Script tag with Playerjs initialization not found.")
-            file_match = re.search(r'file:\s*\'(\[.*?\])\'', script_tag.string, re.DOTALL)
-            if not file_match:
-                raise ValueError("File URL not found in the script.")
-
-#             plr_json = file_match.group(1)
-#             print(plr_json)
-
-            plr_json = json.loads(file_match.group(1))
-            for dub in plr_json:
-                print(dub)
-                for season in dub["folder"]:
-                    if season["title"] == season_param:
-                        for episode in season["folder"]:
-                            if episode["title"] == episode_param:
-                                streams["streams"].append(
-                                    Stream(
-                                        name=dub["title"],
-                                        url=episode["file"],
-                                    )
-                                )
-
-
-
-    return streams
+    return extract_streams(await get_playlist_index(id, session), season_param, episode_param)
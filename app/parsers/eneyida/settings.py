@@ -1,8 +1,26 @@
-from pydantic_settings import BaseSettings
+from pydantic_settings import SettingsConfigDict
 
+from app.upstream import UpstreamSettings
+
+
+class Settings(UpstreamSettings):
+    # ENEYIDA_POOL_LIMIT, ENEYIDA_WARMUP, ... so each provider is tuned on its own
+    model_config = SettingsConfigDict(env_prefix="ENEYIDA_")
 
-class Settings(BaseSettings):
     name: str = "Eneyida.tv"
     main_url: str = "https://eneyida.tv"
+    # Bump to drop every cached response of this provider
+    cache_version: int = 1
+    # How long an expired catalog/meta entry is still served while it refreshes
+    stale_ttl: int = 7 * 24 * 60 * 60
+    # Stored series metas older than this get their episode list re-fetched
+    meta_refresh: int = 6 * 60 * 60
+    # Stored detail page data (titles, posters, player links) is re-scraped after this
+    page_refresh: int = 30 * 24 * 60 * 60
+    # Referer the player CDN expects, sent with stream probes
+    stream_referer: str = "https://hdvbua.pro/"
+    # Decoded player playlists kept in memory, by title
+    playlist_cache_size: int = 1024
+    playlist_ttl: int = 60 * 60
 
 settings = Settings()
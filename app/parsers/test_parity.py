@@ -0,0 +1,135 @@
+"""Every extractor must give identical results on every installed HTML backend."""
+import asyncio
+from pathlib import Path
+
+import pytest
+
+from app.parsing import FALLBACK_BACKEND, available_backends
+from app.settings import settings
+from app.parsers.eneyida import services as eneyida
+from app.parsers.uakino import services as uakino
+
+ENEYIDA_FIXTURES = Path(__file__).parent / "eneyida" / "fixtures"
+UAKINO_FIXTURES = Path(__file__).parent / "uakino" / "fixtures"
+
+
+def fixture(directory: Path, name: str) -> str:
+    return (directory / name).read_text(encoding="utf-8")
+
+
+def eneyida_catalog():
+    return eneyida.parse_previews(fixture(ENEYIDA_FIXTURES, "catalog.html"), "movie")
+
+
+def eneyida_movie_meta():
+    page = eneyida.DetailPage.parse(fixture(ENEYIDA_FIXTURES, "detail_movie.html"))
+    videos = eneyida.extract_videos("13427-dyuna-chastyna-druga", page, None)
+    return asyncio.run(eneyida.get_series_metadata("13427-dyuna-chastyna-druga", page, videos, "movie"))
+
+
+def eneyida_series_meta():
+    page = eneyida.DetailPage.parse(fixture(ENEYIDA_FIXTURES, "detail_series.html"))
+    index = eneyida.PlaylistIndex.parse(page, fixture(ENEYIDA_FIXTURES, "player_series.html"))
+    videos = eneyida.extract_videos("7710-arkeyn", page, index)
+    return asyncio.run(eneyida.get_series_metadata("7710-arkeyn", page, videos, "series"))
+
+
+def eneyida_movie_streams():
+    page = eneyida.DetailPage.parse(fixture(ENEYIDA_FIXTURES, "detail_movie.html"))
+    index = eneyida.PlaylistIndex.parse(page, fixture(ENEYIDA_FIXTURES, "player_movie.html"))
+    return eneyida.extract_streams(index, None, None)
+
+
+def eneyida_series_streams():
+    page = eneyida.DetailPage.parse(fixture(ENEYIDA_FIXTURES, "detail_series.html"))
+    index = eneyida.PlaylistIndex.parse(page, fixture(ENEYIDA_FIXTURES, "player_series.html"))
+    return eneyida.extract_streams(index, "Сезон 1", "Серія 1")
+
+
+def uakino_catalog():
+    return uakino.parse_previews(fixture(UAKINO_FIXTURES, "catalog.html"), "movie")
+
+
+def uakino_movie_meta():
+    html = fixture(UAKINO_FIXTURES, "detail_movie.html")
+    videos = [uakino.extract_movie_video("filmy/genre_action/21542-furioza", html)]
+    return uakino.parse_series_metadata("filmy/genre_action/21542-furioza", html, videos, "movie")
+
+
+def uakino_series_meta():
+    html = fixture(UAKINO_FIXTURES, "detail_series.html")
+    videos = uakino.extract_episodes(
+        "seriesss/drama_series/1235", html, uakino.EpisodeMap.parse(fixture(UAKINO_FIXTURES, "playlist.json"))
+    )
+    return uakino.parse_series_metadata("seriesss/drama_series/1235", html, videos, "series")
+
+
+def uakino_movie_player():
+    return uakino.extract_movie_player(fixture(UAKINO_FIXTURES, "detail_movie.html"))
+
+
+def uakino_episode_player():
+    return (
+        uakino.extract_news_id(fixture(UAKINO_FIXTURES, "detail_series.html")),
+        uakino.extract_episode_player(uakino.EpisodeMap.parse(fixture(UAKINO_FIXTURES, "playlist.json")), 2),
+        uakino.extract_stream_url(fixture(UAKINO_FIXTURES, "player.html")),
+    )
+
+
+EXTRACTORS = [
+    eneyida_catalog,
+    eneyida_movie_meta,
+    eneyida_series_meta,
+    eneyida_movie_streams,
+    eneyida_series_streams,
+    uakino_catalog,
+    uakino_movie_meta,
+    uakino_series_meta,
+    uakino_movie_player,
+    uakino_episode_player,
+]
+
+
+def run_with_backend(monkeypatch, backend, extractor):
+    monkeypatch.setattr(settings, "html_parser", backend)
+    return extractor()
+
+
+@pytest.mark.parametrize("backend", available_backends())
+@pytest.mark.parametrize("extractor", EXTRACTORS, ids=lambda f: f.__name__)
+def test_backend_parity(monkeypatch, backend, extractor):
+    expected = run_with_backend(monkeypatch, FALLBACK_BACKEND, extractor)
+    assert run_with_backend(monkeypatch, backend, extractor) == expected
+
+
+def test_eneyida_fixtures(monkeypatch):
+    catalog = run_with_backend(monkeypatch, FALLBACK_BACKEND, eneyida_catalog)["metas"]
+    assert [item.id for item in catalog] == ["13427-dyuna-chastyna-druga", "12011-oppengeymer", "9320-tinder-shahray"]
+
+    meta = run_with_backend(monkeypatch, FALLBACK_BACKEND, eneyida_series_meta)["meta"]
+    assert meta.genres == ["Фентезі", "Бойовик"]
+    assert [(v.season, v.episode) for v in meta.videos] == [(1, 1), (1, 2), (2, 10), (1, 3)]
+
+    streams = run_with_backend(monkeypatch, FALLBACK_BACKEND, eneyida_series_streams)["streams"]
+    assert [stream.name for stream in streams] == ["Netflix", "Так Треба Продакшн"]
+
+
+def test_uakino_fixtures(monkeypatch):
+    catalog = run_with_backend(monkeypatch, FALLBACK_BACKEND, uakino_catalog)["metas"]
+    assert [item.id for item in catalog] == [
+        "filmy/genre_action/21542-furioza-sazhenca-shalenogo-maksa",
+        "filmy/genre_thriller/21420-gromadyanska-viyna",
+        "filmy/genre_comedy/21001-bez-opysu",
+    ]
+    assert catalog[0].genres == ["Бойовики", "Пригоди"]
+
+    meta = run_with_backend(monkeypatch, FALLBACK_BACKEND, uakino_series_meta)["meta"]
+    assert [v.id for v in meta.videos][:3] == [
+        "seriesss/drama_series/1235/2:1",
+        "seriesss/drama_series/1235/2:1",
+        "seriesss/drama_series/1235/2:2",
+    ]
+
+    news_id, (player_url, name), stream_url = run_with_backend(monkeypatch, FALLBACK_BACKEND, uakino_episode_player)
+    assert (news_id, player_url, name) == ("1235", "//ashdi.vip/vod/5002", "Українська - Серія 2")
+    assert stream_url.endswith("index.m3u8?token=abc&expires=1893456000")
@@ -1,12 +1,20 @@
 from fastapi import Depends, HTTPException, APIRouter
 from app.schemas import Manifest, Catalogs, Preview, Series, Stream
+from app import health
+from app.settings import settings as app_settings
+from app.metrics import InstrumentedRoute
 
 from .tv_list import meta_tv, catalog_tv
 from .stream_list import streams
 from .settings import settings
 import aiohttp
 
-router = APIRouter(prefix="/tv")
+router = APIRouter(prefix="/tv", route_class=InstrumentedRoute)
+
+# Channels are probed as long as the app runs
+for channel_streams in streams.values():
+    health.prober.watch_streams(channel_streams, permanent=True)
+
 
 @router.get(f"/{settings.name.lower()}/manifest.json", tags=[settings.name])
 def addon_manifest() -> Manifest:
@@ -52,4 +60,4 @@ async def addon_stream(id: str) -> dict[str, list[Stream]]:
     if id not in streams:
         raise HTTPException(status_code=404, detail="Item not found")
 
-    return {"streams": streams[id]}
+    return {"streams": health.prober.rank(streams[id], app_settings.health_drop_dead)}
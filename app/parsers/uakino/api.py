@@ -1,22 +1,69 @@
+import logging
 from typing import List
-from fastapi import Depends, APIRouter
+from fastapi import Depends, APIRouter, HTTPException, Request
 from fastapi_cache.decorator import cache
 from app.schemas import Manifest, Catalogs, Preview, Series, Stream
+from app import catalogs, health, hls, search, warmup
+from app.cache import Uncacheable, cache_swr, cache_until, namespace
+from app.expiry import streams_expire
+from app.metrics import InstrumentedRoute
+from app.upstream import fetch_text
+from app.workers import ParsePoolFull
 from .settings import settings
 from .services import (
-    get_series_metadata,
+    get_meta,
     get_session,
     get_previews_metadata,
     get_streams,
-    get_videos,
 )
+from functools import partial
 import aiohttp
 
-router = APIRouter(prefix="/uakino")  # Префікс для uakino
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/uakino", route_class=InstrumentedRoute)  # Префікс для uakino
+CACHE_NAMESPACE = namespace("uakino", settings.cache_version)
+
+CATALOGS = [
+    Catalogs(
+        type="movie",
+        id="uakino_movies_year",
+        name="Фільми (за роком)",
+        extra=[],  # Жанри й роки додає маніфест
+    ),
+    Catalogs(
+        type="series",
+        id="uakino_series_year",
+        name="Серіали (за роком)",
+        extra=[],
+    ),
+    Catalogs(
+        type="movie",  # Мультфільми зазвичай відносять до movie type в Stremio
+        id="uakino_cartoons_year",
+        name="Мультфільми (за роком)",
+        extra=[],
+    ),
+    Catalogs(
+        type="series",  # Аніме-серіали до series type
+        id="uakino_anime_year",
+        name="Аніме (за роком)",
+        extra=[],
+    ),
+]
+
+SEARCH_CATALOGS = [
+    Catalogs(
+        type=type_,
+        id="uakino_search",
+        name=f"Пошук/{settings.name}",
+        extra=[{"name": "search", "isRequired": True}],
+    )
+    for type_ in ("movie", "series")
+]
 
 
 @router.get("/manifest.json", tags=[settings.name])
-@cache()  # Кешування маніфесту
+@cache(expire=60 * 60, namespace=CACHE_NAMESPACE)  # Кешування маніфесту, щогодини з новими жанрами
 async def addon_manifest() -> Manifest:
     manifest = Manifest(
         id="ua.stremio.uakino",  # ID  адону
@@ -26,32 +73,9 @@ async def addon_manifest() -> Manifest:
         description="Фільми, серіали, мультфільми та аніме з сайту uakino.me українською.",
         types=["movie", "series"],  # Типи контенту, які підтримує адон
         catalogs=[
-            Catalogs(
-                type="movie",
-                id="uakino_movies_year",
-                name="Фільми (за роком)",
-                extra=[],  # Можна додати, якщо потрібні додаткові опції як сортування, жанри
-            ),
-            Catalogs(
-                type="series",
-                id="uakino_series_year",
-                name="Серіали (за роком)",
-                extra=[],
-            ),
-            Catalogs(
-                type="movie",  # Мультфільми зазвичай відносять до movie type в Stremio
-                id="uakino_cartoons_year",
-                name="Мультфільми (за роком)",
-                extra=[],
-            ),
-            Catalogs(
-                type="series",  # Аніме-серіали до series type
-                id="uakino_anime_year",
-                name="Аніме (за роком)",
-                extra=[],
-            ),
-            # TODO: Можна додати каталог для пошуку
-        ],
+            catalog.model_copy(update={"extra": await catalogs.manifest_extra("uakino", catalog.id)})
+            for catalog in CATALOGS
+        ] + SEARCH_CATALOGS,
         resources=[
             "catalog",
             "meta",
@@ -68,9 +92,12 @@ CATALOG_PATHS = {
     "uakino_anime_year": "/animeukr/f/c.year=1980,2025/sort=d.year;desc/",
 }
 
+# Тип за розділом сайту (перша частина ID), для результатів пошуку
+SECTION_TYPES = {"filmy": "movie", "cartoon": "movie", "seriesss": "series", "animeukr": "series"}
+
 
 @router.get("/catalog/{type_}/{id}.json", tags=[settings.name])
-@cache(expire=24 * 60 * 60)
+@cache_swr(expire=24 * 60 * 60, stale=settings.stale_ttl, namespace=CACHE_NAMESPACE)
 async def addon_catalog(
     type_: str,
     id: str,
@@ -82,14 +109,14 @@ async def addon_catalog(
     catalog_path = CATALOG_PATHS[id]
     url = f"{settings.main_url}{catalog_path}"
 
-    async with session.get(url) as response:
-        response.raise_for_status()
-        html_content = await response.text()
-        return await get_previews_metadata(html_content, type_)
+    html_content = await fetch_text(session, url)
+    previews = await get_previews_metadata(html_content, type_)
+    await search.index.add("uakino", previews["metas"], catalog=id)
+    return previews
 
 
 @router.get("/catalog/{type_}/{id}/skip={skip}.json", tags=[settings.name])
-@cache(expire=24 * 60 * 60)
+@cache_swr(expire=24 * 60 * 60, stale=settings.stale_ttl, namespace=CACHE_NAMESPACE)
 async def addon_catalog_skip(
     type_: str,
     id: str,
@@ -105,47 +132,123 @@ async def addon_catalog_skip(
     paginated_url_part = f"page/{page_number}/" if page_number > 1 else ""
     url = f"{settings.main_url}{catalog_path}{paginated_url_part}"
 
-    async with session.get(url) as response:
-        response.raise_for_status()
-        html_content = await response.text()
-        return await get_previews_metadata(html_content, type_)
+    html_content = await fetch_text(session, url)
+    previews = await get_previews_metadata(html_content, type_)
+    await search.index.add("uakino", previews["metas"], catalog=id)
+    return previews
+
+
+@router.get("/catalog/{type_}/uakino_search/search={query}.json", tags=[settings.name])
+async def addon_search(
+    type_: str,
+    query: str,
+    session: aiohttp.ClientSession = Depends(get_session),
+) -> dict[str, list[Preview]]:
+    # Спершу локальний індекс, сайт питаємо лише про те, чого ще не бачили
+    local = await search.index.search("uakino", query, type_)
+    if local:
+        return {"metas": local}
+
+    html_content = await fetch_text(
+        session,
+        f"{settings.main_url}/index.php",
+        method="POST",
+        data={"do": "search", "subaction": "search", "story": query},
+    )
+    previews = await get_previews_metadata(html_content, type_)
+    found = [
+        preview
+        for preview in previews["metas"]
+        if SECTION_TYPES.get(preview.id.split("/")[0], type_) == type_
+    ]
+    await search.index.add("uakino", found, replace=False)
+    return {"metas": found}
+
+
+# Фільтри за жанром і роком відповідає лише локальний індекс, без запитів до сайту
+@router.get("/catalog/{type_}/{id}/{extra}.json", tags=[settings.name])
+async def addon_catalog_filtered(type_: str, id: str, extra: str) -> dict[str, list[Preview]]:
+    if id not in CATALOG_PATHS:
+        return {"metas": []}
+    return await catalogs.browse("uakino", id, type_, extra, settings.items_per_page)
 
 
 @router.get("/meta/{type_}/{id:path}.json", tags=[settings.name], response_model=dict[str, Series])
-@cache(expire=24 * 60 * 60)
+@cache_swr(expire=24 * 60 * 60, stale=settings.stale_ttl, namespace=CACHE_NAMESPACE)
 async def addon_meta(
     type_: str,
     id: str,
     session: aiohttp.ClientSession = Depends(get_session),
 ) -> dict[str, Series]:
-    detail_page_url = f"{settings.main_url}/{id}.html"
-
     try:
-        async with session.get(detail_page_url) as response:
-            response.raise_for_status()
-            html_content = await response.text()
-
-            videos = await get_videos(id, html_content, session, type_)
-            series_metadata = await get_series_metadata(id, html_content, videos, type_)
+        series_metadata = await get_meta(id, type_, session)
+        await search.index.add("uakino", [series_metadata["meta"]])
 
         return series_metadata
+    except (ParsePoolFull, Uncacheable):
+        # Перевантаження не кешуємо як порожню відповідь, неповне мета не кешуємо взагалі
+        raise
+    # Помилки не повертаємо порожнім {}: його б закешовано на добу
     except aiohttp.client_exceptions.ClientResponseError as e:
-        print(f"Error fetching meta for {id}: {e}")
-        return {}
-    except Exception as e:
-        print(f"Unexpected error fetching meta for {id}: {e}")
-        return {}
+        logger.warning(f"Error fetching meta for {id}: {e}")
+        if e.status == 404:
+            raise HTTPException(status_code=404, detail="Item not found")
+        raise HTTPException(status_code=502, detail="Upstream error")
+    except Exception:
+        logger.warning(f"Unexpected error fetching meta for {id}", exc_info=True)
+        raise HTTPException(status_code=502, detail="Upstream error")
 
 
 @router.get("/stream/{type_}/{video_id:path}.json", tags=[settings.name], response_model=dict[str, List[Stream]])
-@cache(expire=6 * 60 * 60)
 async def addon_stream(
     type_: str,
     video_id: str,
+    request: Request,
     session: aiohttp.ClientSession = Depends(get_session)
 ) -> dict[str, List[Stream]]:
 
-    print(f"Запит стрімів для type={type_}, video_id={video_id}")
-    streams_response = await get_streams(type_, video_id, session)
-    print(f"Знайдено стрімів: {streams_response}")
-    return streams_response
+    logger.debug("Запит стрімів для type=%s, video_id=%s", type_, video_id)
+    streams_response = await resolve_streams(type_=type_, video_id=video_id, session=session)
+    logger.debug("Знайдено стрімів: %s", streams_response)
+    # Порядок і проксі залежать від поточного стану, тому рахуються поза кешем
+    streams = health.rank(
+        [Stream.model_validate(stream) for stream in streams_response["streams"]], hls.headers("uakino")
+    )
+    return {**streams_response, "streams": hls.wrap("uakino", streams, str(request.base_url))}
+
+
+# Посилання плеєра підписані (expires=...), тож кешуються лише доки дійсні
+@cache_until(expire=6 * 60 * 60, expires=streams_expire, namespace=CACHE_NAMESPACE)
+async def resolve_streams(type_: str, video_id: str, session: aiohttp.ClientSession) -> dict[str, List[Stream]]:
+    return await get_streams(type_, video_id, session)
+
+
+# Прогрів кешу
+async def warm_catalog(type_: str, id: str, page: int) -> dict[str, list[Preview]]:
+    session = await get_session()
+    if page == 1:
+        return await addon_catalog.refresh(type_=type_, id=id, session=session)
+    return await addon_catalog_skip.refresh(
+        type_=type_, id=id, skip=settings.items_per_page * (page - 1), session=session
+    )
+
+
+async def warm_meta(type_: str, id: str) -> dict[str, Series]:
+    return await addon_meta.refresh(type_=type_, id=id, session=await get_session())
+
+
+def warmup_pages(pages: int) -> list[warmup.CatalogPage]:
+    return [
+        warmup.CatalogPage(
+            provider="uakino",
+            catalog=catalog.id,
+            page=page,
+            load=partial(warm_catalog, catalog.type, catalog.id, page),
+            meta=warm_meta,
+        )
+        for catalog in CATALOGS
+        for page in range(1, pages + 1)
+    ]
+
+
+warmup.register("uakino", warmup_pages)
@@ -1,24 +1,42 @@
+import asyncio
 import json
+import logging
+import sys
 import time
+from dataclasses import dataclass
 from typing import List, Optional
-from bs4 import BeautifulSoup, Tag
+from urllib.parse import urlsplit
+from bs4 import Tag
+from app.cache import Uncacheable
+from app.cache_backends import TTLCache
+from app.parsing import make_soup
 from app.schemas import Preview, Series, Stream, Videos
+from app import hls, store, upstream, workers
+from app.singleflight import SingleFlight
 from .settings import settings
 import aiohttp
 import re
 
+logger = logging.getLogger(__name__)
 
-async def get_session():
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/136.0.0.0 Safari/537.36 Edg/136.0.0.0"
-    }
-    async with aiohttp.ClientSession(headers=headers) as session:
-        yield session
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/136.0.0.0 Safari/537.36 Edg/136.0.0.0"
 
+upstream.register("uakino", settings, headers={"User-Agent": USER_AGENT})
+# CDN плеєра віддає плейлисти лише з Referer сторінки плеєра
+hls.register("uakino", {"User-Agent": USER_AGENT, "Referer": settings.stream_referer})
 
-async def get_previews_metadata(html_content: str, type_: str) -> dict[str, list[Preview]]:
+
+async def get_session() -> aiohttp.ClientSession:
+    return upstream.get_session("uakino")
+
+
+# Coalesces playlist/player fetch + parse for the same title or episode
+extractions = SingleFlight("uakino")
+
+
+def parse_previews(html_content: str, type_: str) -> dict[str, list[Preview]]:
     previews_metadata = {"metas": []}
-    soup = BeautifulSoup(html_content, "html.parser")
+    soup = make_soup(html_content)
 
     for item in soup.find_all("div", class_="movie-item short-item"):
         title_tag = item.find("a", class_="movie-title")
@@ -59,6 +77,15 @@ async def get_previews_metadata(html_content: str, type_: str) -> dict[str, list
                 genres = [genre.strip() for genre in genre_value_tag.get_text(
                     separator=",").split(',') if genre.strip()]
 
+        year = None
+        year_label_tag = item.find(
+            "div", class_="fi-label", string=re.compile(r"Рік виходу:"))
+        if year_label_tag:
+            year_value_tag = year_label_tag.find_next_sibling(
+                "div", class_="deck-value")
+            if year_value_tag:
+                year = year_value_tag.get_text(strip=True) or None
+
         previews_metadata["metas"].append(
             Preview(
                 id=item_id,
@@ -67,15 +94,20 @@ async def get_previews_metadata(html_content: str, type_: str) -> dict[str, list
                 poster=poster_src,
                 description=description,
                 genres=genres,
+                releaseInfo=year,
             )
         )
     return previews_metadata
 
 
-async def get_series_metadata(
+async def get_previews_metadata(html_content: str, type_: str) -> dict[str, list[Preview]]:
+    return await workers.parse(parse_previews, html_content, type_)
+
+
+def parse_series_metadata(
     item_id: str, html_content: str, videos: list[Videos], type_: str
 ) -> dict[str, Series]:
-    soup = BeautifulSoup(html_content, "html.parser")
+    soup = make_soup(html_content)
 
     title_tag = soup.find("h1").find(
         "span", class_="solototle", itemprop="name")
@@ -126,6 +158,9 @@ async def get_series_metadata(
             if text:
                 director = [t.strip() for t in text.split(',') if t.strip()]
 
+    year_desc_tag = find_sibling_div_by_label_text("Рік виходу")
+    year = (year_desc_tag.get_text(strip=True) or None) if year_desc_tag else None
+
     runtime: Optional[str] = None
     runtime_desc_tag = find_sibling_div_by_label_text("Тривалість")
     if runtime_desc_tag:
@@ -138,6 +173,7 @@ async def get_series_metadata(
         genres=genres,
         poster=full_poster_url,
         description=description,
+        releaseInfo=year,
         director=director,
         runtime=runtime,
         background=background_url,
@@ -147,140 +183,434 @@ async def get_series_metadata(
     return {"meta": meta_object}
 
 
+async def get_series_metadata(
+    item_id: str, html_content: str, videos: list[Videos], type_: str
+) -> dict[str, Series]:
+    return await workers.parse(parse_series_metadata, item_id, html_content, videos, type_)
+
+
+def extract_news_id(html_content: str) -> Optional[str]:
+    soup = make_soup(html_content)
+    playlist_div = soup.find("div", id="pre", class_="playlists-ajax")
+    if not playlist_div or not playlist_div.has_attr("data-news_id"):
+        return None
+    return playlist_div["data-news_id"]
+
+
+def extract_seasons(item_id: str, html_content: str) -> list[tuple[str, int]]:
+    """(item id, season) of the other season pages a series page links to."""
+    soup = make_soup(html_content)
+    seasons = []
+    for link in soup.select(".seasons a[href]"):
+        season_match = re.search(r"(\d+)\s+сезон", link.get_text(), re.IGNORECASE) or re.search(
+            r"(\d+)-sezon", link["href"])
+        season_id = urlsplit(link["href"]).path.lstrip("/").removesuffix(".html")
+        if not season_match or season_id == item_id or season_id in {id for id, _ in seasons}:
+            continue
+        seasons.append((season_id, int(season_match.group(1))))
+    return seasons
+
+
+def extract_movie_video(item_id: str, html_content: str) -> Videos:
+    soup = make_soup(html_content)
+    title_tag = soup.find("h1").find(
+        "span", class_="solototle", itemprop="name")
+    movie_title = title_tag.get_text(strip=True) if title_tag else "Фільм"
+    poster_tag = soup.find(
+        "div", class_="film-poster").find("img", itemprop="image")
+    poster_src = poster_tag.get("src") if poster_tag else None
+    thumbnail_url = f"{settings.main_url}{poster_src}" if poster_src and poster_src.startswith(
+        "/") else poster_src
+    released_tag = soup.find("meta", itemprop="dateCreated")
+    released_date = released_tag.get("content") if released_tag else None
+    return Videos(
+        id=item_id, title=movie_title, thumbnail=thumbnail_url,
+        released=released_date, season=None, episode=None,
+    )
+
+
+@dataclass(frozen=True)
+class EpisodeMap:
+    """Decoded `playlists.php` response of one series.
+
+    `titles` keeps every playlist entry in order as (episode, title) and
+    `episodes` maps an episode number to its (voice, data-file) pairs.
+    """
+
+    titles: list[tuple[int, str]]
+    episodes: dict[int, list[tuple[str, Optional[str]]]]
+
+    @classmethod
+    def parse(cls, playlist_data_raw: str) -> Optional["EpisodeMap"]:
+        """Returns None when the AJAX answer has no success/response."""
+        outer_json = json.loads(playlist_data_raw)
+        if not (outer_json.get("success") and "response" in outer_json):
+            return None
+        inner_soup = make_soup(outer_json["response"])
+
+        titles = []
+        episodes = {}
+        for item_li in inner_soup.select("div.playlists-videos div.playlists-items ul li"):
+            episode_title = item_li.get_text(strip=True)
+            episode_num_match = re.search(
+                r'(\d+)', episode_title)
+            if not episode_num_match:
+                logger.debug(
+                    "Не вдалося визначити номер серії для %r", episode_title)
+                continue
+            episode_number = int(episode_num_match.group(1))
+            titles.append((episode_number, episode_title))
+            episodes.setdefault(episode_number, []).append(
+                (item_li.get("data-voice", "Default"), item_li.get("data-file"))
+            )
+        return cls(titles=titles, episodes=episodes)
+
+
+# Series lookups shared by meta and stream requests:
+# item id -> data-news_id, and data-news_id -> decoded playlist
+news_ids: TTLCache[str] = TTLCache(settings.playlist_cache_size, sys.maxsize)
+episode_maps: TTLCache[EpisodeMap] = TTLCache(settings.playlist_cache_size, sys.maxsize)
+
+
+def extract_episodes(item_id: str, html_content: str, episode_map: EpisodeMap) -> list[Videos]:
+    videos = []
+    soup = make_soup(html_content)
+    current_season_number = 1
+    main_title_tag = soup.find("h1").find(
+        "span", class_="solototle", itemprop="name")
+    main_title_text = main_title_tag.get_text() if main_title_tag else ""
+    season_match = re.search(
+        r"(\d+)\s+сезон", main_title_text, re.IGNORECASE)
+    if season_match:
+        current_season_number = int(season_match.group(1))
+    else:
+        logger.warning(
+            f"Не вдалося визначити номер сезону з заголовку '{main_title_text}'. Використовується {current_season_number}.")
+    if not episode_map.titles:
+        logger.warning(
+            f"Не знайдено елементів серій у внутрішньому HTML для {item_id}")
+    series_poster_tag = soup.find(
+        "div", class_="film-poster-serial").find("img", itemprop="image")
+    series_poster_src = series_poster_tag.get(
+        "src") if series_poster_tag else None
+    series_thumbnail_url = f"{settings.main_url}{series_poster_src}" if series_poster_src and series_poster_src.startswith(
+        "/") else series_poster_src
+    return episode_videos(item_id, current_season_number, series_thumbnail_url, episode_map)
+
+
+def episode_videos(
+    item_id: str, season: int, thumbnail: Optional[str], episode_map: EpisodeMap
+) -> list[Videos]:
+    videos = [
+        Videos(id=f"{item_id}/{season}:{episode_number}", title=episode_title, season=season,
+               episode=episode_number, thumbnail=thumbnail, released=None)
+        for episode_number, episode_title in episode_map.titles
+    ]
+    logger.debug("Знайдено %d серій для сезону %d.", len(videos), season)
+
+    videos.sort(key=lambda v: (v.season or 0, v.episode or 0))
+    return videos
+
+
+def extract_movie_player(html_content: str) -> tuple[Optional[str], str]:
+    """Returns the player page URL and stream name for a movie detail page."""
+    soup = make_soup(html_content)
+    iframe = soup.select_one(".box.full-text.visible iframe#pre")
+    if not iframe or not iframe.has_attr("src"):
+        return None, "Stream"
+    # Визначення якості для назви стріму
+    quality_label = soup.find(
+        "div", class_="fi-label", string=re.compile(r"Якість:"))
+    quality = quality_label.find_next_sibling("div", class_="fi-desc").get_text(
+        strip=True) if quality_label and quality_label.find_next_sibling("div", class_="fi-desc") else "HD"
+    return iframe["src"], f"Фільм ({quality})"
+
+
+def extract_episode_player(episode_map: EpisodeMap, req_episode: int) -> tuple[Optional[str], str]:
+    """Returns the player page URL and stream name for one episode of a playlist."""
+    stream_name_prefix = "Stream"
+    for voice, player_page_url in episode_map.episodes.get(req_episode, []):
+        stream_name_prefix = f"{voice} - Серія {req_episode}"
+        if player_page_url:
+            return player_page_url, stream_name_prefix
+    return None, stream_name_prefix
+
+
+def extract_stream_url(player_html: str) -> Optional[str]:
+    match = re.search(
+        r'file\s*:\s*"([^"]+\.m3u8[^"]*)"', player_html)
+    if not match:
+        match = re.search(r'file\s*:\s*"([^"]+)"', player_html)
+    return match.group(1) if match else None
+
+
 async def get_videos(
     item_id: str, html_content: str, session: aiohttp.ClientSession, type_: str
-) -> list[Videos]:
-    videos = []
-    soup = BeautifulSoup(html_content, "html.parser")
+) -> tuple[list[Videos], bool]:
+    """Videos of a title, and False when some seasons failed or didn't load in time."""
+    return await extractions.do(("videos", type_, item_id), _get_videos, item_id, html_content, session, type_)
+
 
+async def _fetch_episode_map(item_id: str, news_id: str, session: aiohttp.ClientSession) -> Optional[EpisodeMap]:
     detail_page_url = f"{settings.main_url}/{item_id}.html"
+    playlist_url = f"{settings.main_url}/engine/ajax/playlists.php"
+    current_timestamp = int(time.time())
+    params = {
+        "news_id": news_id,
+        "xfield": "playlist",
+        "time": current_timestamp
+    }
+
+    ajax_headers = {
+        "Accept": "application/json, text/javascript, */*; q=0.01",
+        "Accept-Language": "uk,en;q=0.9,en-GB;q=0.8,en-US;q=0.7,ru;q=0.6,de-DE;q=0.5,de;q=0.4",
+        "Dnt": "1",
+        "Referer": detail_page_url,
+        "Sec-Fetch-Dest": "empty",
+        "Sec-Fetch-Mode": "cors",
+        "Sec-Fetch-Site": "same-origin",
+        "X-Requested-With": "XMLHttpRequest"
+
+    }
+    # ------------------------------------------------------------------
+
+    logger.debug(
+        "Завантаження плейлиста для news_id=%s", news_id, extra={"url": playlist_url, "params": params})
+
+    playlist_data_raw = await upstream.fetch_text(session, playlist_url, params=params, headers=ajax_headers)
+    try:
+        episode_map = await workers.parse(EpisodeMap.parse, playlist_data_raw)
+    except json.JSONDecodeError:
+        logger.warning(
+            f"Не вдалося розпарсити JSON відповідь AJAX для {news_id}", extra={"response": playlist_data_raw})
+        return None
+    if episode_map is None:
+        logger.warning(
+            f"Відповідь AJAX не містить {{\"success\":true, \"response\":\"...\"}} для news_id={news_id}")
+        return None
+
+    episode_maps.set(news_id, episode_map, settings.playlist_ttl)
+    await store.metadata.put("uakino", "episodes", news_id, episode_map)
+    return episode_map
+
+
+async def get_episode_map(item_id: str, news_id: str, session: aiohttp.ClientSession) -> Optional[EpisodeMap]:
+    episode_map = episode_maps.get(news_id)
+    if episode_map is None:
+        # Після перезапуску беремо збережений плейлист, поки він не застарів
+        stored = await store.metadata.get("uakino", "episodes", news_id, EpisodeMap)
+        if stored is not None and stored.age < settings.playlist_ttl:
+            episode_map = stored.value
+            episode_maps.set(news_id, episode_map, settings.playlist_ttl - stored.age)
+    if episode_map is None:
+        episode_map = await extractions.do(("playlist", news_id), _fetch_episode_map, item_id, news_id, session)
+    return episode_map
+
+
+async def get_news_id(
+    item_id: str, session: aiohttp.ClientSession, html_content: Optional[str] = None
+) -> Optional[str]:
+    news_id = news_ids.get(item_id)
+    if news_id is None:
+        stored = await store.metadata.get("uakino", "news_id", item_id, str)
+        if stored is not None and stored.age < settings.news_id_ttl:
+            news_id = stored.value
+            news_ids.set(item_id, news_id, settings.news_id_ttl - stored.age)
+    if news_id is None:
+        if html_content is None:
+            html_content = await upstream.fetch_text(session, f"{settings.main_url}/{item_id}.html")
+        news_id = await workers.parse(extract_news_id, html_content)
+        if news_id is not None:
+            news_ids.set(item_id, news_id, settings.news_id_ttl)
+            await store.metadata.put("uakino", "news_id", item_id, news_id)
+    return news_id
+
+
+async def get_movie_player(item_id: str, session: aiohttp.ClientSession) -> tuple[Optional[str], str]:
+    """Player page URL and stream name of a movie, from the store while the page is fresh."""
+    stored = await store.metadata.get("uakino", "player", item_id, tuple[Optional[str], str])
+    if stored is not None and stored.age < settings.page_refresh:
+        return stored.value
+    html_content = await upstream.fetch_text(session, f"{settings.main_url}/{item_id}.html")
+    player = await workers.parse(extract_movie_player, html_content)
+    if player[0]:
+        await store.metadata.put("uakino", "player", item_id, player, tuple[Optional[str], str])
+    return player
+
+
+async def _season_episode_map(item_id: str, session: aiohttp.ClientSession) -> Optional[EpisodeMap]:
+    news_id = await get_news_id(item_id, session)
+    if news_id is None:
+        logger.warning(f"Не знайдено data-news_id для сезону {item_id}")
+        return None
+    return await get_episode_map(item_id, news_id, session)
+
+
+# Season crawls that outlived the meta request waiting for them
+_season_crawls: set[asyncio.Task] = set()
+
+
+def _crawl_done(task: asyncio.Task):
+    _season_crawls.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.debug("Фоновий сезон завершився з помилкою: %r", task.exception())
+
+
+async def crawl_seasons(
+    seasons: list[tuple[str, int]], session: aiohttp.ClientSession
+) -> tuple[dict[tuple[str, int], Optional[EpisodeMap]], list[tuple[str, int]]]:
+    """Playlists of several season pages, fetched side by side.
+
+    At most `season_concurrency` seasons are in flight, the crawl waits
+    `season_deadline` seconds for them. Returns the playlists of the seasons
+    that made it and the seasons missing: failed or still loading. Those
+    still loading aren't cancelled: they finish in the background and are
+    found in the news_id and playlist caches next time.
+    """
+    if not seasons:
+        return {}, []
+    limit = asyncio.Semaphore(settings.season_concurrency)
+
+    async def crawl(item_id: str) -> Optional[EpisodeMap]:
+        async with limit:
+            return await _season_episode_map(item_id, session)
+
+    tasks = {season: asyncio.ensure_future(crawl(season[0])) for season in seasons}
+    for task in tasks.values():
+        _season_crawls.add(task)
+        task.add_done_callback(_crawl_done)
+    _, pending = await asyncio.wait(tasks.values(), timeout=settings.season_deadline)
+
+    episode_maps, missing = {}, []
+    for (item_id, season), task in tasks.items():
+        if task in pending:
+            logger.warning(f"Сезон {season} ({item_id}) не встиг за {settings.season_deadline} с, довантажується у фоні")
+        elif task.exception() is not None:
+            if isinstance(task.exception(), workers.ParsePoolFull):
+                raise task.exception()
+            logger.warning(f"Не вдалося завантажити сезон {season} ({item_id}): {task.exception()!r}")
+        elif task.result() is None:
+            logger.warning(f"Сезон {season} ({item_id}) без плейлиста")
+        else:
+            episode_maps[item_id, season] = task.result()
+            continue
+        missing.append((item_id, season))
+    return episode_maps, missing
+
+
+def merge_seasons(videos: list[Videos]) -> list[Videos]:
+    """One list sorted by season and episode, the first video of each pair kept."""
+    merged = {}
+    for video in videos:
+        merged.setdefault((video.season or 0, video.episode or 0), video)
+    return [merged[key] for key in sorted(merged)]
 
+
+async def _get_videos(
+    item_id: str, html_content: str, session: aiohttp.ClientSession, type_: str
+) -> tuple[list[Videos], bool]:
     if type_ == "movie":
-        title_tag = soup.find("h1").find(
-            "span", class_="solototle", itemprop="name")
-        movie_title = title_tag.get_text(strip=True) if title_tag else "Фільм"
-        poster_tag = soup.find(
-            "div", class_="film-poster").find("img", itemprop="image")
-        poster_src = poster_tag.get("src") if poster_tag else None
-        thumbnail_url = f"{settings.main_url}{poster_src}" if poster_src and poster_src.startswith(
-            "/") else poster_src
-        released_tag = soup.find("meta", itemprop="dateCreated")
-        released_date = released_tag.get("content") if released_tag else None
-        videos.append(
-            Videos(
-                id=item_id, title=movie_title, thumbnail=thumbnail_url,
-                released=released_date, season=None, episode=None,
-            )
-        )
-    elif type_ == "series":
-        playlist_div = soup.find("div", id="pre", class_="playlists-ajax")
-        if not playlist_div or not playlist_div.has_attr("data-news_id"):
-            print(f"Помилка: Не знайдено data-news_id для серіалу {item_id}")
-            return []
-
-        news_id = playlist_div["data-news_id"]
-
-        playlist_url = f"{settings.main_url}/engine/ajax/playlists.php"
-        current_timestamp = int(time.time())
-        params = {
-            "news_id": news_id,
-            "xfield": "playlist",
-            "time": current_timestamp
-        }
-
-        ajax_headers = {
-            "Accept": "application/json, text/javascript, */*; q=0.01",
-            "Accept-Language": "uk,en;q=0.9,en-GB;q=0.8,en-US;q=0.7,ru;q=0.6,de-DE;q=0.5,de;q=0.4",
-            "Dnt": "1",
-            "Referer": detail_page_url,
-            "Sec-Fetch-Dest": "empty",
-            "Sec-Fetch-Mode": "cors",
-            "Sec-Fetch-Site": "same-origin",
-            "X-Requested-With": "XMLHttpRequest"
-
-        }
-        # ------------------------------------------------------------------
-
-        print(
-            f"Завантаження плейлиста для news_id={news_id} з URL: {playlist_url} з параметрами: {params} та заголовками: {ajax_headers}")
-
-        try:
-            async with session.get(playlist_url, params=params, headers=ajax_headers) as playlist_response:
-                print(
-                    f"Статус відповіді плейлиста: {playlist_response.status}")
-                playlist_response.raise_for_status()
-
-                playlist_data_raw = await playlist_response.text()
+        return [await workers.parse(extract_movie_video, item_id, html_content)], True
+    if type_ != "series":
+        return [], True
 
-                try:
-                    outer_json = json.loads(playlist_data_raw)
-                    if outer_json.get("success") and "response" in outer_json:
-
-                        inner_html_str = outer_json["response"]
-                        inner_soup = BeautifulSoup(
-                            inner_html_str, "html.parser")
-                        current_season_number = 1
-                        main_title_tag = soup.find("h1").find(
-                            "span", class_="solototle", itemprop="name")
-                        main_title_text = main_title_tag.get_text() if main_title_tag else ""
-                        season_match = re.search(
-                            r"(\d+)\s+сезон", main_title_text, re.IGNORECASE)
-                        if season_match:
-                            current_season_number = int(season_match.group(1))
-                        else:
-                            print(
-                                f"Попередження: Не вдалося визначити номер сезону з заголовку '{main_title_text}'. Використовується {current_season_number}.")
-                        episode_list_items = inner_soup.select(
-                            "div.playlists-videos div.playlists-items ul li")
-                        if not episode_list_items:
-                            print(
-                                f"Не знайдено елементів серій у внутрішньому HTML для news_id={news_id}")
-                        series_poster_tag = soup.find(
-                            "div", class_="film-poster-serial").find("img", itemprop="image")
-                        series_poster_src = series_poster_tag.get(
-                            "src") if series_poster_tag else None
-                        series_thumbnail_url = f"{settings.main_url}{series_poster_src}" if series_poster_src and series_poster_src.startswith(
-                            "/") else series_poster_src
-                        for item_li in episode_list_items:
-                            episode_title = item_li.get_text(strip=True)
-                            episode_num_match = re.search(
-                                r'(\d+)', episode_title)
-                            episode_number = int(episode_num_match.group(
-                                1)) if episode_num_match else None
-                            if episode_number is None:
-                                print(
-                                    f"Не вдалося визначити номер серії для '{episode_title}'")
-                                continue
-                            season_number = current_season_number
-                            video_id = f"{item_id}/{season_number}:{episode_number}"
-                            videos.append(Videos(id=video_id, title=episode_title, season=season_number,
-                                          episode=episode_number, thumbnail=series_thumbnail_url, released=None))
-                        print(
-                            f"Знайдено {len(videos)} серій для сезону {season_number}.")
-                        # -------------------------------------------------------------
-                    else:
-                        print(
-                            f"Відповідь AJAX не містить {{\"success\":true, \"response\":\"...\"}} для news_id={news_id}")
-                except json.JSONDecodeError:
-                    print(
-                        f"Не вдалося розпарсити JSON відповідь AJAX для {news_id}. Відповідь: {playlist_data_raw[:500]}...")
-        except aiohttp.ClientError as e:
-            # Обробка помилок
-            if isinstance(e, aiohttp.client_exceptions.ClientResponseError) and e.status == 403:
-                print(
-                    f"Помилка 403 Forbidden при завантаженні плейлиста для {news_id}. Ймовірно, потрібні Cookies або обхід Cloudflare.")
-            else:
-                print(
-                    f"Помилка HTTP при завантаженні плейлиста для {news_id}: {e}")
-        except Exception as e:
-            print(
-                f"Неочікувана помилка при обробці плейлиста для {news_id}: {e}")
+    news_id = await get_news_id(item_id, session, html_content)
+    if news_id is None:
+        logger.warning(f"Не знайдено data-news_id для серіалу {item_id}")
+        return [], True
 
-    videos.sort(key=lambda v: (v.season or 0, v.episode or 0))
-    return videos
+    # Інші сезони вантажимо паралельно з плейлистом поточного
+    others = asyncio.ensure_future(crawl_seasons(await workers.parse(extract_seasons, item_id, html_content), session))
+    try:
+        videos, current = await _current_season_videos(item_id, html_content, news_id, session)
+    except BaseException:
+        others.cancel()
+        raise
+    thumbnail = videos[0].thumbnail if videos else None
+    episode_maps, missing = await others
+    for (season_id, season), episode_map in episode_maps.items():
+        videos.extend(episode_videos(season_id, season, thumbnail, episode_map))
+    return merge_seasons(videos), current and not missing
+
+
+async def _current_season_videos(
+    item_id: str, html_content: str, news_id: str, session: aiohttp.ClientSession
+) -> tuple[list[Videos], bool]:
+    """Episodes of the season on the page, and False when its playlist failed."""
+    try:
+        episode_map = await get_episode_map(item_id, news_id, session)
+        if episode_map is not None:
+            return await workers.parse(extract_episodes, item_id, html_content, episode_map), True
+        logger.warning(f"Плейлист {news_id} без серій")
+    except workers.ParsePoolFull:
+        raise
+    except aiohttp.ClientError as e:
+        # Обробка помилок
+        if isinstance(e, aiohttp.client_exceptions.ClientResponseError) and e.status == 403:
+            logger.warning(
+                f"Помилка 403 Forbidden при завантаженні плейлиста для {news_id}. Ймовірно, потрібні Cookies або обхід Cloudflare.")
+        else:
+            logger.warning(
+                f"Помилка HTTP при завантаженні плейлиста для {news_id}: {e}")
+    except Exception:
+        logger.warning(
+            f"Неочікувана помилка при обробці плейлиста для {news_id}", exc_info=True)
+    return [], False
+
+
+async def _refresh_episodes(item_id: str, meta: Series, session: aiohttp.ClientSession) -> tuple[Series, bool]:
+    # Назва й постер не змінюються, тож з них беремо лише список серій. Сторінку
+    # все одно завантажуємо: з неї видно сезони, що додалися чи раніше не вдалися
+    html_content = await upstream.fetch_text(session, f"{settings.main_url}/{item_id}.html")
+    videos, complete = await get_videos(item_id, html_content, session, "series")
+    if not complete:
+        # Сезони, що не оновилися, лишаються як були до наступної спроби
+        updated = {video.season for video in videos}
+        videos = videos + [video for video in meta.videos if video.season not in updated]
+    return meta.model_copy(update={"videos": merge_seasons(videos)}), complete
+
+
+async def get_meta(item_id: str, type_: str, session: aiohttp.ClientSession) -> dict[str, Series]:
+    """The stored meta while it is fresh, otherwise refreshed and stored again.
+
+    A stale series only gets its season list and episodes re-fetched; the
+    rest of the detail page is scraped again for new titles and once
+    `page_refresh` has passed. A meta missing seasons that failed or didn't
+    load in time, or a series without any episode, is raised as
+    `Uncacheable`: served but neither stored nor cached.
+    """
+    stored = await store.metadata.get("uakino", "meta", item_id, Series)
+    max_age = settings.meta_refresh if type_ == "series" else settings.page_refresh
+    if stored is not None and stored.age < max_age:
+        return {"meta": stored.value}
+
+    try:
+        if stored is not None and stored.value.videos and stored.age < settings.page_refresh:
+            meta, complete = await _refresh_episodes(item_id, stored.value, session)
+        else:
+            html_content = await upstream.fetch_text(session, f"{settings.main_url}/{item_id}.html")
+            videos, complete = await get_videos(item_id, html_content, session, type_)
+            meta = (await get_series_metadata(item_id, html_content, videos, type_))["meta"]
+    except Exception:
+        if stored is None:
+            raise
+        logger.warning(f"Не вдалося оновити мета {item_id}, віддаємо збережене", exc_info=True)
+        return {"meta": stored.value}
+
+    # Без сезонів, що не вдалися чи не встигли, мета не зберігаємо й не кешуємо:
+    # наступний запит спробує їх знову (ті, що не встигли, довантажуються у фоні).
+    # Серіал без серій теж означає збій плейлиста
+    if not complete or (type_ == "series" and not meta.videos):
+        raise Uncacheable({"meta": meta})
+    await store.metadata.put("uakino", "meta", item_id, meta)
+    return {"meta": meta}
 
 
 async def get_streams(type_: str, video_id: str, session: aiohttp.ClientSession) -> dict[str, List[Stream]]:
+    return await extractions.do(("streams", type_, video_id), _get_streams, type_, video_id, session)
+
+
+async def _get_streams(type_: str, video_id: str, session: aiohttp.ClientSession) -> dict[str, List[Stream]]:
     streams = {"streams": []}
     player_page_url = None
     stream_name_prefix = "Stream"  # Назва стріму за замовчуванням
@@ -297,88 +627,39 @@ async def get_streams(type_: str, video_id: str, session: aiohttp.ClientSession)
             item_id = video_id
 
         detail_page_url = f"{settings.main_url}/{item_id}.html"
-        print(
-            f"get_streams: Крок 1 -> Пошук URL сторінки плеєра для {type_} | video_id: {video_id}")
+        logger.debug(
+            "get_streams: Крок 1 -> Пошук URL сторінки плеєра для %s | video_id: %s", type_, video_id)
 
         if type_ == "movie":
-            async with session.get(detail_page_url) as response:
-                response.raise_for_status()
-                html_content = await response.text()
-                soup = BeautifulSoup(html_content, "html.parser")
-                iframe = soup.select_one(".box.full-text.visible iframe#pre")
-                if iframe and iframe.has_attr("src"):
-                    player_page_url = iframe["src"]
-                    # Визначення якості для назви стріму
-                    quality_label = soup.find(
-                        "div", class_="fi-label", string=re.compile(r"Якість:"))
-                    quality = quality_label.find_next_sibling("div", class_="fi-desc").get_text(
-                        strip=True) if quality_label and quality_label.find_next_sibling("div", class_="fi-desc") else "HD"
-                    stream_name_prefix = f"Фільм ({quality})"
-                else:
-                    print(f"Не знайдено iframe для фільму {item_id}")
+            player_page_url, stream_name_prefix = await get_movie_player(item_id, session)
+            if not player_page_url:
+                logger.warning(f"Не знайдено iframe для фільму {item_id}")
 
         elif type_ == "series":
+            req_season, req_episode = None, None
+            if season_episode_info:
+                try:
+                    s_e_parts = season_episode_info.split(':')
+                    req_season = int(s_e_parts[0])
+                    req_episode = int(s_e_parts[1])
+                except:
+                    pass
+
             # Отримуємо плейлист, щоб знайти data-file
-            async with session.get(detail_page_url) as page_response:
-                if page_response.status != 200:
-                    raise Exception(
-                        f"Failed to load series page {detail_page_url}")
-                html_content_main = await page_response.text()
-                soup_main_page = BeautifulSoup(
-                    html_content_main, "html.parser")
-                playlist_div = soup_main_page.find(
-                    "div", id="pre", class_="playlists-ajax")
-                if not playlist_div or not playlist_div.has_attr("data-news_id"):
-                    raise Exception(f"No news_id found for {item_id}")
-                news_id = playlist_div["data-news_id"]
-
-            playlist_url = f"{settings.main_url}/engine/ajax/playlists.php"
-            params = {"news_id": news_id, "xfield": "playlist"}
-            ajax_headers = {"Referer": detail_page_url,
-                            "X-Requested-With": "XMLHttpRequest"}
-
-            async with session.get(playlist_url, params=params, headers=ajax_headers) as playlist_response:
-                playlist_response.raise_for_status()
-                playlist_data_raw = await playlist_response.text()
-                outer_json = json.loads(playlist_data_raw)
-
-                if outer_json.get("success") and "response" in outer_json:
-                    inner_html_str = outer_json["response"]
-                    inner_soup = BeautifulSoup(inner_html_str, "html.parser")
-                    req_season, req_episode = None, None
-                    if season_episode_info:
-                        try:
-                            s_e_parts = season_episode_info.split(':')
-                            req_season = int(s_e_parts[0])
-                            req_episode = int(s_e_parts[1])
-                        except:
-                            pass
-
-                    if req_season is not None and req_episode is not None:
-                        episode_list_items = inner_soup.select(
-                            "div.playlists-videos div.playlists-items ul li")
-                        for item_li in episode_list_items:
-                            episode_title = item_li.get_text(strip=True)
-                            episode_num_match = re.search(
-                                r'(\d+)', episode_title)
-                            episode_number = int(episode_num_match.group(
-                                1)) if episode_num_match else None
-                            if episode_number == req_episode:
-                                player_page_url_part = item_li.get("data-file")
-                                voice = item_li.get("data-voice", "Default")
-                                stream_name_prefix = f"{voice} - Серія {episode_number}"
-                                if player_page_url_part:
-                                    player_page_url = player_page_url_part
-                                    break
-                        if not player_page_url:
-                            print(
-                                f"Не знайдено data-file для серії {req_season}:{req_episode}")
-                    else:
-                        print(
-                            f"Не вдалося розпарсити сезон/серію з {season_episode_info}")
-                else:
-                    print(
-                        f"AJAX відповідь не містить success/response для {item_id}")
+            news_id = await get_news_id(item_id, session)
+            if news_id is None:
+                raise Exception(f"No news_id found for {item_id}")
+
+            if req_season is not None and req_episode is not None:
+                episode_map = await get_episode_map(item_id, news_id, session)
+                if episode_map is not None:
+                    player_page_url, stream_name_prefix = extract_episode_player(episode_map, req_episode)
+                if not player_page_url:
+                    logger.warning(
+                        f"Не знайдено data-file для серії {req_season}:{req_episode}")
+            else:
+                logger.warning(
+                    f"Не вдалося розпарсити сезон/серію з {season_episode_info}")
 
         # Переконуємося, що URL плеєра має протокол
         if player_page_url and player_page_url.startswith("//"):
@@ -386,30 +667,20 @@ async def get_streams(type_: str, video_id: str, session: aiohttp.ClientSession)
 
         # --- Крок 2 & 3: Завантажуємо сторінку плеєра та витягуємо фінальний URL ---
         if player_page_url:
-            print(
-                f"get_streams: Крок 2 -> Завантаження сторінки плеєра: {player_page_url}")
+            logger.debug(
+                "get_streams: Крок 2 -> Завантаження сторінки плеєра: %s", player_page_url)
             player_headers = {"Referer": detail_page_url}
-            async with session.get(player_page_url, headers=player_headers) as player_response:
-                if player_response.status == 200:
-                    player_html = await player_response.text()
-
-                    match = re.search(
-                        r'file\s*:\s*"([^"]+\.m3u8[^"]*)"', player_html)
-                    if not match:
-                        match = re.search(r'file\s*:\s*"([^"]+)"', player_html)
-
-                    if match:
-                        final_stream_url = match.group(1)
-                        print(
-                            f"get_streams: Крок 3 -> Знайдено фінальний URL: {final_stream_url}")
-                    else:
-                        print(
-                            f"Не вдалося знайти 'file:\"...\"' в HTML плеєра: {player_page_url}")
-                else:
-                    print(
-                        f"Помилка завантаження сторінки плеєра {player_page_url}. Статус: {player_response.status}")
+            player_html = await upstream.fetch_text(session, player_page_url, headers=player_headers)
+
+            final_stream_url = extract_stream_url(player_html)
+            if final_stream_url:
+                logger.debug(
+                    "get_streams: Крок 3 -> Знайдено фінальний URL: %s", final_stream_url)
+            else:
+                logger.warning(
+                    f"Не вдалося знайти 'file:\"...\"' в HTML плеєра: {player_page_url}")
         else:
-            print(f"URL сторінки плеєра не знайдено для {video_id}")
+            logger.warning(f"URL сторінки плеєра не знайдено для {video_id}")
 
         # --- Крок 4: Додаємо фінальний стрім до результату ---
         if final_stream_url:
@@ -417,13 +688,15 @@ async def get_streams(type_: str, video_id: str, session: aiohttp.ClientSession)
                 Stream(name=stream_name_prefix, url=final_stream_url)
             )
         else:
-            print(f"Фінальний URL стріму не знайдено для {video_id}")
+            logger.warning(f"Фінальний URL стріму не знайдено для {video_id}")
 
+    except workers.ParsePoolFull:
+        raise
     except aiohttp.ClientError as e:
-        print(
+        logger.warning(
             f"Помилка HTTP при отриманні інформації про стрім для {video_id}: {e}")
-    except Exception as e:
-        print(
-            f"Неочікувана помилка при отриманні інформації про стрім для {video_id}: {e}")
+    except Exception:
+        logger.warning(
+            f"Неочікувана помилка при отриманні інформації про стрім для {video_id}", exc_info=True)
 
     return streams
@@ -1,10 +1,33 @@
-from pydantic_settings import BaseSettings
+from pydantic_settings import SettingsConfigDict
 
+from app.upstream import UpstreamSettings
+
+
+class Settings(UpstreamSettings):
+    # UAKINO_POOL_LIMIT, UAKINO_WARMUP, ... so each provider is tuned on its own
+    model_config = SettingsConfigDict(env_prefix="UAKINO_")
 
-class Settings(BaseSettings):
     name: str = "UAKino"
     main_url: str = "https://uakino.me"
+    # Bump to drop every cached response of this provider
+    cache_version: int = 2
+    # How long an expired catalog/meta entry is still served while it refreshes
+    stale_ttl: int = 7 * 24 * 60 * 60
+    # Stored series metas older than this get their episode list re-fetched
+    meta_refresh: int = 6 * 60 * 60
+    # Stored detail page data (titles, posters, player links) is re-scraped after this
+    page_refresh: int = 30 * 24 * 60 * 60
     items_per_page: int = 20
+    # Referer the player CDN expects when streams go through the proxy
+    stream_referer: str = "https://ashdi.vip/"
+    # Series lookups kept in memory: the data-news_id of a page never
+    # changes, episode playlists are refreshed hourly
+    playlist_cache_size: int = 1024
+    playlist_ttl: int = 60 * 60
+    news_id_ttl: int = 7 * 24 * 60 * 60
+    # Other season pages of a series crawled at once, and how long the meta waits for them
+    season_concurrency: int = 4
+    season_deadline: float = 10
 
 
 settings = Settings()
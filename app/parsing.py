@@ -0,0 +1,45 @@
+import logging
+import threading
+import time
+from functools import cache
+
+from bs4 import BeautifulSoup
+from bs4.builder import builder_registry
+
+from .settings import settings
+
+logger = logging.getLogger(__name__)
+
+FALLBACK_BACKEND = "html.parser"
+
+
+def available_backends() -> list[str]:
+    return [name for name in ("lxml", "html5lib", "html.parser") if builder_registry.lookup(name)]
+
+
+@cache
+def _resolve(backend: str) -> str:
+    if builder_registry.lookup(backend):
+        return backend
+    logger.warning(f"HTML parser backend {backend!r} is not installed, using {FALLBACK_BACKEND!r}")
+    return FALLBACK_BACKEND
+
+
+# Time spent building trees in the current thread, read by the parse pool
+_clock = threading.local()
+
+
+def reset_soup_seconds():
+    _clock.seconds = 0.0
+
+
+def soup_seconds() -> float:
+    return getattr(_clock, "seconds", 0.0)
+
+
+def make_soup(markup: str, backend: str | None = None) -> BeautifulSoup:
+    """Parse HTML with the configured backend (`HTML_PARSER` setting)."""
+    started = time.perf_counter()
+    soup = BeautifulSoup(markup, _resolve(backend or settings.html_parser))
+    _clock.seconds = soup_seconds() + time.perf_counter() - started
+    return soup
@@ -0,0 +1,144 @@
+import asyncio
+import importlib
+import logging
+import sys
+from dataclasses import dataclass, field
+from importlib.metadata import entry_points
+from typing import Iterable, Optional
+
+from fastapi import APIRouter, FastAPI
+from starlette.routing import BaseRoute, Match, NoMatchFound, get_route_path
+from starlette.types import Receive, Scope, Send
+
+from .settings import Settings
+
+logger = logging.getLogger(__name__)
+
+# Providers shipped with the app. Third-party packages add their own through
+# the "stremio_uk.providers" entry point group: `name = "package.module"`,
+# where the module defines `router` with the `/{name}` prefix
+BUILTIN = {
+    "tv": "app.parsers.tv.api",
+    "eneyida": "app.parsers.eneyida.api",
+    "uakino": "app.parsers.uakino.api",
+}
+ENTRY_POINT_GROUP = "stremio_uk.providers"
+
+
+@dataclass
+class Provider:
+    name: str
+    module: str
+    router: Optional[APIRouter] = None
+    _lock: asyncio.Lock = field(default_factory=asyncio.Lock, repr=False)
+
+    @property
+    def loaded(self) -> bool:
+        return self.router is not None
+
+
+def discover() -> dict[str, str]:
+    """Provider name -> module of its API router, built-ins first."""
+    modules = dict(BUILTIN)
+    for entry_point in entry_points(group=ENTRY_POINT_GROUP):
+        modules.setdefault(entry_point.name, entry_point.value)
+    return modules
+
+
+class _LazyRoute(BaseRoute):
+    """Catches every request under a provider prefix until the provider is loaded."""
+
+    def __init__(self, registry: "Registry", provider: Provider):
+        self.registry = registry
+        self.provider = provider
+        self.prefix = f"/{provider.name}"
+
+    def matches(self, scope: Scope) -> tuple[Match, Scope]:
+        if scope["type"] == "http":
+            path = get_route_path(scope)
+            if path == self.prefix or path.startswith(f"{self.prefix}/"):
+                return Match.FULL, {}
+        return Match.NONE, {}
+
+    def url_path_for(self, name: str, /, **path_params):
+        raise NoMatchFound(name, path_params)
+
+    async def handle(self, scope: Scope, receive: Receive, send: Send):
+        await self.registry.load(self.provider.name)
+        # The provider's own routes have replaced this one now
+        await scope["router"].app(scope, receive, send)
+
+
+class Registry:
+    """Mounts the enabled providers on the app and imports each one on demand.
+
+    A provider's modules (its parsers, BeautifulSoup, the aiohttp client) are
+    only imported once the first request for it arrives, or when the cache
+    warm-up crawls it.
+    """
+
+    def __init__(self, modules: dict[str, str]):
+        self.providers = {name: Provider(name, module) for name, module in modules.items()}
+        self.app: Optional[FastAPI] = None
+
+    def install(self, app: FastAPI):
+        self.app = app
+        for provider in self.providers.values():
+            app.router.routes.append(_LazyRoute(self, provider))
+
+    def _import(self, provider: Provider) -> APIRouter:
+        module = importlib.import_module(provider.module)
+        router = getattr(module, "router", None)
+        if not isinstance(router, APIRouter):
+            raise TypeError(f"{provider.module} has no APIRouter named `router`")
+        return router
+
+    async def load(self, name: str) -> APIRouter:
+        provider = self.providers[name]
+        async with provider._lock:
+            if provider.router is None:
+                # Importing a provider takes a while, other providers keep serving
+                router = await asyncio.to_thread(self._import, provider)
+                self.app.router.routes[:] = [
+                    route
+                    for route in self.app.router.routes
+                    if not (isinstance(route, _LazyRoute) and route.provider is provider)
+                ]
+                self.app.include_router(router)
+                self.app.openapi_schema = None
+                provider.router = router
+                await _open_session(name)
+                logger.info(f"Loaded provider {name} from {provider.module}")
+        return provider.router
+
+    async def load_all(self, names: Optional[Iterable[str]] = None):
+        """Loads `names` (the known ones among them), every provider by default."""
+        names = self.providers if names is None else [name for name in names if name in self.providers]
+        await asyncio.gather(*(self.load(name) for name in names))
+
+    def loaded(self) -> list[str]:
+        return [name for name, provider in self.providers.items() if provider.loaded]
+
+
+async def _open_session(name: str):
+    # Only scraping providers pull in the shared client pool, each under its own name
+    upstream = sys.modules.get("app.upstream")
+    if upstream is not None:
+        await upstream.open_sessions([name])
+
+
+async def close_sessions():
+    upstream = sys.modules.get("app.upstream")
+    if upstream is not None:
+        await upstream.close_sessions()
+
+
+def create_registry(settings: Settings) -> Registry:
+    modules = discover()
+    unknown = set(settings.providers_enabled or []) - modules.keys()
+    if unknown:
+        raise ValueError(f"Unknown providers: {', '.join(sorted(unknown))}")
+    enabled = settings.providers_enabled or list(modules)
+    return Registry(
+        {name: modules[name] for name in enabled if name not in settings.providers_disabled}
+    )
@@ -9,6 +9,8 @@ class Preview(BaseModel):
     genres: list[str]
     poster: Optional[str] = None
     description: str
+    # Year shown under the title
+    releaseInfo: Optional[str] = None
 
 
 class Videos(BaseModel):
@@ -0,0 +1,239 @@
+import asyncio
+import logging
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Iterable, Optional
+
+from . import metrics
+from .db import connect
+from .schemas import Preview
+from .settings import settings
+
+logger = logging.getLogger(__name__)
+
+APOSTROPHES = re.compile(r"['`´‘’ʹʻʼ]")
+# Letters typed one for another: Russian layouts, missing keys, и/і confusion
+FOLD = str.maketrans({"і": "и", "є": "е", "ґ": "г", "ы": "и", "э": "е", "ъ": None})
+# KMU 2010 romanization, without the word-initial forms (є, ї, й, ю, я)
+LATIN = str.maketrans(
+    {
+        "а": "a", "б": "b", "в": "v", "г": "h", "ґ": "g", "д": "d", "е": "e", "є": "ie",
+        "ж": "zh", "з": "z", "и": "y", "і": "i", "ї": "i", "й": "i", "к": "k", "л": "l",
+        "м": "m", "н": "n", "о": "o", "п": "p", "р": "r", "с": "s", "т": "t", "у": "u",
+        "ф": "f", "х": "kh", "ц": "ts", "ч": "ch", "ш": "sh", "щ": "shch", "ь": None,
+        "ю": "iu", "я": "ia", "ё": "e", "ы": "y", "э": "e", "ъ": None,
+    }
+)
+
+
+def _strip_marks(text: str) -> str:
+    # Also turns й into и and ї into і, both sides of a match go through this
+    return "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+
+
+def normalize(text: str) -> str:
+    """Case and spelling folded form of `text` as stored in and matched against the index."""
+    text = APOSTROPHES.sub("", text.casefold())
+    return unicodedata.normalize("NFC", _strip_marks(text)).translate(FOLD)
+
+
+def transliterate(text: str) -> str:
+    text = APOSTROPHES.sub("", text.casefold())
+    return _strip_marks(text.translate(LATIN))
+
+
+def tags(preview: Preview) -> list[str]:
+    """Browsable tags of a title: `genre:{name}` and `year:{year}`."""
+    found = [f"genre:{genre.strip()}" for genre in preview.genres if genre.strip()]
+    if preview.releaseInfo and preview.releaseInfo[:4].isdigit():
+        found.append(f"year:{preview.releaseInfo[:4]}")
+    return found
+
+
+class SearchIndex:
+    """Full-text index of the titles seen in catalogs and metas, in SQLite FTS5.
+
+    Names are stored normalized and romanized, so "Відьмак", "видьмак",
+    "vidmak" and "ВІДЬМАК" all find the same title. `path` may be ":memory:".
+
+    Next to it every title has tags (`genre:Драма`, `year:2024` and the
+    `catalog:{id}` lists it was seen in), kept as posting lists clustered by
+    tag, so filtered catalogs are answered without asking the site.
+
+    Queries run in worker threads, one at a time, off the event loop.
+    """
+
+    def __init__(self, path: str, limit: int = 50):
+        self.path = path
+        self.limit = limit
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        if self._db is None:
+            self._db = connect(
+                self.path,
+                """
+                CREATE TABLE IF NOT EXISTS items (
+                    rowid INTEGER PRIMARY KEY,
+                    provider TEXT NOT NULL,
+                    id TEXT NOT NULL,
+                    type TEXT NOT NULL,
+                    preview TEXT NOT NULL,
+                    updated REAL NOT NULL,
+                    UNIQUE (provider, id)
+                );
+                CREATE VIRTUAL TABLE IF NOT EXISTS titles USING fts5(
+                    name, latin, tokenize = "unicode61 remove_diacritics 2"
+                );
+                CREATE TABLE IF NOT EXISTS tags (
+                    tag TEXT NOT NULL,
+                    item INTEGER NOT NULL,
+                    PRIMARY KEY (tag, item)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS tags_item ON tags (item);
+                """,
+            )
+        return self._db
+
+    async def add(self, provider: str, previews: Iterable[Preview], replace: bool = True, catalog: Optional[str] = None):
+        """Indexes `previews`, keeping what is already there for a title unless `replace`.
+
+        `catalog` tags them as listed in that catalog.
+        """
+        await asyncio.to_thread(self._add, provider, list(previews), replace, catalog)
+
+    def _add(self, provider: str, previews: list[Preview], replace: bool, catalog: Optional[str]):
+        conflict = (
+            "DO UPDATE SET type = excluded.type, preview = excluded.preview, updated = excluded.updated"
+            if replace
+            else "DO NOTHING"
+        )
+        now = time.time()
+        fields = set(Preview.model_fields)
+        with self._lock, metrics.timed("index"):
+            try:
+                db = self.db
+                db.execute("BEGIN")
+            except sqlite3.Error:
+                # The index is only an accelerator, never fail the response that feeds it
+                logger.warning(f"Search index at {self.path} is unavailable", exc_info=True)
+                return
+            try:
+                for preview in previews:
+                    row = db.execute(
+                        "INSERT INTO items (provider, id, type, preview, updated) VALUES (?, ?, ?, ?, ?) "
+                        f"ON CONFLICT (provider, id) {conflict} RETURNING rowid",
+                        (provider, preview.id, preview.type, preview.model_dump_json(include=fields), now),
+                    ).fetchone()
+                    if row is None:
+                        continue
+                    db.execute("DELETE FROM titles WHERE rowid = ?", row)
+                    db.execute(
+                        "INSERT INTO titles (rowid, name, latin) VALUES (?, ?, ?)",
+                        (row[0], normalize(preview.name), transliterate(preview.name)),
+                    )
+                    self._tag(db, row[0], preview, catalog)
+                db.execute("COMMIT")
+            except sqlite3.Error:
+                db.execute("ROLLBACK")
+                logger.warning(f"Indexing {provider} titles failed", exc_info=True)
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+
+    @staticmethod
+    def _tag(db: sqlite3.Connection, item: int, preview: Preview, catalog: Optional[str]):
+        new = tags(preview)
+        # Catalog cards often lack what the meta had (eneyida lists no genres),
+        # so only the kinds of tags a preview brings replace the stored ones
+        for kind in {tag.split(":", 1)[0] for tag in new}:
+            db.execute("DELETE FROM tags WHERE item = ? AND tag GLOB ?", (item, f"{kind}:*"))
+        if catalog is not None:
+            new.append(f"catalog:{catalog}")
+        db.executemany("INSERT OR IGNORE INTO tags (tag, item) VALUES (?, ?)", [(tag, item) for tag in new])
+
+    async def search(self, provider: str, query: str, type_: Optional[str] = None) -> list[Preview]:
+        return await asyncio.to_thread(self._search, provider, query, type_)
+
+    def _search(self, provider: str, query: str, type_: Optional[str]) -> list[Preview]:
+        words = [f'"{word}"*' for word in re.findall(r"\w+", normalize(query))]
+        latin = [f'"{word}"*' for word in re.findall(r"\w+", transliterate(query))]
+        if not words:
+            return []
+        # Cyrillic queries match the names, Latin ones the names or their romanization
+        match = f"name : ({' AND '.join(words)}) OR latin : ({' AND '.join(latin)})"
+        sql = (
+            "SELECT items.preview FROM titles JOIN items ON items.rowid = titles.rowid "
+            "WHERE titles MATCH ? AND items.provider = ?"
+        )
+        params: list = [match, provider]
+        if type_ is not None:
+            sql += " AND items.type = ?"
+            params.append(type_)
+        sql += " ORDER BY bm25(titles) LIMIT ?"
+        params.append(self.limit)
+        with self._lock, metrics.timed("search"):
+            rows = self.db.execute(sql, params).fetchall()
+        return [Preview.model_validate_json(preview) for preview, in rows]
+
+    def count(self, provider: str) -> int:
+        with self._lock:
+            return self.db.execute("SELECT count(*) FROM items WHERE provider = ?", (provider,)).fetchone()[0]
+
+    async def browse(
+        self, provider: str, tags: list[str], type_: Optional[str] = None, skip: int = 0, limit: int = 20
+    ) -> list[Preview]:
+        """Titles carrying every one of `tags`, newest first."""
+        return await asyncio.to_thread(self._browse, provider, tags, type_, skip, limit)
+
+    def _browse(self, provider: str, tags: list[str], type_: Optional[str], skip: int, limit: int) -> list[Preview]:
+        sql = "SELECT preview FROM items WHERE provider = ?"
+        params: list = [provider]
+        if tags:
+            # Intersection of the posting lists, each one a range scan of the primary key
+            sql += f" AND rowid IN ({' INTERSECT '.join(['SELECT item FROM tags WHERE tag = ?'] * len(tags))})"
+            params.extend(tags)
+        if type_ is not None:
+            sql += " AND type = ?"
+            params.append(type_)
+        # By the year tag, which outlives previews that come without one
+        sql += (
+            " ORDER BY (SELECT max(tag) FROM tags WHERE item = items.rowid AND tag GLOB 'year:*') DESC,"
+            " updated DESC, rowid LIMIT ? OFFSET ?"
+        )
+        params.extend([limit, skip])
+        with self._lock, metrics.timed("browse"):
+            rows = self.db.execute(sql, params).fetchall()
+        return [Preview.model_validate_json(preview) for preview, in rows]
+
+    async def tag_values(self, provider: str, kind: str, within: Optional[str] = None, limit: int = 100) -> list[str]:
+        """Values of the `kind` tags of a provider's titles (those tagged `within`), most used first."""
+        return await asyncio.to_thread(self._tag_values, provider, kind, within, limit)
+
+    def _tag_values(self, provider: str, kind: str, within: Optional[str], limit: int) -> list[str]:
+        sql = (
+            "SELECT substr(tags.tag, ?) AS value FROM tags JOIN items ON items.rowid = tags.item "
+            "WHERE tags.tag GLOB ? AND items.provider = ?"
+        )
+        params: list = [len(kind) + 2, f"{kind}:*", provider]
+        if within is not None:
+            sql += " AND tags.item IN (SELECT item FROM tags WHERE tag = ?)"
+            params.append(within)
+        sql += " GROUP BY tags.tag ORDER BY count(*) DESC, value LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            return [value for value, in self.db.execute(sql, params).fetchall()]
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+index = SearchIndex(settings.search_index_path, settings.search_limit)
@@ -0,0 +1,89 @@
+from pydantic_settings import BaseSettings
+
+
+class Settings(BaseSettings):
+    # BeautifulSoup tree builder used by every provider: "lxml", "html.parser" or "html5lib"
+    html_parser: str = "lxml"
+
+    # Providers to serve, empty for every built-in and installed one
+    providers_enabled: list[str] = []
+    providers_disabled: list[str] = []
+    # Import every provider on startup instead of on its first request
+    providers_eager: bool = False
+
+    redis_url: str = "redis://localhost"
+    # Seconds to keep serving from memory only after Redis fails
+    redis_retry_interval: float = 30
+    memory_cache_max_entries: int = 2048
+    memory_cache_max_bytes: int = 64 * 1024 * 1024
+    # Upper bound for how long an entry lives in the in-process tier
+    memory_cache_ttl: int = 5 * 60
+    # "lru" or "fifo"
+    memory_cache_eviction: str = "lru"
+
+    # Where HTML parsing runs: "thread", "process" or "inline" (on the event loop)
+    parse_pool: str = "thread"
+    parse_pool_size: int = 4
+    # Parse jobs allowed to wait for a free worker before requests get a 503
+    parse_queue_limit: int = 64
+
+    log_level: str = "INFO"
+    # Per provider (or full logger name) overrides, e.g. {"uakino": "DEBUG"}
+    log_levels: dict[str, str] = {}
+    # "json" (one object per line) or "text"
+    log_format: str = "json"
+    # Share of high-volume debug events (player scripts, playlists) that are kept
+    log_sample_rate: float = 0.01
+    # Longer messages and fields are cut to this many characters
+    log_payload_limit: int = 2000
+
+    # Responses smaller than this many bytes go out uncompressed
+    compression_minimum_size: int = 500
+
+    # SQLite file keeping scraped metas, pages and playlists across restarts
+    store_path: str = "metadata.db"
+
+    # SQLite file of the local search index, ":memory:" to keep it per process
+    search_index_path: str = "search.db"
+    search_limit: int = 50
+
+    # Probe stream URLs in the background and order streams by the results
+    health_enabled: bool = True
+    health_interval: float = 5 * 60
+    health_timeout: float = 3
+    health_concurrency: int = 8
+    # Resolved provider stream URLs are probed this long after they were last served
+    health_watch_ttl: int = 60 * 60
+    health_max_watched: int = 1024
+    # Leave out streams whose last probe failed, as long as others work
+    health_drop_dead: bool = False
+
+    # Serve HLS streams through /proxy with the headers their CDNs expect
+    proxy_enabled: bool = False
+    # Public URL of this server for proxied links, the request's own by default
+    proxy_base_url: str = ""
+    # Signs proxied links; set it when several workers serve the same clients
+    proxy_secret: str = ""
+    # Live playlists change every few seconds, VOD ones never
+    proxy_playlist_ttl: float = 2
+    proxy_vod_playlist_ttl: float = 5 * 60
+    # Upstream requests in flight per stream, the rest wait up to the timeout and then get a 503
+    proxy_stream_concurrency: int = 6
+    proxy_queue_timeout: float = 10
+    proxy_chunk_size: int = 64 * 1024
+
+    # Crawl the first pages of the loaded providers' catalogs on startup and then periodically
+    warmup_enabled: bool = True
+    # Providers loaded for warm-up before any request asked for them; the
+    # others are warmed once in use, so memory still follows the traffic
+    warmup_providers: list[str] = []
+    warmup_pages: int = 2
+    warmup_interval: int = 6 * 60 * 60
+    warmup_concurrency: int = 4
+    # Random delay of up to this many seconds before each warm-up request
+    warmup_jitter: float = 5
+    # Also prefetch meta for this many top items of each page, 0 to disable
+    warmup_meta_items: int = 0
+
+
+settings = Settings()
@@ -0,0 +1,57 @@
+import asyncio
+import logging
+from collections.abc import Awaitable, Callable, Hashable
+from typing import Any
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """Collapses concurrent calls with the same key into one in-flight call.
+
+    The first caller starts the work in its own task; everyone arriving while
+    it runs awaits the same task. A cancelled caller does not cancel the work
+    for the others.
+
+    Counts are exported per `name` as the `stremio_singleflight_*` metrics.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0
+        self.collapsed = 0
+        self._inflight: dict[Hashable, asyncio.Task] = {}
+        self._started = metrics.SINGLEFLIGHT.labels(name, "started")
+        self._collapsed = metrics.SINGLEFLIGHT.labels(name, "collapsed")
+        metrics.SINGLEFLIGHT_INFLIGHT.labels(name).set_function(lambda: len(self._inflight))
+
+    async def do(self, key: Hashable, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        task = self._inflight.get(key)
+        if task is not None and not task.done():
+            self.collapsed += 1
+            self._collapsed.inc()
+            logger.debug(f"{self.name}: joined in-flight call for {key!r}")
+            return await asyncio.shield(task)
+
+        self.calls += 1
+        self._started.inc()
+        task = asyncio.ensure_future(fn(*args, **kwargs))
+        self._inflight[key] = task
+        task.add_done_callback(lambda _: self._forget(key, task))
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Retrieve the exception so an unawaited failure is not reported twice
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "calls": self.calls,
+            "collapsed": self.collapsed,
+            "inflight": len(self._inflight),
+        }
@@ -0,0 +1,107 @@
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from functools import cache
+from typing import Any, Generic, Optional, TypeVar
+
+from pydantic import TypeAdapter
+
+from .db import connect
+from .settings import settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+@cache
+def _adapter(type_: Any) -> TypeAdapter:
+    return TypeAdapter(type_)
+
+
+@dataclass(frozen=True)
+class Record(Generic[T]):
+    value: T
+    fetched: float
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.fetched
+
+
+class MetadataStore:
+    """Scraped data kept across restarts and cache flushes, in SQLite.
+
+    Values are keyed by provider, kind ("meta", "page", "episodes", ...)
+    and id, stored as JSON with the time they were fetched. Whether a record
+    is still good enough is up to the caller, see `Record.age`. Failures are
+    logged and treated as a miss, the sites are always there to fall back to.
+    Reads and writes run in worker threads, one at a time, off the event loop.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        if self._db is None:
+            self._db = connect(
+                self.path,
+                """
+                CREATE TABLE IF NOT EXISTS records (
+                    provider TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    id TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    fetched REAL NOT NULL,
+                    PRIMARY KEY (provider, kind, id)
+                ) WITHOUT ROWID;
+                """,
+            )
+        return self._db
+
+    async def get(self, provider: str, kind: str, id: str, type_: type[T]) -> Optional[Record[T]]:
+        return await asyncio.to_thread(self._get, provider, kind, id, type_)
+
+    def _get(self, provider: str, kind: str, id: str, type_: type[T]) -> Optional[Record[T]]:
+        try:
+            with self._lock:
+                row = self.db.execute(
+                    "SELECT value, fetched FROM records WHERE provider = ? AND kind = ? AND id = ?",
+                    (provider, kind, id),
+                ).fetchone()
+            if row is None:
+                return None
+            return Record(_adapter(type_).validate_json(row[0]), row[1])
+        except Exception:
+            # Unreadable or written by an older version of the model
+            logger.warning(f"Reading {provider} {kind} {id} from the metadata store failed", exc_info=True)
+            return None
+
+    async def put(self, provider: str, kind: str, id: str, value: Any, type_: Optional[Any] = None):
+        await asyncio.to_thread(self._put, provider, kind, id, value, type_)
+
+    def _put(self, provider: str, kind: str, id: str, value: Any, type_: Optional[Any]):
+        try:
+            data = _adapter(type_ or type(value)).dump_json(value).decode()
+            with self._lock:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO records (provider, kind, id, value, fetched) VALUES (?, ?, ?, ?, ?)",
+                    (provider, kind, id, data, time.time()),
+                )
+        except Exception:
+            logger.warning(f"Writing {provider} {kind} {id} to the metadata store failed", exc_info=True)
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+metadata = MetadataStore(settings.store_path)
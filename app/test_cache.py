@@ -0,0 +1,258 @@
+import asyncio
+from typing import Optional
+
+import httpx
+from fastapi import FastAPI
+from fastapi_cache import FastAPICache
+from fastapi_cache.backends.inmemory import InMemoryBackend
+from fastapi_cache.decorator import cache
+
+from app.cache import Entry, Uncacheable, StatsBackend, cache_swr, cache_until, key_builder, namespace, stats
+from app.compression import CompressionMiddleware, negotiate
+from app.expiry import expires_at, streams_expire
+from app import metrics, serialization
+from app.schemas import Series, Stream, Videos
+
+
+async def addon_search(query: str, skip: int = 0, session: object = None) -> dict:
+    return {"query": query}
+
+
+def test_key_ignores_injected_dependencies():
+    first = key_builder(addon_search, "stremio-cache:eneyida:v1", args=(), kwargs={"query": "Аркейн", "session": object()})
+    second = key_builder(addon_search, "stremio-cache:eneyida:v1", args=(), kwargs={"query": "Аркейн", "session": object()})
+    assert first == second
+    assert first == "stremio-cache:eneyida:v1:app.test_cache.addon_search:query=аркейн&skip=0"
+
+
+def test_key_is_the_same_however_the_arguments_are_passed():
+    async def addon_catalog(type_: str, id: str, skip: int = 0) -> dict:
+        return {}
+
+    keys = {
+        key_builder(addon_catalog, "ns", args=args, kwargs=kwargs)
+        for args, kwargs in [
+            ((), {"type_": "movie", "id": "films"}),
+            (("movie", "films"), {}),
+            (("movie",), {"id": "films", "skip": 0}),
+        ]
+    }
+    assert len(keys) == 1
+    assert keys.pop().endswith("addon_catalog:id=films&skip=0&type_=movie")
+    assert key_builder(addon_catalog, "ns", args=("movie", "films", 24), kwargs={}).endswith("skip=24&type_=movie")
+
+
+def test_key_normalizes_search_query():
+    keys = {
+        key_builder(addon_search, "ns", args=(), kwargs={"query": query, "skip": 0})
+        for query in ["Аркейн", "  аркейн ", "АРКЕЙН"]
+    }
+    assert len(keys) == 1
+
+
+def test_repeated_requests_hit_the_cache():
+    FastAPICache.reset()
+    FastAPICache.init(StatsBackend(InMemoryBackend()), prefix="test", key_builder=key_builder)
+    cached_search = cache(expire=60, namespace=namespace("stats", 1))(addon_search)
+
+    async def main():
+        for _ in range(4):
+            await cached_search(query="Аркейн ", session=object())
+
+    try:
+        asyncio.run(main())
+    finally:
+        FastAPICache.reset()
+
+    assert stats.misses["stats"] == 1
+    assert stats.hits["stats"] == 3
+    assert stats.hit_ratio("stats") == 0.75
+    assert stats.routes["stats.addon_search"].hits == 3
+    assert metrics.CACHE_LOOKUPS.labels("stats", "addon_search", "hit")._value.get() == 3
+    assert metrics.CACHE_LOOKUPS.labels("stats", "addon_search", "miss")._value.get() == 1
+
+
+def test_stale_entries_are_served_while_one_refresh_runs(monkeypatch):
+    FastAPICache.reset()
+    FastAPICache.init(InMemoryBackend(), prefix="test", key_builder=key_builder)
+    now = [1000.0]
+    monkeypatch.setattr("app.cache.time.time", lambda: now[0])
+    scrapes = []
+
+    @cache_swr(expire=60, stale=600, namespace=namespace("swr", 1))
+    async def addon_catalog(type_: str) -> dict:
+        scrapes.append(now[0])
+        await asyncio.sleep(0.01)
+        return {"metas": [len(scrapes)]}
+
+    async def main():
+        first = await addon_catalog(type_="movie")
+        now[0] += 120
+        stale = await asyncio.gather(*(addon_catalog(type_="movie") for _ in range(5)))
+        await asyncio.sleep(0.05)
+        return first, stale, await addon_catalog(type_="movie")
+
+    try:
+        first, stale, refreshed = asyncio.run(main())
+    finally:
+        FastAPICache.reset()
+
+    assert first == {"metas": [1]}
+    assert stale == [{"metas": [1]}] * 5
+    assert refreshed == {"metas": [2]}
+    assert len(scrapes) == 2
+
+
+def test_refresh_recomputes_a_fresh_entry():
+    FastAPICache.reset()
+    FastAPICache.init(InMemoryBackend(), prefix="test", key_builder=key_builder)
+    scrapes = []
+
+    @cache_swr(expire=60, stale=600, namespace=namespace("warm", 1))
+    async def addon_catalog(type_: str, session: object = None) -> dict:
+        scrapes.append(type_)
+        return {"metas": [len(scrapes)]}
+
+    async def main():
+        await addon_catalog(type_="movie", session=object())
+        await addon_catalog.refresh(type_="movie", session=object())
+        return await addon_catalog(type_="movie", session=object())
+
+    try:
+        assert asyncio.run(main()) == {"metas": [2]}
+    finally:
+        FastAPICache.reset()
+    assert scrapes == ["movie", "movie"]
+
+
+def test_uncacheable_results_are_served_but_not_stored():
+    FastAPICache.reset()
+    FastAPICache.init(InMemoryBackend(), prefix="test", key_builder=key_builder)
+    scrapes = []
+
+    @cache_swr(expire=60, stale=600, namespace=namespace("partial", 1))
+    async def addon_meta(id: str) -> dict:
+        scrapes.append(id)
+        if len(scrapes) == 1:
+            raise Uncacheable({"meta": "partial"})
+        return {"meta": "complete"}
+
+    async def main():
+        return [await addon_meta(id="tt1") for _ in range(3)]
+
+    try:
+        assert asyncio.run(main()) == [{"meta": "partial"}, {"meta": "complete"}, {"meta": "complete"}]
+    finally:
+        FastAPICache.reset()
+    assert scrapes == ["tt1", "tt1"]
+
+
+def test_links_are_resolved_again_before_they_expire(monkeypatch):
+    FastAPICache.reset()
+    FastAPICache.init(InMemoryBackend(), prefix="test", key_builder=key_builder)
+    now = [1_800_000_000.0]
+    monkeypatch.setattr("app.cache.time.time", lambda: now[0])
+    resolves = []
+
+    @cache_until(expire=6 * 60 * 60, expires=streams_expire, namespace=namespace("expiry", 1))
+    async def resolve_streams(id: str, lifetime: Optional[int]) -> dict:
+        resolves.append(now[0])
+        if lifetime is None:
+            return {"streams": []}
+        url = f"https://cdn/hls/index.m3u8?token=abc&expires={int(now[0]) + lifetime}"
+        return {"streams": [Stream(name="HLS", url=url)]}
+
+    async def main():
+        first = await resolve_streams(id="1", lifetime=1000)
+        key = key_builder(resolve_streams, f"test:{namespace('expiry', 1)}", args=(), kwargs={"id": "1", "lifetime": 1000})
+        ttl, _ = await FastAPICache.get_backend().get_with_ttl(key)
+        now[0] += 800
+        # Close to expiry: still served while resolved again in the background
+        ahead = await resolve_streams(id="1", lifetime=1000)
+        await asyncio.sleep(0.01)
+        renewed = await resolve_streams(id="1", lifetime=1000)
+        # Links that are already about to die are not cached at all
+        for _ in range(2):
+            await resolve_streams(id="2", lifetime=30)
+        # Neither are failed resolves, whatever the cap
+        for _ in range(2):
+            await resolve_streams(id="3", lifetime=None)
+        return first, ttl, ahead, renewed
+
+    try:
+        first, ttl, ahead, renewed = asyncio.run(main())
+    finally:
+        FastAPICache.reset()
+
+    assert ttl == 1000 - 60
+    assert ahead["streams"][0]["url"] == first["streams"][0].url
+    assert renewed["streams"][0]["url"].endswith(f"expires={1_800_000_000 + 800 + 1000}")
+    assert len(resolves) == 6
+
+
+def test_expiry_is_read_from_signed_urls():
+    now = 1_800_000_000
+    assert expires_at("https://s1.ashdi.vip/hls/index.m3u8?token=abc&expires=1893456000", now) == 1893456000
+    assert expires_at("https://cdn/index.m3u8?Expires=1800000600000", now) == now + 600
+    assert expires_at("https://cdn/index.m3u8?ttl=300", now) == now + 300
+    assert expires_at("https://cdn/index.m3u8?hdnts=st=1799999000~exp=1800003600~hmac=ff", now) == now + 3600
+    assert expires_at(f"https://cdn/s/ab12cd/{now + 7200}/index.m3u8", now) == now + 7200
+    # Ten digit ids and dates far off are not expiries
+    assert expires_at("https://cdn/video/1234567890/index.m3u8", now) is None
+    assert expires_at("https://cdn/index.m3u8", now) is None
+
+
+def test_hits_are_sent_compressed_as_stored():
+    FastAPICache.reset()
+    FastAPICache.init(InMemoryBackend(), prefix="test", key_builder=key_builder)
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware)
+    scrapes = []
+
+    @app.get("/meta/{id}.json")
+    @cache_swr(expire=60, stale=600, namespace=namespace("gzip", 1))
+    async def addon_meta(id: str) -> dict:
+        scrapes.append(id)
+        return {"meta": {"id": id, "videos": [{"id": f"{id}:{n}", "title": f"Серія {n}"} for n in range(300)]}}
+
+    async def main():
+        transport = httpx.ASGITransport(app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            miss = await client.get("/meta/1.json", headers={"Accept-Encoding": "gzip"})
+            hit = await client.get("/meta/1.json", headers={"Accept-Encoding": "br;q=0.5, gzip"})
+            plain = await client.get("/meta/1.json", headers={"Accept-Encoding": "identity"})
+            stored = Entry.unpack(await FastAPICache.get_backend().get(
+                key_builder(addon_meta, f"test:{namespace('gzip', 1)}", args=(), kwargs={"id": "1"})
+            ))
+        return miss, hit, plain, stored
+
+    try:
+        miss, hit, plain, stored = asyncio.run(main())
+    finally:
+        FastAPICache.reset()
+
+    assert scrapes == ["1"]
+    assert miss.headers["content-encoding"] == hit.headers["content-encoding"] == stored.encoding == "gzip"
+    assert int(hit.headers["content-length"]) == len(stored.body)
+    assert "content-encoding" not in plain.headers
+    assert hit.headers["vary"] == plain.headers["vary"] == "Accept-Encoding"
+    assert miss.json() == hit.json() == plain.json()
+    assert len(hit.json()["meta"]["videos"]) == 300
+    assert len(stored.body) < len(plain.content) / 5
+
+
+def test_encoding_negotiation():
+    assert negotiate("gzip, deflate, br", ["zstd", "br", "gzip"]) == "br"
+    assert negotiate("gzip;q=1.0, br;q=0.5", ["br", "gzip"]) == "gzip"
+    assert negotiate("*", ["zstd", "gzip"]) == "zstd"
+    assert negotiate("gzip;q=0, identity", ["gzip"]) is None
+    assert negotiate("", ["gzip"]) is None
+
+
+def test_entries_encode_the_same_with_or_without_orjson(monkeypatch):
+    value = {"meta": Series(id="tt1", type="series", name="Аркейн", genres=["Анімація"], description="", director=[],
+                            background="", videos=[Videos(id="tt1/1/1", title="Серія 1", season=1, episode=1)])}
+    fast = serialization.dumps(value)
+    monkeypatch.setattr(serialization, "orjson", None)
+    assert serialization.dumps(value) == fast
+    assert Entry.unpack(Entry.build(0.0, value).pack()).value() == serialization.loads(fast)
@@ -0,0 +1,63 @@
+import asyncio
+
+from fastapi_cache.backends.inmemory import InMemoryBackend
+
+from app.cache_backends import LayeredBackend, MemoryBackend, TTLCache
+
+
+class BrokenBackend(InMemoryBackend):
+    async def get_with_ttl(self, key):
+        raise ConnectionError("redis is down")
+
+    async def set(self, key, value, expire=None):
+        raise ConnectionError("redis is down")
+
+
+def test_lru_eviction_by_entries_and_bytes():
+    cache = TTLCache(max_entries=2, max_bytes=10)
+    cache.set("a", b"1234", 60)
+    cache.set("b", b"1234", 60)
+    assert cache.get("a") == b"1234"
+    cache.set("c", b"1234", 60)
+    assert cache.get("b") is None
+    cache.set("d", b"12345678", 60)
+    assert len(cache) == 1 and cache.bytes == 8
+
+
+def test_fifo_ignores_hits():
+    cache = TTLCache(max_entries=2, max_bytes=100, eviction="fifo")
+    cache.set("a", b"1", 60)
+    cache.set("b", b"2", 60)
+    cache.get("a")
+    cache.set("c", b"3", 60)
+    assert cache.get("a") is None and cache.get("b") == b"2"
+
+
+def test_redis_outage_degrades_to_memory():
+    memory = MemoryBackend(TTLCache(16, 1024), max_ttl=60)
+    backend = LayeredBackend(memory, BrokenBackend(), retry_interval=30)
+
+    async def main():
+        assert await backend.get_with_ttl("key") == (0, None)
+        await backend.set("key", b"payload", 600)
+        return await backend.get_with_ttl("key")
+
+    ttl, value = asyncio.run(main())
+    assert value == b"payload" and 0 < ttl <= 60
+    assert not backend.shared_available
+    assert backend.stats["redis"].errors == 1
+    assert (backend.stats["memory"].hits, backend.stats["memory"].misses) == (1, 1)
+
+
+def test_shared_hits_fill_memory():
+    shared = InMemoryBackend()
+    backend = LayeredBackend(MemoryBackend(TTLCache(16, 1024), max_ttl=60), shared)
+
+    async def main():
+        await shared.set("layered-key", b"payload", 600)
+        await backend.get_with_ttl("layered-key")
+        return await backend.get_with_ttl("layered-key")
+
+    assert asyncio.run(main())[1] == b"payload"
+    assert backend.stats["redis"].hits == 1
+    assert backend.stats["memory"].hits == 1
@@ -0,0 +1,125 @@
+import asyncio
+import socket
+
+from aiohttp import web
+
+from app import health
+from app.health import Prober
+from app.parsers.eneyida import api as eneyida_api
+from app.schemas import Stream
+
+
+async def stream(request: web.Request) -> web.StreamResponse:
+    delay = float(request.query.get("delay", 0))
+    response = web.StreamResponse()
+    await response.prepare(request)
+    await asyncio.sleep(delay)
+    await response.write(b"#EXTM3U\n")
+    # Like a live stream, the body never ends
+    await asyncio.sleep(10)
+    return response
+
+
+async def broken(_: web.Request) -> web.Response:
+    return web.Response(status=503)
+
+
+async def referer_only(request: web.Request) -> web.Response:
+    # Like uakino's CDN, which refuses requests not coming from its player
+    if request.headers.get("Referer") != "https://ashdi.vip/":
+        return web.Response(status=403)
+    return web.Response(body=b"#EXTM3U\n")
+
+
+def unused_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_streams_are_ranked_by_probed_latency():
+    async def main():
+        app = web.Application()
+        app.router.add_get("/stream", stream)
+        app.router.add_get("/broken", broken)
+        runner = web.AppRunner(app, shutdown_timeout=0, handler_cancellation=True)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        base = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+
+        streams = [
+            Stream(name="dead", url=f"http://127.0.0.1:{unused_port()}/udp"),
+            Stream(name="slow", url=f"{base}/stream?delay=0.3"),
+            Stream(name="broken", url=f"{base}/broken"),
+            Stream(name="hanging", url=f"{base}/stream?delay=5"),
+            Stream(name="fast", url=f"{base}/stream"),
+            Stream(name="new", url=f"{base}/stream?new"),
+        ]
+        prober = Prober(interval=60, timeout=1, concurrency=2)
+        prober.watch_streams(streams[:5], permanent=True)
+        try:
+            started = asyncio.get_running_loop().time()
+            await prober.run_once()
+            elapsed = asyncio.get_running_loop().time() - started
+        finally:
+            await prober.stop()
+            await runner.cleanup()
+        return prober, streams, elapsed
+
+    prober, streams, elapsed = asyncio.run(main())
+
+    # Five probes, two at a time, none waiting longer than the timeout
+    assert elapsed < 3
+    assert prober.health[streams[4].url].ok and prober.health[streams[4].url].ttfb < 0.3
+    assert prober.health[streams[1].url].ttfb >= 0.3
+    assert prober.health[streams[3].url].failures == 1
+    assert [s.name for s in prober.rank(streams)] == ["fast", "slow", "new", "dead", "broken", "hanging"]
+    assert [s.name for s in prober.rank(streams, drop_dead=True)] == ["fast", "slow", "new"]
+    assert prober.rank(streams[2:4], drop_dead=True) == streams[2:4]
+
+
+def test_provider_streams_are_probed_with_their_cdn_headers(monkeypatch):
+    async def main():
+        app = web.Application()
+        app.router.add_get("/hls", referer_only)
+        runner = web.AppRunner(app, shutdown_timeout=0)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        base = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+
+        prober = Prober(interval=60, timeout=1, concurrency=2)
+        monkeypatch.setattr(health, "prober", prober)
+        plain = Stream(name="plain", url=f"{base}/hls?plain")
+        player = Stream(name="player", url=f"{base}/hls?player")
+        health.rank([plain])
+        health.rank([player], {"Referer": "https://ashdi.vip/"})
+        try:
+            await prober.run_once()
+        finally:
+            await prober.stop()
+            await runner.cleanup()
+        return prober, plain, player
+
+    prober, plain, player = asyncio.run(main())
+
+    assert not prober.health[plain.url].ok
+    assert prober.health[player.url].ok
+
+
+def test_eneyida_streams_are_probed_with_the_player_referer(monkeypatch):
+    watched = {}
+
+    class RecordingProber(Prober):
+        def watch(self, url, headers=None, permanent=False):
+            watched[url] = headers
+
+    async def resolve_streams(**kwargs):
+        return {"streams": [Stream(name="HLS", url="https://cdn.hdvbua.pro/arcane/s1e1/index.m3u8")]}
+
+    monkeypatch.setattr(health, "prober", RecordingProber(interval=60, timeout=1, concurrency=1))
+    monkeypatch.setattr(eneyida_api, "resolve_streams", resolve_streams)
+    asyncio.run(eneyida_api.addon_stream(id="arcane", session=None))
+
+    assert watched == {"https://cdn.hdvbua.pro/arcane/s1e1/index.m3u8": {"Referer": "https://hdvbua.pro/"}}
@@ -0,0 +1,187 @@
+import asyncio
+from collections import Counter
+
+import httpx
+import pytest
+from aiohttp import web
+from fastapi import FastAPI
+from starlette.requests import ClientDisconnect
+
+from app import hls, upstream
+from app.cache_backends import TTLCache
+from app.schemas import Stream
+from app.settings import settings
+
+MASTER = """#EXTM3U
+#EXT-X-STREAM-INF:BANDWIDTH=1280000
+720/index.m3u8
+"""
+MEDIA = """#EXTM3U
+#EXT-X-TARGETDURATION:10
+#EXT-X-KEY:METHOD=AES-128,URI="../key.bin"
+#EXTINF:10,
+seg0.ts
+#EXT-X-ENDLIST
+"""
+SEGMENT = bytes(range(256)) * 1024
+
+
+def test_playlist_uris_point_at_the_proxy():
+    master = hls.rewrite(MASTER, "https://cdn/hls/master.m3u8", "http://addon/", "uakino", "s")
+    variant = master.splitlines()[-1]
+    assert variant.startswith("http://addon/proxy/") and variant.endswith("/index.m3u8")
+    assert hls.decode_token(variant.split("/")[-2]) == ("uakino", "s", hls.PLAYLIST, "https://cdn/hls/720/index.m3u8")
+
+    media = hls.rewrite(MEDIA, "https://cdn/hls/720/index.m3u8", "http://addon/", "uakino", "s")
+    key = media.splitlines()[2].split('URI="')[1].rstrip('"')
+    assert hls.decode_token(key.split("/")[-2])[2:] == (hls.SEGMENT, "https://cdn/hls/key.bin")
+    segment = media.splitlines()[4]
+    assert hls.decode_token(segment.split("/")[-2])[2:] == (hls.SEGMENT, "https://cdn/hls/720/seg0.ts")
+    assert "#EXT-X-ENDLIST" in media
+
+
+def test_tampered_tokens_are_rejected():
+    token = hls.encode_token("uakino", "s", hls.SEGMENT, "https://cdn/seg0.ts")
+    other = hls.encode_token("uakino", "s", hls.SEGMENT, "http://169.254.169.254/")
+    with pytest.raises(ValueError):
+        hls.decode_token(f"{other.split('.')[0]}.{token.split('.')[1]}")
+
+
+def test_streams_are_fetched_with_provider_headers(monkeypatch):
+    monkeypatch.setattr(settings, "proxy_enabled", True)
+    monkeypatch.setattr(settings, "proxy_chunk_size", 4096)
+    monkeypatch.setattr(hls, "playlists", TTLCache(16, 1024 * 1024))
+    monkeypatch.setitem(hls._headers, "test", {"Referer": "https://player/"})
+    hits: Counter = Counter()
+
+    async def cdn(request: web.Request) -> web.StreamResponse:
+        hits[request.path] += 1
+        if request.headers.get("Referer") != "https://player/":
+            return web.Response(status=403)
+        if request.path.endswith(".ts"):
+            response = web.StreamResponse(headers={"Content-Type": "video/mp2t"})
+            response.content_length = len(SEGMENT)
+            await response.prepare(request)
+            for start in range(0, len(SEGMENT), 10000):
+                await response.write(SEGMENT[start:start + 10000])
+            return response
+        return web.Response(text={"/hls/master.m3u8": MASTER, "/hls/720/index.m3u8": MEDIA}[request.path])
+
+    async def main():
+        server = web.Application()
+        server.router.add_get("/{path:.*}", cdn)
+        runner = web.AppRunner(server, shutdown_timeout=0)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        base = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+
+        app = FastAPI()
+        app.include_router(hls.router)
+        streams = [Stream(name="hls", url=f"{base}/hls/master.m3u8"), Stream(name="mp4", url=f"{base}/film.mp4")]
+        wrapped = hls.wrap("test", streams, "http://addon/")
+        try:
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app), base_url="http://addon") as client:
+                masters = await asyncio.gather(*(client.get(wrapped[0].url) for _ in range(5)))
+                variant = await client.get(masters[0].text.splitlines()[-1])
+                segment = await client.get(variant.text.splitlines()[4])
+                forged = await client.get(f"/proxy/{wrapped[0].url.split('/')[-2][:-2]}xx/index.m3u8")
+        finally:
+            await upstream.close_sessions()
+            await runner.cleanup()
+        return wrapped, masters, variant, segment, forged
+
+    wrapped, masters, variant, segment, forged = asyncio.run(main())
+
+    assert wrapped[1].url.endswith("/film.mp4")
+    assert all(response.status_code == 200 for response in masters)
+    assert masters[0].headers["content-type"] == hls.PLAYLIST_TYPE
+    assert hits["/hls/master.m3u8"] == 1
+    assert variant.status_code == 200
+    assert segment.status_code == 200
+    assert segment.content == SEGMENT
+    assert segment.headers["content-type"] == "video/mp2t"
+    assert forged.status_code == 404
+    assert not hls.limits._streams
+
+
+def test_stream_limits_queue_and_reject():
+    async def main():
+        limits = hls.StreamLimits(limit=2, timeout=0.05)
+        await limits.acquire("a")
+        await limits.acquire("a")
+        # Other streams have their own budget
+        await limits.acquire("b")
+        with pytest.raises(hls.StreamBusy):
+            await limits.acquire("a")
+        waiter = asyncio.create_task(limits.acquire("a"))
+        await asyncio.sleep(0)
+        limits.release("a")
+        await waiter
+        assert limits.in_flight("a") == 2
+        for stream in ("a", "a", "b"):
+            limits.release(stream)
+        return limits
+
+    assert not asyncio.run(main())._streams
+
+
+def test_upstream_timeouts_are_not_reported_as_a_busy_stream(monkeypatch):
+    monkeypatch.setattr(hls, "playlists", TTLCache(16, 1024 * 1024))
+    monkeypatch.setitem(hls._headers, "test", {})
+
+    async def fetch_text(session, url, **kwargs):
+        raise asyncio.TimeoutError()
+
+    monkeypatch.setattr(upstream, "fetch_text", fetch_text)
+    app = FastAPI()
+    app.include_router(hls.router)
+    token = hls.encode_token("test", "s", hls.PLAYLIST, "https://cdn/hls/master.m3u8")
+
+    async def main():
+        try:
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app), base_url="http://addon") as client:
+                return await client.get(f"/proxy/{token}/master.m3u8")
+        finally:
+            await upstream.close_sessions()
+
+    assert asyncio.run(main()).status_code == 504
+    assert not hls.limits._streams
+
+
+def test_segment_slot_is_freed_when_the_client_is_gone_before_the_body(monkeypatch):
+    released = []
+
+    class Content:
+        async def iter_chunked(self, size):
+            yield SEGMENT
+
+    class Upstream:
+        status = 200
+        headers = {"Content-Type": "video/mp2t"}
+        content = Content()
+
+        def release(self):
+            released.append(True)
+
+    class Session:
+        async def get(self, url, **kwargs):
+            return Upstream()
+
+    monkeypatch.setattr(upstream, "get_session", lambda name: Session())
+    monkeypatch.setitem(hls._headers, "test", {})
+
+    async def disconnected(message):
+        raise OSError("client went away")
+
+    async def main():
+        request = httpx.Request("GET", "http://addon/")
+        response = await hls._segment("test", "s", "https://cdn/seg0.ts", request)
+        assert hls.limits.in_flight("s") == 1
+        # Starlette reports a failed send as the client disconnecting
+        with pytest.raises(ClientDisconnect):
+            await response({"type": "http", "asgi": {"spec_version": "2.4"}}, None, disconnected)
+
+    asyncio.run(main())
+    assert released == [True]
+    assert not hls.limits._streams
@@ -0,0 +1,36 @@
+import io
+import json
+import logging
+
+from app import logs
+from app.settings import Settings
+
+
+def test_records_are_structured_sampled_and_truncated():
+    root = logging.getLogger()
+    saved = root.handlers[:], root.level
+    provider = logging.getLogger("app.parsers.uakino")
+    output = io.StringIO()
+    logs.setup(
+        Settings(log_format="json", log_levels={"uakino": "DEBUG"}, log_sample_rate=0, log_payload_limit=10),
+        stream=output,
+    )
+    try:
+        logger = logging.getLogger("app.parsers.uakino.services")
+        logger.debug("Плейлист для news_id=%s", 1235, extra={"playlist": "x" * 100})
+        logger.debug("Плейлист", extra={"playlist": "x" * 100, "sampled": True})
+        logging.getLogger("app.parsers.eneyida.services").debug("Not enabled for eneyida")
+        try:
+            raise ValueError("broken page")
+        except ValueError:
+            logger.warning("Failed", exc_info=True)
+    finally:
+        logs.stop()
+        root.handlers, root.level = saved
+        provider.setLevel(logging.NOTSET)
+
+    entries = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert [entry["msg"] for entry in entries] == ["Плейлист д… (+15 chars)", "Failed"]
+    assert entries[0]["logger"] == "app.parsers.uakino.services"
+    assert entries[0]["playlist"] == "xxxxxxxxxx… (+90 chars)"
+    assert "ValueError: broken page" in entries[1]["exc"]
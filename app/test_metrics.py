@@ -0,0 +1,64 @@
+import asyncio
+
+from fastapi import APIRouter, FastAPI
+from fastapi.testclient import TestClient
+from fastapi_cache.backends.inmemory import InMemoryBackend
+
+from app import metrics
+from app.cache_backends import LayeredBackend, MemoryBackend, TTLCache
+
+
+def sample(name: str, **labels) -> float:
+    return next(
+        (
+            s.value
+            for metric in metrics.STAGES.collect() + metrics.CACHE.collect()
+            for s in metric.samples
+            if s.name == name and s.labels.items() >= labels.items()
+        ),
+        0.0,
+    )
+
+
+class BrokenBackend(InMemoryBackend):
+    async def get_with_ttl(self, key):
+        raise ConnectionError("redis is down")
+
+
+def test_stages_are_labelled_by_provider_and_route():
+    router = APIRouter(prefix="/demo", route_class=metrics.InstrumentedRoute)
+    cache = LayeredBackend(MemoryBackend(TTLCache(10, 1024), 60), BrokenBackend())
+
+    @router.get("/meta/{id}.json")
+    async def addon_meta(id: str) -> dict:
+        with metrics.timed("decode"):
+            pass
+        await cache.get_with_ttl(id)
+        return {"meta": {"id": id}}
+
+    app = FastAPI()
+    app.include_router(router)
+    app.get("/metrics")(metrics.metrics_response)
+    client = TestClient(app)
+
+    before = sample("stremio_stage_seconds_count", provider="demo", route="addon_meta", stage="request")
+    assert client.get("/demo/meta/1.json").json() == {"meta": {"id": "1"}}
+
+    labels = {"provider": "demo", "route": "addon_meta"}
+    for stage in ("request", "endpoint", "serialize", "decode"):
+        assert sample("stremio_stage_seconds_count", stage=stage, **labels) == before + 1
+    assert sample("stremio_cache_seconds_count", tier="memory", result="miss", **labels) >= 1
+    assert sample("stremio_cache_seconds_count", tier="redis", result="error", **labels) >= 1
+    assert 'stremio_stage_seconds_count{provider="demo",route="addon_meta",stage="request"}' in client.get(
+        "/metrics"
+    ).text
+
+
+def test_work_outside_of_requests_is_unlabelled():
+    async def main():
+        with metrics.timed("parse"):
+            pass
+        return metrics.current.get()
+
+    labels = asyncio.run(main())
+    assert (labels.provider, labels.route) == ("none", "none")
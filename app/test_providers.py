@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+from aiohttp import web
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app import providers, upstream
+from app.settings import Settings
+
+
+def test_provider_is_imported_on_first_request():
+    app = FastAPI()
+    registry = providers.Registry({"tv": "app.parsers.tv.api", "missing": "app.parsers.missing.api"})
+    registry.install(app)
+    client = TestClient(app)
+
+    assert registry.loaded() == []
+    assert client.get("/other/manifest.json").status_code == 404
+
+    response = client.get("/tv/tvua/manifest.json")
+    assert response.status_code == 200
+    assert response.json()["id"] == "ua.cakestwix.stremio.tv"
+    assert registry.loaded() == ["tv"]
+    assert client.get("/tv/tvua/meta/tv/unknown.json").status_code == 404
+
+    with pytest.raises(ModuleNotFoundError):
+        client.get("/missing/manifest.json")
+    assert registry.loaded() == ["tv"]
+
+
+def test_providers_are_enabled_in_settings():
+    registry = providers.create_registry(Settings(providers_disabled=["tv"]))
+    assert list(registry.providers) == ["eneyida", "uakino"]
+
+    registry = providers.create_registry(Settings(providers_enabled=["uakino"]))
+    assert list(registry.providers) == ["uakino"]
+
+    with pytest.raises(ValueError, match="watari"):
+        providers.create_registry(Settings(providers_enabled=["watari"]))
+
+
+def test_upstream_options_are_read_per_provider(monkeypatch):
+    from app.parsers.eneyida.settings import Settings as EneyidaSettings
+    from app.parsers.uakino.settings import Settings as UakinoSettings
+
+    monkeypatch.setenv("UAKINO_POOL_LIMIT", "7")
+    monkeypatch.setenv("UAKINO_WARMUP", "true")
+    monkeypatch.setenv("POOL_LIMIT", "3")
+    assert (UakinoSettings().pool_limit, UakinoSettings().warmup) == (7, True)
+    assert (EneyidaSettings().pool_limit, EneyidaSettings().warmup) == (100, False)
+
+
+def test_pool_warm_up_does_not_hold_up_loading(monkeypatch):
+    heads = []
+
+    async def slow_head(request):
+        await asyncio.sleep(0.3)
+        heads.append(request.path)
+        return web.Response()
+
+    async def main():
+        server = web.Application()
+        server.router.add_route("HEAD", "/", slow_head)
+        runner = web.AppRunner(server, shutdown_timeout=0)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        url = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}/"
+        monkeypatch.setitem(upstream._options, "slow", (upstream.UpstreamSettings(main_url=url, warmup=True), None))
+        try:
+            started = asyncio.get_running_loop().time()
+            await upstream.open_sessions(["slow"])
+            elapsed = asyncio.get_running_loop().time() - started
+            await asyncio.sleep(0.5)
+        finally:
+            await upstream.close_sessions()
+            await runner.cleanup()
+        return elapsed
+
+    assert asyncio.run(main()) < 0.2
+    assert heads == ["/"]
+
+
+def test_only_named_providers_are_loaded_for_warm_up():
+    registry = providers.Registry({"tv": "app.parsers.tv.api", "missing": "app.parsers.missing.api"})
+    registry.install(FastAPI())
+
+    asyncio.run(registry.load_all([]))
+    assert registry.loaded() == []
+    asyncio.run(registry.load_all(["tv", "unknown"]))
+    assert registry.loaded() == ["tv"]
@@ -0,0 +1,95 @@
+import asyncio
+
+from app.schemas import Preview, Series
+from app.search import SearchIndex, normalize, transliterate
+
+
+def preview(id: str, name: str, type_: str = "series") -> Preview:
+    return Preview(id=id, type=type_, name=name, genres=[], description="")
+
+
+def test_spelling_variants_are_folded():
+    assert normalize("П’ЯТЬ Ночей") == normalize("пʼять ночей") == normalize("пять ночеи")
+    assert normalize("Відьмак") == normalize("видьмак")
+    assert transliterate("Щедрик у Києві") == "shchedryk u kyievi"
+
+
+def test_titles_are_found_by_prefix_in_either_script(tmp_path):
+    index = SearchIndex(str(tmp_path / "search.db"))
+
+    async def main():
+        await index.add("eneyida", [preview("1", "Відьмак / The Witcher"), preview("2", "Дюна: Частина друга", "movie")])
+        await index.add("uakino", [preview("3", "Відьмак: Кошмар вовка", "movie")])
+
+        for query in ["відьмак", "ВИДЬМАК", "vidmak", "witch", "відь"]:
+            assert [item.id for item in await index.search("eneyida", query)] == ["1"], query
+        assert [item.id for item in await index.search("eneyida", "дюна част")] == ["2"]
+        assert [item.id for item in await index.search("uakino", "відьмак", "movie")] == ["3"]
+        assert await index.search("uakino", "відьмак", "series") == []
+        assert await index.search("eneyida", "!!") == []
+
+    asyncio.run(main())
+
+
+def test_metas_update_titles_and_search_results_do_not(tmp_path):
+    path = str(tmp_path / "search.db")
+    index = SearchIndex(path)
+    meta = Series(
+        **preview("1", "Дюна: Пророцтво", "movie").model_dump(), director=[], background="", videos=[]
+    )
+
+    async def main():
+        await index.add("eneyida", [preview("1", "Дюна", "movie")])
+        await index.add("eneyida", [preview("1", "Дюна")], replace=False)
+        await index.add("eneyida", [meta])
+        index.close()
+
+        reopened = SearchIndex(path)
+        assert reopened.count("eneyida") == 1
+        return await reopened.search("eneyida", "пророцтво")
+
+    [found] = asyncio.run(main())
+    assert found == preview("1", "Дюна: Пророцтво", "movie")
+
+
+def test_catalogs_are_filtered_by_genre_and_year():
+    index = SearchIndex(":memory:")
+
+    async def main():
+        await index.add(
+            "eneyida",
+            [
+                Preview(id="1", type="movie", name="Дюна", genres=[], description="", releaseInfo="2024"),
+                Preview(id="2", type="movie", name="Оппенгеймер", genres=[], description="", releaseInfo="2023"),
+                Preview(id="3", type="movie", name="Тіндер-шахрай", genres=[], description="", releaseInfo="2022"),
+            ],
+            catalog="eneyida_films",
+        )
+        # Metas bring the genres, catalog pages without any keep them
+        await index.add("eneyida", [Preview(id="1", type="movie", name="Дюна", genres=["Фантастика", "Драма"], description="")])
+        await index.add("eneyida", [Preview(id="2", type="movie", name="Оппенгеймер", genres=["Драма"], description="")])
+        await index.add("eneyida", [Preview(id="1", type="movie", name="Дюна", genres=[], description="", releaseInfo="2024")])
+
+        assert [item.id for item in await index.browse("eneyida", ["catalog:eneyida_films"])] == ["1", "2", "3"]
+        assert [item.id for item in await index.browse("eneyida", ["catalog:eneyida_films", "genre:Драма"])] == ["1", "2"]
+        assert [item.id for item in await index.browse("eneyida", ["genre:Драма", "year:2023"])] == ["2"]
+        assert [item.id for item in await index.browse("eneyida", ["genre:Драма"], skip=1, limit=1)] == ["2"]
+        assert await index.browse("eneyida", ["genre:Драма"], type_="series") == []
+        assert await index.tag_values("eneyida", "genre", within="catalog:eneyida_films") == ["Драма", "Фантастика"]
+        assert await index.tag_values("eneyida", "year") == ["2022", "2023", "2024"]
+
+    asyncio.run(main())
+
+
+def test_queries_wait_for_the_index_off_the_event_loop():
+    index = SearchIndex(":memory:")
+
+    async def main():
+        # Another thread is writing, the loop keeps serving meanwhile
+        with index._lock:
+            query = asyncio.create_task(index.search("eneyida", "дюна"))
+            await asyncio.sleep(0.05)
+            assert not query.done()
+        return await query
+
+    assert asyncio.run(main()) == []
@@ -0,0 +1,46 @@
+import asyncio
+
+from prometheus_client import REGISTRY
+
+from app.singleflight import SingleFlight
+
+
+def test_concurrent_calls_are_collapsed():
+    flight = SingleFlight("collapsed")
+    started = 0
+
+    async def fetch(value):
+        nonlocal started
+        started += 1
+        await asyncio.sleep(0.01)
+        return value
+
+    async def main():
+        calls = asyncio.gather(*(flight.do("key", fetch, 42) for _ in range(10)))
+        await asyncio.sleep(0)
+        assert REGISTRY.get_sample_value("stremio_singleflight_inflight", {"group": "collapsed"}) == 1
+        return await calls
+
+    assert asyncio.run(main()) == [42] * 10
+    assert started == 1
+    assert flight.stats() == {"calls": 1, "collapsed": 9, "inflight": 0}
+    assert REGISTRY.get_sample_value("stremio_singleflight_calls_total", {"group": "collapsed", "result": "started"}) == 1
+    assert REGISTRY.get_sample_value("stremio_singleflight_calls_total", {"group": "collapsed", "result": "collapsed"}) == 9
+    assert REGISTRY.get_sample_value("stremio_singleflight_inflight", {"group": "collapsed"}) == 0
+
+
+def test_cancelled_caller_does_not_cancel_others():
+    flight = SingleFlight("test")
+
+    async def fetch():
+        await asyncio.sleep(0.02)
+        return "page"
+
+    async def main():
+        first = asyncio.ensure_future(flight.do("key", fetch))
+        second = asyncio.ensure_future(flight.do("key", fetch))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(main()) == "page"
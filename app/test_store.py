@@ -0,0 +1,182 @@
+import asyncio
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Optional
+
+import aiohttp
+import pytest
+from fastapi import HTTPException
+from fastapi_cache import FastAPICache
+from fastapi_cache.backends.inmemory import InMemoryBackend
+
+from app import store, upstream
+from app.cache import Uncacheable, key_builder
+from app.cache_backends import TTLCache
+from app.parsers.uakino import api as uakino_api, services as uakino
+from app.schemas import Series
+
+UAKINO_FIXTURES = Path(__file__).parent / "parsers" / "uakino" / "fixtures"
+SERIES_ID = "seriesss/drama_series/1235-khodyachi-mertsi-2-sezon"
+
+
+def test_records_survive_reopening(tmp_path):
+    path = str(tmp_path / "metadata.db")
+
+    async def main():
+        first = store.MetadataStore(path)
+        await first.put("uakino", "episodes", "1235", uakino.EpisodeMap([(1, "Серія 1")], {1: [("Оригінал", "//player/1")]}))
+        await first.put("uakino", "player", "filmy/1", ("//player/2", "Фільм (HD)"), tuple[Optional[str], str])
+        first.close()
+
+        second = store.MetadataStore(path)
+        record = await second.get("uakino", "episodes", "1235", uakino.EpisodeMap)
+        assert record.value.episodes == {1: [("Оригінал", "//player/1")]}
+        assert 0 <= record.age < 60
+        assert (await second.get("uakino", "player", "filmy/1", tuple[Optional[str], str])).value == ("//player/2", "Фільм (HD)")
+        assert await second.get("uakino", "meta", "filmy/1", Series) is None
+        # A record the model can't read any more is a miss
+        assert await second.get("uakino", "episodes", "1235", Series) is None
+
+    asyncio.run(main())
+
+
+def fake_site(monkeypatch, requests: list, delays: Optional[dict] = None, down: frozenset = frozenset()):
+    async def fetch_text(session, url, params=None, **kwargs):
+        page = url.rsplit("/", 1)[-1]
+        requests.append(page)
+        await asyncio.sleep((delays or {}).get(page, 0))
+        if page in down:
+            raise aiohttp.ClientResponseError(SimpleNamespace(real_url=url), (), status=503)
+        if "playlists.php" in url:
+            return (UAKINO_FIXTURES / "playlist.json").read_text(encoding="utf-8")
+        # Every season page has its own news_id, as on the real site
+        html = (UAKINO_FIXTURES / "detail_series.html").read_text(encoding="utf-8")
+        return html.replace('data-news_id="1235"', f'data-news_id="{page.split("-")[0]}"')
+
+    monkeypatch.setattr(upstream, "fetch_text", fetch_text)
+
+
+def test_stale_series_meta_only_refetches_seasons_and_episodes(tmp_path, monkeypatch):
+    monkeypatch.setattr(store, "metadata", store.MetadataStore(str(tmp_path / "metadata.db")))
+    monkeypatch.setattr(uakino, "news_ids", TTLCache(16, sys.maxsize))
+    monkeypatch.setattr(uakino, "episode_maps", TTLCache(16, sys.maxsize))
+    requests = []
+    fake_site(monkeypatch, requests)
+
+    first = asyncio.run(uakino.get_meta(SERIES_ID, "series", None))["meta"]
+    # The other seasons linked from the page are crawled as well
+    assert sorted(requests) == sorted(
+        ["1235-khodyachi-mertsi-2-sezon.html", "1234-khodyachi-mertsi-1-sezon.html",
+         "1236-khodyachi-mertsi-3-sezon.html"] + ["playlists.php"] * 3
+    )
+    assert [(video.season, video.episode) for video in first.videos[::3]] == [(1, 1), (2, 1), (3, 1)]
+    assert first.videos[0].id.startswith("seriesss/drama_series/1234-khodyachi-mertsi-1-sezon/1:")
+
+    requests.clear()
+    assert asyncio.run(uakino.get_meta(SERIES_ID, "series", None))["meta"] == first
+    assert requests == []
+
+    # After a restart with an outdated meta only the page (for its season
+    # list) and the playlists are fetched again, news_ids are kept in the store
+    monkeypatch.setattr(uakino.settings, "meta_refresh", 0)
+    monkeypatch.setattr(uakino.settings, "playlist_ttl", 0)
+    uakino.news_ids.clear()
+    uakino.episode_maps.clear()
+    assert asyncio.run(uakino.get_meta(SERIES_ID, "series", None))["meta"] == first
+    assert requests == ["1235-khodyachi-mertsi-2-sezon.html"] + ["playlists.php"] * 3
+
+
+def test_failed_seasons_are_retried_until_the_meta_is_complete(tmp_path, monkeypatch):
+    monkeypatch.setattr(store, "metadata", store.MetadataStore(str(tmp_path / "metadata.db")))
+    monkeypatch.setattr(uakino, "news_ids", TTLCache(16, sys.maxsize))
+    monkeypatch.setattr(uakino, "episode_maps", TTLCache(16, sys.maxsize))
+    first_season = "1234-khodyachi-mertsi-1-sezon.html"
+    requests = []
+    fake_site(monkeypatch, requests, down=frozenset({first_season}))
+
+    with pytest.raises(Uncacheable) as partial:
+        asyncio.run(uakino.get_meta(SERIES_ID, "series", None))
+    assert {video.season for video in partial.value.result["meta"].videos} == {2, 3}
+    assert asyncio.run(store.metadata.get("uakino", "meta", SERIES_ID, Series)) is None
+
+    # A meta stored without a season (say, by an older release) gets it back on refresh
+    asyncio.run(store.metadata.put("uakino", "meta", SERIES_ID, partial.value.result["meta"]))
+    monkeypatch.setattr(uakino.settings, "meta_refresh", 0)
+    fake_site(monkeypatch, requests)
+    meta = asyncio.run(uakino.get_meta(SERIES_ID, "series", None))["meta"]
+    assert {video.season for video in meta.videos} == {1, 2, 3}
+    assert asyncio.run(store.metadata.get("uakino", "meta", SERIES_ID, Series)).value == meta
+
+    # A season failing on refresh keeps its old episodes, but isn't stored as updated
+    monkeypatch.setattr(uakino.settings, "playlist_ttl", 0)
+    uakino.episode_maps.clear()
+    fake_site(monkeypatch, requests, down=frozenset({"playlists.php"}))
+    with pytest.raises(Uncacheable) as stale:
+        asyncio.run(uakino.get_meta(SERIES_ID, "series", None))
+    assert stale.value.result["meta"].videos == meta.videos
+
+
+def test_slow_seasons_are_left_out_after_the_deadline_and_loaded_next_time(tmp_path, monkeypatch):
+    monkeypatch.setattr(store, "metadata", store.MetadataStore(str(tmp_path / "metadata.db")))
+    monkeypatch.setattr(uakino, "news_ids", TTLCache(16, sys.maxsize))
+    monkeypatch.setattr(uakino, "episode_maps", TTLCache(16, sys.maxsize))
+    monkeypatch.setattr(uakino.settings, "season_deadline", 0.2)
+    requests = []
+    fake_site(monkeypatch, requests, {"1234-khodyachi-mertsi-1-sezon.html": 0.3, "1236-khodyachi-mertsi-3-sezon.html": 0.1})
+
+    async def main():
+        started = asyncio.get_running_loop().time()
+        with pytest.raises(Uncacheable) as partial:
+            await uakino.get_meta(SERIES_ID, "series", None)
+        elapsed = asyncio.get_running_loop().time() - started
+        # The late season keeps loading after the response went out
+        await asyncio.sleep(0.2)
+        return partial.value.result["meta"], elapsed, (await uakino.get_meta(SERIES_ID, "series", None))["meta"]
+
+    partial, elapsed, complete = asyncio.run(main())
+    assert {video.season for video in partial.videos} == {2, 3}
+    # Seasons were fetched side by side, not one after another
+    assert elapsed < 0.3
+    # The partial meta wasn't stored, the next request has every season
+    assert uakino.news_ids.get("seriesss/drama_series/1234-khodyachi-mertsi-1-sezon") == "1234"
+    assert {video.season for video in complete.videos} == {1, 2, 3}
+    assert asyncio.run(store.metadata.get("uakino", "meta", SERIES_ID, Series)).value == complete
+
+
+def test_failed_meta_is_an_error_not_a_cached_empty_meta(tmp_path, monkeypatch):
+    monkeypatch.setattr(store, "metadata", store.MetadataStore(str(tmp_path / "metadata.db")))
+    monkeypatch.setattr(uakino, "news_ids", TTLCache(16, sys.maxsize))
+    monkeypatch.setattr(uakino, "episode_maps", TTLCache(16, sys.maxsize))
+    backend = InMemoryBackend()
+    FastAPICache.reset()
+    FastAPICache.init(backend, prefix="test", key_builder=key_builder)
+
+    async def unavailable(session, url, **kwargs):
+        raise aiohttp.ClientResponseError(SimpleNamespace(real_url=url), (), status=503)
+
+    monkeypatch.setattr(upstream, "fetch_text", unavailable)
+    try:
+        with pytest.raises(HTTPException) as error:
+            asyncio.run(uakino_api.addon_meta(type_="series", id=SERIES_ID, session=None))
+    finally:
+        FastAPICache.reset()
+    assert error.value.status_code == 502
+    # InMemoryBackend keeps one store for every instance
+    assert not [key for key in backend._store if SERIES_ID in key]
+
+
+def test_series_without_episodes_is_neither_stored_nor_cached(tmp_path, monkeypatch):
+    monkeypatch.setattr(store, "metadata", store.MetadataStore(str(tmp_path / "metadata.db")))
+    monkeypatch.setattr(uakino, "news_ids", TTLCache(16, sys.maxsize))
+
+    async def fetch_text(session, url, **kwargs):
+        # A page whose player didn't render, so there is no playlist to ask for
+        html = (UAKINO_FIXTURES / "detail_series.html").read_text(encoding="utf-8")
+        return html.replace('data-news_id="1235"', "")
+
+    monkeypatch.setattr(upstream, "fetch_text", fetch_text)
+    with pytest.raises(Uncacheable) as empty:
+        asyncio.run(uakino.get_meta(SERIES_ID, "series", None))
+    assert empty.value.result["meta"].videos == []
+    assert asyncio.run(store.metadata.get("uakino", "meta", SERIES_ID, Series)) is None
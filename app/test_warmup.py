@@ -0,0 +1,64 @@
+import asyncio
+
+from app import warmup
+
+
+def test_catalog_pages_and_top_metas_are_warmed(monkeypatch):
+    monkeypatch.setattr(warmup, "_providers", {})
+    loaded, metas = [], []
+    running = peak = 0
+
+    async def load(catalog, page):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        loaded.append((catalog, page))
+        if catalog == "broken":
+            raise RuntimeError("upstream is down")
+        return {"metas": [{"type": "movie", "id": f"{catalog}-{page}-{n}"} for n in range(5)]}
+
+    async def meta(type_, id):
+        metas.append(id)
+
+    def pages(count):
+        return [
+            warmup.CatalogPage("test", catalog, page, lambda catalog=catalog, page=page: load(catalog, page), meta)
+            for catalog in ["films", "series", "broken"]
+            for page in range(1, count + 1)
+        ]
+
+    warmup.register("test", pages)
+    scheduler = warmup.Scheduler(pages=2, interval=60, concurrency=2, meta_items=2)
+    asyncio.run(scheduler.run_once())
+
+    assert sorted(loaded) == sorted((catalog, page) for catalog in ["films", "series", "broken"] for page in (1, 2))
+    assert sorted(metas) == sorted(
+        f"{catalog}-{page}-{n}" for catalog in ["films", "series"] for page in (1, 2) for n in range(2)
+    )
+    assert peak <= 2
+    assert scheduler.failures == 2
+
+
+def test_a_failing_run_keeps_the_loop_going(monkeypatch):
+    monkeypatch.setattr(warmup, "_providers", {})
+    attempts = []
+
+    async def prepare():
+        attempts.append(len(attempts))
+        if len(attempts) == 1:
+            raise ModuleNotFoundError("app.parsers.missing")
+
+    async def main():
+        scheduler = warmup.Scheduler(pages=1, interval=0.01, concurrency=1, jitter=0, prepare=prepare)
+        scheduler.start()
+        await asyncio.sleep(0.1)
+        # Stopping doesn't raise what a run raised
+        await scheduler.stop()
+        return scheduler
+
+    scheduler = asyncio.run(main())
+    assert len(attempts) > 1
+    assert scheduler.runs == len(attempts) - 1
+    assert scheduler.failures == 1
@@ -0,0 +1,68 @@
+import asyncio
+import time
+from pathlib import Path
+
+import pytest
+
+from app.parsers.eneyida import services as eneyida
+from app.workers import ParsePool, ParsePoolFull
+
+CATALOG = (Path(__file__).parent / "parsers" / "eneyida" / "fixtures" / "catalog.html").read_text(encoding="utf-8")
+
+
+def slow_parse(seconds: float) -> float:
+    time.sleep(seconds)
+    return seconds
+
+
+def test_parsing_does_not_block_the_event_loop():
+    pool = ParsePool("thread", size=2, queue_limit=4)
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            ticks += 1
+            await asyncio.sleep(0.005)
+
+    async def main():
+        task = asyncio.ensure_future(ticker())
+        results = await asyncio.gather(*(pool.run(slow_parse, 0.05) for _ in range(4)))
+        task.cancel()
+        return results
+
+    try:
+        assert asyncio.run(main()) == [0.05] * 4
+    finally:
+        pool.shutdown()
+    assert ticks >= 10
+    stats = pool.stats()
+    assert stats["parse_time"]["test_workers.slow_parse"]["count"] == 4
+    # Two jobs had to wait for the first two to finish
+    assert stats["queue_wait"]["test_workers.slow_parse"]["max_s"] >= 0.04
+
+
+def test_jobs_over_the_queue_limit_are_rejected():
+    pool = ParsePool("thread", size=1, queue_limit=1)
+
+    async def main():
+        return await asyncio.gather(*(pool.run(slow_parse, 0.02) for _ in range(3)), return_exceptions=True)
+
+    try:
+        results = asyncio.run(main())
+    finally:
+        pool.shutdown()
+    assert results[:2] == [0.02, 0.02]
+    assert isinstance(results[2], ParsePoolFull)
+    assert pool.stats()["rejected"] == 1
+
+
+@pytest.mark.parametrize("kind", ["inline", "process"])
+def test_provider_parsers_run_in_every_pool_kind(kind):
+    pool = ParsePool(kind, size=1, queue_limit=1)
+    try:
+        previews = asyncio.run(pool.run(eneyida.parse_previews, CATALOG, "movie"))
+    finally:
+        pool.shutdown()
+    assert previews == eneyida.parse_previews(CATALOG, "movie")
+    assert pool.stats()["parse_time"]["eneyida.parse_previews"]["count"] == 1
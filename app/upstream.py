@@ -0,0 +1,139 @@
+import asyncio
+import logging
+import time
+from typing import Iterable, Optional
+from urllib.parse import urlsplit
+
+import aiohttp
+from pydantic_settings import BaseSettings
+
+from . import metrics
+from .singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+
+class UpstreamSettings(BaseSettings):
+    """Connection pool options shared by every scraping provider.
+
+    Subclasses set their own `env_prefix`, so each provider reads its own
+    variables (`UAKINO_POOL_LIMIT`, not a `POOL_LIMIT` shared by all).
+    """
+
+    main_url: str
+    pool_limit: int = 100
+    pool_limit_per_host: int = 20
+    dns_cache_ttl: int = 300
+    keepalive_timeout: float = 30.0
+    request_timeout: float = 20.0
+    warmup: bool = False
+
+
+# One pooled client per provider, opened and closed by the app lifespan
+_sessions: dict[str, aiohttp.ClientSession] = {}
+_options: dict[str, tuple[UpstreamSettings, Optional[dict]]] = {}
+# Warm-ups still running, providers are loaded on a request and mustn't wait for them
+_warmups: set[asyncio.Task] = set()
+
+
+def register(name: str, settings: UpstreamSettings, headers: Optional[dict] = None):
+    _options[name] = (settings, headers)
+
+
+def _create_session(settings: UpstreamSettings, headers: Optional[dict]) -> aiohttp.ClientSession:
+    connector = aiohttp.TCPConnector(
+        limit=settings.pool_limit,
+        limit_per_host=settings.pool_limit_per_host,
+        use_dns_cache=True,
+        ttl_dns_cache=settings.dns_cache_ttl,
+        keepalive_timeout=settings.keepalive_timeout,
+    )
+    return aiohttp.ClientSession(
+        connector=connector,
+        headers=headers,
+        timeout=aiohttp.ClientTimeout(total=settings.request_timeout),
+    )
+
+
+async def _warmup(name: str, session: aiohttp.ClientSession, url: str):
+    # Resolve DNS and finish the TLS handshake ahead of the first client requests
+    try:
+        async with session.head(url, allow_redirects=True) as response:
+            logger.info(f"Warmed up {name} pool: {url} -> {response.status}")
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logger.warning(f"Warm-up of {name} pool failed: {e}")
+
+
+async def open_sessions(names: Optional[Iterable[str]] = None):
+    for name, (settings, headers) in _options.items():
+        if names is not None and name not in names:
+            continue
+        if name in _sessions and not _sessions[name].closed:
+            continue
+        _sessions[name] = _create_session(settings, headers)
+        if settings.warmup:
+            task = asyncio.ensure_future(_warmup(name, _sessions[name], settings.main_url))
+            _warmups.add(task)
+            task.add_done_callback(_warmups.discard)
+
+
+async def close_sessions():
+    for task in list(_warmups):
+        task.cancel()
+    for session in _sessions.values():
+        await session.close()
+    _sessions.clear()
+
+
+def get_session(name: str) -> aiohttp.ClientSession:
+    session = _sessions.get(name)
+    if session is None or session.closed:
+        # Used outside of the lifespan (scripts, bare TestClient)
+        settings, headers = _options[name]
+        session = _sessions[name] = _create_session(settings, headers)
+    return session
+
+
+fetches = SingleFlight("upstream")
+
+
+async def _fetch_text(
+    session: aiohttp.ClientSession,
+    method: str,
+    url: str,
+    params: Optional[dict],
+    data: Optional[dict],
+    headers: Optional[dict],
+) -> str:
+    status = "error"
+    started = time.perf_counter()
+    try:
+        async with session.request(method, url, params=params, data=data, headers=headers) as response:
+            status = str(response.status)
+            response.raise_for_status()
+            body = await response.read()
+            encoding = response.get_encoding()
+    finally:
+        metrics.observe_upstream(urlsplit(url).netloc, status, time.perf_counter() - started)
+    with metrics.timed("decode"):
+        return body.decode(encoding)
+
+
+async def fetch_text(
+    session: aiohttp.ClientSession,
+    url: str,
+    *,
+    method: str = "GET",
+    params: Optional[dict] = None,
+    data: Optional[dict] = None,
+    headers: Optional[dict] = None,
+) -> str:
+    """Fetch a page body, sharing one request between concurrent callers."""
+    key = (
+        method,
+        url,
+        tuple(sorted((params or {}).items())),
+        tuple(sorted((data or {}).items())),
+        tuple(sorted((headers or {}).items())),
+    )
+    return await fetches.do(key, _fetch_text, session, method, url, params, data, headers)
@@ -0,0 +1,132 @@
+import asyncio
+import logging
+import random
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Iterable, Optional
+
+from . import metrics
+from .settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class CatalogPage:
+    """One page of a provider catalog to keep in the response cache.
+
+    `load` refreshes the cached catalog response and returns it, `meta`
+    refreshes the cached meta response of one item of it.
+    """
+
+    provider: str
+    catalog: str
+    page: int
+    load: Callable[[], Awaitable[dict[str, list[Any]]]]
+    meta: Optional[Callable[[str, str], Awaitable[Any]]] = None
+
+
+# Provider name -> function listing the first `pages` pages of its catalogs
+_providers: dict[str, Callable[[int], Iterable[CatalogPage]]] = {}
+
+
+def register(name: str, pages: Callable[[int], Iterable[CatalogPage]]):
+    _providers[name] = pages
+
+
+def _item(item: Any) -> tuple[str, str]:
+    # Fresh results are models, cached ones come back decoded
+    if isinstance(item, dict):
+        return item["type"], item["id"]
+    return item.type, item.id
+
+
+class Scheduler:
+    """Crawls every registered catalog on start and then every `interval` seconds."""
+
+    def __init__(
+        self,
+        pages: int,
+        interval: float,
+        concurrency: int,
+        jitter: float = 0,
+        meta_items: int = 0,
+        prepare: Optional[Callable[[], Awaitable[Any]]] = None,
+    ):
+        self.pages = pages
+        self.interval = interval
+        self.jitter = jitter
+        self.meta_items = meta_items
+        # Run before each crawl, loads the providers so they can register
+        self.prepare = prepare
+        self.runs = 0
+        self.failures = 0
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._task: Optional[asyncio.Task] = None
+
+    async def _job(self, provider: str, describe: str, load: Callable[[], Awaitable[Any]]) -> Any:
+        metrics.label(provider, "warmup")
+        if self.jitter:
+            # Spread the requests so the upstream doesn't see a burst per run
+            await asyncio.sleep(random.uniform(0, self.jitter))
+        async with self._semaphore:
+            try:
+                return await load()
+            except Exception:
+                self.failures += 1
+                logger.warning(f"Warm-up of {describe} failed", exc_info=True)
+                return None
+
+    async def _warm_page(self, page: CatalogPage):
+        describe = f"{page.provider} {page.catalog} page {page.page}"
+        catalog = await self._job(page.provider, describe, page.load)
+        if not catalog or page.meta is None or not self.meta_items:
+            return
+        await asyncio.gather(
+            *(
+                self._job(page.provider, f"{page.provider} meta {id}", lambda type_=type_, id=id: page.meta(type_, id))
+                for type_, id in map(_item, catalog.get("metas", [])[: self.meta_items])
+            )
+        )
+
+    async def run_once(self):
+        if self.prepare is not None:
+            await self.prepare()
+        jobs = [self._warm_page(page) for pages in _providers.values() for page in pages(self.pages)]
+        await asyncio.gather(*jobs)
+        self.runs += 1
+        logger.info(f"Cache warm-up #{self.runs} done: {len(jobs)} catalog pages, {self.failures} failures so far")
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception:
+                # A provider that fails to load mustn't end warm-up for the others, or for good
+                self.failures += 1
+                logger.warning("Cache warm-up run failed", exc_info=True)
+            await asyncio.sleep(self.interval + random.uniform(0, self.jitter))
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._loop())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+
+def create_scheduler(prepare: Optional[Callable[[], Awaitable[Any]]] = None) -> Scheduler:
+    return Scheduler(
+        pages=settings.warmup_pages,
+        interval=settings.warmup_interval,
+        concurrency=settings.warmup_concurrency,
+        jitter=settings.warmup_jitter,
+        meta_items=settings.warmup_meta_items,
+        prepare=prepare,
+    )
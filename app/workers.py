@@ -0,0 +1,146 @@
+import asyncio
+import logging
+import multiprocessing
+import time
+from collections import defaultdict
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Optional, TypeVar
+
+from . import metrics
+from .settings import settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class ParsePoolFull(Exception):
+    """More parse jobs are waiting than `parse_queue_limit` allows."""
+
+
+@dataclass
+class Timings:
+    count: int = 0
+    total: float = 0.0
+    max: float = 0.0
+
+    def observe(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def as_dict(self) -> dict[str, float]:
+        return {
+            "count": self.count,
+            "total_s": self.total,
+            "mean_s": self.total / self.count if self.count else 0.0,
+            "max_s": self.max,
+        }
+
+
+def _timed(fn: Callable[..., T], args: tuple) -> tuple[float, float, float, T]:
+    # Runs in the worker; monotonic() is system-wide so it also works across processes.
+    # Imported here so the app doesn't load BeautifulSoup before a provider needs it
+    from . import parsing
+
+    parsing.reset_soup_seconds()
+    started = time.monotonic()
+    result = fn(*args)
+    return started, time.monotonic() - started, parsing.soup_seconds(), result
+
+
+def _label(fn: Callable) -> str:
+    # "app.parsers.eneyida.services" + "DetailPage.parse" -> "eneyida.DetailPage.parse"
+    module = fn.__module__.split(".")
+    provider = module[-2] if len(module) > 2 else module[-1]
+    return f"{provider}.{fn.__qualname__}"
+
+
+class ParsePool:
+    """Runs CPU-bound parsing off the event loop.
+
+    `kind` is "thread", "process" or "inline" (on the loop, for tests and
+    profiling). At most `size` jobs run at once and up to `queue_limit`
+    more wait; beyond that `ParsePoolFull` is raised instead of queueing
+    unbounded work behind a slow parse.
+    """
+
+    def __init__(self, kind: str, size: int, queue_limit: int):
+        if kind not in ("thread", "process", "inline"):
+            raise ValueError(f"Unknown parse pool kind: {kind}")
+        self.kind = kind
+        self.size = size
+        self.queue_limit = queue_limit
+        self.pending = 0
+        self.rejected = 0
+        self.parse_time: dict[str, Timings] = defaultdict(Timings)
+        self.queue_wait: dict[str, Timings] = defaultdict(Timings)
+        self._executor: Optional[Executor] = None
+
+    def _create_executor(self) -> Optional[Executor]:
+        if self.kind == "thread":
+            return ThreadPoolExecutor(self.size, thread_name_prefix="parse")
+        if self.kind == "process":
+            # Forking a process that already runs an event loop and sockets is unsafe
+            return ProcessPoolExecutor(self.size, mp_context=multiprocessing.get_context("spawn"))
+        return None
+
+    @property
+    def executor(self) -> Optional[Executor]:
+        if self._executor is None and self.kind != "inline":
+            self._executor = self._create_executor()
+        return self._executor
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def run(self, fn: Callable[..., T], *args: Any) -> T:
+        label = _label(fn)
+        if self.kind == "inline":
+            started, elapsed, soup, result = _timed(fn, args)
+            self._observe(label, elapsed, soup)
+            return result
+
+        if self.pending >= self.size + self.queue_limit:
+            self.rejected += 1
+            raise ParsePoolFull(f"{self.pending} parse jobs in flight, rejecting {label}")
+        self.pending += 1
+        submitted = time.monotonic()
+        try:
+            started, elapsed, soup, result = await asyncio.get_running_loop().run_in_executor(
+                self.executor, _timed, fn, args
+            )
+        finally:
+            self.pending -= 1
+        wait = max(0.0, started - submitted)
+        self.queue_wait[label].observe(wait)
+        metrics.observe("queue_wait", wait)
+        self._observe(label, elapsed, soup)
+        return result
+
+    def _observe(self, label: str, elapsed: float, soup: float):
+        self.parse_time[label].observe(elapsed)
+        # Building the tree is "parse", walking it and building models "extract"
+        metrics.observe("parse", soup)
+        metrics.observe("extract", max(0.0, elapsed - soup))
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "kind": self.kind,
+            "size": self.size,
+            "pending": self.pending,
+            "rejected": self.rejected,
+            "parse_time": {label: timings.as_dict() for label, timings in sorted(self.parse_time.items())},
+            "queue_wait": {label: timings.as_dict() for label, timings in sorted(self.queue_wait.items())},
+        }
+
+
+pool = ParsePool(settings.parse_pool, settings.parse_pool_size, settings.parse_queue_limit)
+
+
+async def parse(fn: Callable[..., T], *args: Any) -> T:
+    """Run `fn(*args)` in the parse pool. `fn` and its arguments must be picklable."""
+    return await pool.run(fn, *args)
@@ -0,0 +1,402 @@
+"""End-to-end load test of `app.main:app` against a local upstream stand-in.
+
+A fake eneyida/uakino server replays the recorded fixtures with configurable
+latency, jitter and error rate, the provider `main_url`s are pointed at it
+and an open-loop Stremio traffic mix is sent to the app in-process at each
+requested rate:
+
+    python -m benchmarks.load --rate 50 --rate 100 --rate 200 --duration 20
+    python -m benchmarks.load --latency 0.3 --jitter 0.1 --error-rate 0.02
+
+Latency is measured from the moment a request was scheduled, so a saturated
+app shows up as growing percentiles instead of a silently lower rate. The
+JSON report has, per rate step and endpoint, latency percentiles, upstream
+requests by kind and cache hit ratios. Without `--redis` only the in-process
+cache tier is used.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+import re
+import sys
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Optional
+
+import httpx
+from aiohttp import web
+
+from app import search, store, upstream, workers
+from app.cache import revalidations, stats as cache_stats
+from app.main import app
+from app.parsers.eneyida.settings import settings as eneyida_settings
+from app.parsers.uakino.settings import settings as uakino_settings
+from app.settings import settings
+from benchmarks.parsers import fixture
+
+# Relative weights of the Stremio requests, roughly what clients send when
+# browsing: catalogs and metas while scrolling, streams when opening a title
+DEFAULT_MIX = {
+    "manifest": 2,
+    "catalog": 10,
+    "catalog_skip": 8,
+    "meta": 30,
+    "stream": 40,
+    "search": 10,
+}
+
+# Endpoint -> cached route function, for the per-endpoint hit ratios
+ROUTES = {
+    "manifest": "addon_manifest",
+    "catalog": "addon_catalog",
+    "catalog_skip": "addon_catalog_skip",
+    "meta": "addon_meta",
+    "stream": "resolve_streams",
+    "search": "addon_search",
+}
+
+UAKINO_CATALOGS = {"movie": "uakino_movies_year", "series": "uakino_series_year"}
+QUERIES = ["аркейн", "дюна", "відьмак", "шерлок", "оппенгеймер", "фуріоза", "ходячі мерці", "друзі"]
+
+
+class FakeUpstream:
+    """Serves the recorded pages of both providers under /eneyida and /uakino."""
+
+    def __init__(self, latency: float, jitter: float, error_rate: float, seed: Optional[int] = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.requests: Counter[str] = Counter()
+        self.base_url = ""
+        self._random = random.Random(seed)
+        self._runner: Optional[web.AppRunner] = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        application = web.Application()
+        application.router.add_route("*", "/{path:.*}", self.handle)
+        self._runner = web.AppRunner(application, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://{host}:{port}"
+        return self.base_url
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    def page(self, provider: str, name: str) -> str:
+        text = fixture(provider, name)
+        return (
+            text.replace("https://eneyida.tv", f"{self.base_url}/eneyida")
+            .replace("https://hdvbua.pro", f"{self.base_url}/player/eneyida")
+            .replace("https://uakino.me", f"{self.base_url}/uakino")
+            .replace("//ashdi.vip", f"{self.base_url}/player/uakino")
+        )
+
+    def route(self, method: str, path: str) -> tuple[str, str, str]:
+        """Returns (kind, provider, fixture) for a request path."""
+        provider, _, rest = path.partition("/")
+        if provider == "player":
+            provider, _, rest = rest.partition("/")
+            if provider == "eneyida":
+                return "player", provider, "player_movie.html" if rest.startswith("vid/") else "player_series.html"
+            return "player", provider, "player.html"
+        if provider == "eneyida":
+            if method == "POST":
+                return "search", provider, "catalog.html"
+            if rest.endswith(".html"):
+                return "detail", provider, "detail_series.html" if "serial" in rest else "detail_movie.html"
+            return "catalog", provider, "catalog.html"
+        if provider == "uakino":
+            if method == "POST":
+                return "search", provider, "catalog.html"
+            if rest.startswith("engine/ajax/playlists.php"):
+                return "playlist", provider, "playlist.json"
+            if rest.endswith(".html"):
+                return "detail", provider, "detail_series.html" if rest.startswith("seriesss/") else "detail_movie.html"
+            return "catalog", provider, "catalog.html"
+        return "unknown", provider, ""
+
+    async def handle(self, request: web.Request) -> web.Response:
+        kind, provider, name = self.route(request.method, request.match_info["path"])
+        self.requests[f"{provider}.{kind}"] += 1
+        delay = max(0.0, self._random.gauss(self.latency, self.jitter)) if self.jitter else self.latency
+        if delay:
+            await asyncio.sleep(delay)
+        if not name:
+            return web.Response(status=404)
+        if self._random.random() < self.error_rate:
+            return web.Response(status=503, text="Service Unavailable")
+
+        text = self.page(provider, name)
+        if provider == "uakino" and name == "detail_series.html":
+            # Every series gets its own news_id, as on the real site
+            news_id = re.search(r"(\d+)[^/]*\.html$", request.path)
+            text = text.replace('data-news_id="1235"', f'data-news_id="{news_id.group(1) if news_id else 1235}"')
+        content_type = "application/json" if name.endswith(".json") else "text/html"
+        return web.Response(text=text, content_type=content_type)
+
+
+@dataclass
+class Titles:
+    """Zipf-like popularity over a fixed number of synthetic titles."""
+
+    count: int
+    rng: random.Random
+    weights: list[float] = field(init=False)
+
+    def __post_init__(self):
+        self.weights = [1 / (rank + 1) for rank in range(self.count)]
+
+    def pick(self) -> int:
+        return self.rng.choices(range(self.count), self.weights)[0]
+
+
+def make_request(endpoint: str, titles: Titles, rng: random.Random) -> str:
+    provider = rng.choice(["eneyida", "uakino"])
+    type_ = rng.choice(["movie", "series"])
+    n = titles.pick()
+    if provider == "eneyida":
+        id = f"{10000 + n}-{'serial' if type_ == 'series' else 'film'}"
+        if endpoint == "manifest":
+            return "/eneyida/manifest.json"
+        if endpoint == "catalog":
+            return f"/eneyida/catalog/{type_}/eneyida_{'series' if type_ == 'series' else 'films'}.json"
+        if endpoint == "catalog_skip":
+            return f"/eneyida/catalog/{type_}/eneyida_films/skip={24 * rng.randint(1, 5)}.json"
+        if endpoint == "meta":
+            return f"/eneyida/meta/{type_}/{id}.json"
+        if endpoint == "stream":
+            if type_ == "series":
+                return f"/eneyida/stream/series/{id}/Сезон 1/Серія {rng.randint(1, 2)}.json"
+            return f"/eneyida/stream/movie/{id}.json"
+        return f"/eneyida/catalog/series/eneyida_search/search={rng.choice(QUERIES)}.json"
+
+    id = f"seriesss/drama_series/{20000 + n}-serial" if type_ == "series" else f"filmy/genre_action/{30000 + n}-film"
+    if endpoint == "manifest":
+        return "/uakino/manifest.json"
+    if endpoint == "catalog":
+        return f"/uakino/catalog/{type_}/{UAKINO_CATALOGS[type_]}.json"
+    if endpoint == "catalog_skip":
+        return f"/uakino/catalog/{type_}/{UAKINO_CATALOGS[type_]}/skip={20 * rng.randint(1, 5)}.json"
+    if endpoint == "meta":
+        return f"/uakino/meta/{type_}/{id}.json"
+    if endpoint == "stream":
+        if type_ == "series":
+            return f"/uakino/stream/series/{id}/2:{rng.randint(1, 2)}.json"
+        return f"/uakino/stream/movie/{id}.json"
+    return f"/uakino/catalog/{type_}/uakino_search/search={rng.choice(QUERIES)}.json"
+
+
+def percentile(ordered: list[float], p: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(0, round(p / 100 * len(ordered)) - 1))]
+
+
+def summarize(latencies: list[float], errors: int, duration: float) -> dict[str, float]:
+    ordered = sorted(latencies)
+    return {
+        "requests": len(ordered),
+        "errors": errors,
+        "throughput": len(ordered) / duration if duration else 0.0,
+        "p50_ms": percentile(ordered, 50) * 1000,
+        "p90_ms": percentile(ordered, 90) * 1000,
+        "p99_ms": percentile(ordered, 99) * 1000,
+        "max_ms": (ordered[-1] if ordered else 0.0) * 1000,
+    }
+
+
+def route_snapshot() -> dict[str, tuple[int, int]]:
+    return {route: (counts.hits, counts.misses) for route, counts in cache_stats.routes.items()}
+
+
+def hit_ratios(before: dict[str, tuple[int, int]], after: dict[str, tuple[int, int]]) -> dict[str, Optional[float]]:
+    ratios = {}
+    for endpoint, function in ROUTES.items():
+        hits = misses = 0
+        for provider in ("eneyida", "uakino"):
+            route = f"{provider}.{function}"
+            hits += after.get(route, (0, 0))[0] - before.get(route, (0, 0))[0]
+            misses += after.get(route, (0, 0))[1] - before.get(route, (0, 0))[1]
+        ratios[endpoint] = hits / (hits + misses) if hits + misses else None
+    return ratios
+
+
+async def run_step(
+    client: httpx.AsyncClient,
+    fake: FakeUpstream,
+    rate: float,
+    duration: float,
+    mix: dict[str, float],
+    titles: Titles,
+    rng: random.Random,
+    max_in_flight: int,
+) -> dict[str, Any]:
+    latencies: dict[str, list[float]] = defaultdict(list)
+    errors: Counter[str] = Counter()
+    dropped = 0
+    in_flight: set[asyncio.Task] = set()
+    endpoints, weights = list(mix), list(mix.values())
+    upstream_before = Counter(fake.requests)
+    cache_before = route_snapshot()
+
+    async def send(endpoint: str, path: str, scheduled: float):
+        try:
+            response = await client.get(path)
+            if response.status_code >= 400:
+                errors[endpoint] += 1
+        except Exception:
+            errors[endpoint] += 1
+        latencies[endpoint].append(time.perf_counter() - scheduled)
+
+    started = time.perf_counter()
+    scheduled = started
+    while scheduled - started < duration:
+        # Poisson arrivals at the requested rate
+        scheduled += rng.expovariate(rate)
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if len(in_flight) >= max_in_flight:
+            dropped += 1
+            continue
+        endpoint = rng.choices(endpoints, weights)[0]
+        task = asyncio.ensure_future(send(endpoint, make_request(endpoint, titles, rng), scheduled))
+        in_flight.add(task)
+        task.add_done_callback(in_flight.discard)
+    if in_flight:
+        await asyncio.wait(in_flight)
+    elapsed = time.perf_counter() - started
+
+    ratios = hit_ratios(cache_before, route_snapshot())
+    all_latencies = [latency for values in latencies.values() for latency in values]
+    return {
+        "rate": rate,
+        "duration_s": elapsed,
+        "dropped": dropped,
+        "total": summarize(all_latencies, sum(errors.values()), elapsed),
+        "endpoints": {
+            endpoint: {**summarize(latencies[endpoint], errors[endpoint], elapsed), "cache_hit_ratio": ratios[endpoint]}
+            for endpoint in mix
+            if latencies[endpoint]
+        },
+        "upstream_requests": dict(sorted((Counter(fake.requests) - upstream_before).items())),
+    }
+
+
+async def run(args: argparse.Namespace) -> dict[str, Any]:
+    rng = random.Random(args.seed)
+    fake = FakeUpstream(args.latency, args.jitter, args.error_rate, args.seed)
+    base_url = await fake.start()
+    eneyida_settings.main_url = f"{base_url}/eneyida"
+    uakino_settings.main_url = f"{base_url}/uakino"
+    # Measure what clients see from a cold start, not a pre-filled cache
+    settings.warmup_enabled = args.warmup
+    settings.warmup_providers = ["eneyida", "uakino"] if args.warmup else []
+    # Stream probes would show up as upstream traffic
+    settings.health_enabled = False
+    # Start with an empty search index and metadata store, outside of the working directory
+    search.index = search.SearchIndex(":memory:", settings.search_limit)
+    store.metadata = store.MetadataStore(":memory:")
+    if args.redis:
+        settings.redis_url = args.redis
+    else:
+        # Nothing listens there, the layered cache falls back to memory at once
+        settings.redis_url = "redis://127.0.0.1:1"
+        settings.redis_retry_interval = 24 * 60 * 60
+
+    steps = []
+    try:
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://stremio", timeout=None) as client:
+                titles = Titles(args.titles, rng)
+                for rate in args.rate or [25.0, 50.0, 100.0]:
+                    step = await run_step(
+                        client, fake, rate, args.duration, args.mix, titles, rng, args.max_in_flight
+                    )
+                    steps.append(step)
+                    print(format_step(step), file=sys.stderr)
+    finally:
+        await fake.stop()
+
+    return {
+        "config": {
+            "duration_s": args.duration,
+            "titles": args.titles,
+            "latency_s": args.latency,
+            "jitter_s": args.jitter,
+            "error_rate": args.error_rate,
+            "mix": args.mix,
+            "redis": bool(args.redis),
+            "warmup": args.warmup,
+        },
+        "steps": steps,
+        "singleflight": {"upstream": upstream.fetches.stats(), "cache": revalidations.stats()},
+        "parse_pool": workers.pool.stats(),
+    }
+
+
+def format_step(step: dict[str, Any]) -> str:
+    lines = [
+        f"rate {step['rate']:g}/s: {step['total']['throughput']:.1f} req/s, "
+        f"p50 {step['total']['p50_ms']:.1f}ms p99 {step['total']['p99_ms']:.1f}ms, "
+        f"{step['total']['errors']} errors, {step['dropped']} dropped"
+    ]
+    for endpoint, result in step["endpoints"].items():
+        ratio = result["cache_hit_ratio"]
+        lines.append(
+            f"  {endpoint:<13} n={result['requests']:<6} p50 {result['p50_ms']:8.1f}ms "
+            f"p99 {result['p99_ms']:8.1f}ms  hits {'-' if ratio is None else f'{ratio:.0%}'}"
+        )
+    lines.append(f"  upstream: {step['upstream_requests']}")
+    return "\n".join(lines)
+
+
+def parse_mix(value: str) -> dict[str, float]:
+    mix = {}
+    for item in value.split(","):
+        endpoint, _, weight = item.partition("=")
+        if endpoint not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"Unknown endpoint {endpoint!r}, expected one of {list(DEFAULT_MIX)}")
+        mix[endpoint] = float(weight)
+    return mix
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rate", type=float, action="append", help="Requests per second, repeatable (one step each)")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per rate step")
+    parser.add_argument("--titles", type=int, default=500, help="Distinct titles per provider and type")
+    parser.add_argument("--latency", type=float, default=0.1, help="Mean upstream latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.05, help="Standard deviation of the upstream latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of upstream requests answered with 503")
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX,
+                        help="Traffic mix as endpoint=weight,... (manifest, catalog, catalog_skip, meta, stream, search)")
+    parser.add_argument("--max-in-flight", type=int, default=1000, help="Requests over this are dropped and counted")
+    parser.add_argument("--redis", help="Redis URL for the shared cache tier (default: memory only)")
+    parser.add_argument("--warmup", action="store_true", help="Run the catalog warm-up scheduler as in production")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--output", type=Path, help="Write the report JSON here instead of stdout")
+    args = parser.parse_args(argv)
+
+    logging.getLogger().setLevel(logging.WARNING)
+    report = asyncio.run(run(args))
+
+    payload = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        args.output.write_text(payload + "\n")
+    else:
+        print(payload)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
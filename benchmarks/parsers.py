@@ -0,0 +1,203 @@
+"""Offline micro-benchmarks of the provider extractors.
+
+Runs every extractor against the fixtures next to each provider (no
+network) on every installed HTML backend and reports timings and
+allocations as JSON. The fixtures are hand-written, not captures of the
+sites; the catalog cases use `catalog_page.html`, shaped and sized like a
+real listing page (24 eneyida / 20 uakino cards among the menus, sidebar
+and scripts around them), the other cases small pages with the parsed
+parts only:
+
+    python -m benchmarks.parsers --output bench.json
+    python -m benchmarks.parsers --baseline bench.json --threshold 0.25
+
+With `--baseline` the exit code is 1 when any case got slower by more than
+`threshold` (relative median time), so it can gate a deploy.
+"""
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+from app.parsing import available_backends
+from app.settings import settings
+from app.parsers.eneyida import services as eneyida
+from app.parsers.uakino import services as uakino
+
+PARSERS = Path(__file__).parent.parent / "app" / "parsers"
+
+
+def fixture(provider: str, name: str) -> str:
+    return (PARSERS / provider / "fixtures" / name).read_text(encoding="utf-8")
+
+
+def run_sync(coroutine) -> Any:
+    """Drives a coroutine that never awaits real I/O without an event loop."""
+    try:
+        coroutine.send(None)
+    except StopIteration as stop:
+        return stop.value
+    raise RuntimeError("Extractor awaited I/O, it can't be benchmarked offline")
+
+
+def cases() -> dict[str, Callable[[], Any]]:
+    eneyida_catalog = fixture("eneyida", "catalog_page.html")
+    eneyida_movie = fixture("eneyida", "detail_movie.html")
+    eneyida_series = fixture("eneyida", "detail_series.html")
+    eneyida_player_movie = fixture("eneyida", "player_movie.html")
+    eneyida_player_series = fixture("eneyida", "player_series.html")
+    uakino_catalog = fixture("uakino", "catalog_page.html")
+    uakino_movie = fixture("uakino", "detail_movie.html")
+    uakino_series = fixture("uakino", "detail_series.html")
+    uakino_playlist = fixture("uakino", "playlist.json")
+    uakino_player = fixture("uakino", "player.html")
+
+    def eneyida_series_meta():
+        page = eneyida.DetailPage.parse(eneyida_series)
+        index = eneyida.PlaylistIndex.parse(page, eneyida_player_series)
+        videos = eneyida.extract_videos("7710-arkeyn", page, index)
+        return run_sync(eneyida.get_series_metadata("7710-arkeyn", page, videos, "series"))
+
+    def eneyida_videos():
+        page = eneyida.DetailPage.parse(eneyida_series)
+        return eneyida.extract_videos("7710-arkeyn", page, eneyida.PlaylistIndex.parse(page, eneyida_player_series))
+
+    def uakino_series_meta():
+        episode_map = uakino.EpisodeMap.parse(uakino_playlist)
+        videos = uakino.extract_episodes("seriesss/drama_series/1235", uakino_series, episode_map)
+        return uakino.parse_series_metadata("seriesss/drama_series/1235", uakino_series, videos, "series")
+
+    return {
+        "eneyida.get_previews_metadata": lambda: eneyida.parse_previews(eneyida_catalog, "movie"),
+        "eneyida.detail_page": lambda: eneyida.DetailPage.parse(eneyida_movie),
+        "eneyida.get_series_metadata": eneyida_series_meta,
+        "eneyida.get_videos": eneyida_videos,
+        "eneyida.get_streams.movie": lambda: eneyida.extract_streams(
+            eneyida.PlaylistIndex.parse(eneyida.DetailPage.parse(eneyida_movie), eneyida_player_movie), None, None
+        ),
+        "eneyida.get_streams.series": lambda: eneyida.extract_streams(
+            eneyida.PlaylistIndex.parse(eneyida.DetailPage.parse(eneyida_series), eneyida_player_series),
+            "Сезон 1",
+            "Серія 1",
+        ),
+        "uakino.get_previews_metadata": lambda: uakino.parse_previews(uakino_catalog, "movie"),
+        "uakino.get_series_metadata": uakino_series_meta,
+        "uakino.get_videos.movie": lambda: uakino.extract_movie_video("filmy/genre_action/21542-furioza", uakino_movie),
+        "uakino.get_videos.series": lambda: uakino.extract_episodes(
+            "seriesss/drama_series/1235", uakino_series, uakino.EpisodeMap.parse(uakino_playlist)
+        ),
+        "uakino.get_streams.movie": lambda: (
+            uakino.extract_movie_player(uakino_movie),
+            uakino.extract_stream_url(uakino_player),
+        ),
+        "uakino.get_streams.series": lambda: (
+            uakino.extract_news_id(uakino_series),
+            uakino.extract_episode_player(uakino.EpisodeMap.parse(uakino_playlist), 2),
+            uakino.extract_stream_url(uakino_player),
+        ),
+    }
+
+
+def measure(fn: Callable[[], Any], rounds: int) -> dict[str, float]:
+    fn()  # warm up caches and lazy imports
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+
+    # Allocations are measured on a separate call, tracemalloc slows it down
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        fn()
+        after, peak = tracemalloc.get_traced_memory()
+        blocks = sum(stat.count for stat in tracemalloc.take_snapshot().statistics("filename"))
+    finally:
+        tracemalloc.stop()
+
+    median = statistics.median(timings)
+    return {
+        "rounds": rounds,
+        "min_s": min(timings),
+        "median_s": median,
+        "mean_s": statistics.fmean(timings),
+        "stdev_s": statistics.stdev(timings) if rounds > 1 else 0.0,
+        "ops_per_s": 1 / median if median else 0.0,
+        "retained_bytes": after - before,
+        "peak_bytes": peak - before,
+        "retained_blocks": blocks,
+    }
+
+
+def run(rounds: int, backends: list[str], only: Optional[str] = None) -> dict[str, Any]:
+    original = settings.html_parser
+    results = {}
+    try:
+        for backend in backends:
+            settings.html_parser = backend
+            for name, fn in cases().items():
+                if only and only not in name:
+                    continue
+                results[f"{name}[{backend}]"] = measure(fn, rounds)
+    finally:
+        settings.html_parser = original
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "created": time.time(),
+        "results": results,
+    }
+
+
+def compare(current: dict[str, Any], baseline: dict[str, Any], threshold: float) -> list[str]:
+    regressions = []
+    for name, result in current["results"].items():
+        previous = baseline["results"].get(name)
+        if previous is None or not previous["median_s"]:
+            continue
+        change = result["median_s"] / previous["median_s"] - 1
+        result["change"] = change
+        if change > threshold:
+            regressions.append(
+                f"{name}: {previous['median_s'] * 1000:.3f}ms -> {result['median_s'] * 1000:.3f}ms (+{change:.0%})"
+            )
+    return regressions
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--backend", action="append", choices=available_backends(),
+                        help="HTML backend to run, repeatable (default: all installed)")
+    parser.add_argument("--only", help="Run only cases whose name contains this string")
+    parser.add_argument("--output", type=Path, help="Write results JSON here instead of stdout")
+    parser.add_argument("--baseline", type=Path, help="Results JSON of a previous run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="Allowed relative slowdown of the median before failing")
+    args = parser.parse_args(argv)
+
+    report = run(args.rounds, args.backend or available_backends(), args.only)
+    regressions = []
+    if args.baseline:
+        regressions = compare(report, json.loads(args.baseline.read_text()), args.threshold)
+        report["regressions"] = regressions
+
+    payload = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        args.output.write_text(payload + "\n")
+    else:
+        print(payload)
+    for regression in regressions:
+        print(f"REGRESSION {regression}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
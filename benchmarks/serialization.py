@@ -0,0 +1,186 @@
+"""Offline micro-benchmarks of building, encoding and serving route results.
+
+Measures a 24-item catalog page and a 300-episode series meta through each
+step a response goes through: building the models (validated or trusted),
+encoding a cache entry, FastAPI's response_model pass and a cache hit
+(decoded and re-encoded, or sent as the stored bytes). Reports timings and
+the cost per item as JSON:
+
+    python -m benchmarks.serialization --output serialization.json
+    python -m benchmarks.serialization --baseline serialization.json --threshold 0.25
+
+With `--baseline` the exit code is 1 when any case got slower by more than
+`threshold` (relative median time).
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+from app import compression, serialization
+from app.cache import Entry
+from app.schemas import Preview, Series, Videos
+from benchmarks.parsers import compare, measure
+
+CATALOG_SIZE = 24
+EPISODES = 300
+
+
+def catalog_data() -> list[dict]:
+    return [
+        {
+            "id": f"filmy/genre_action/{21500 + n}-film-{n}",
+            "type": "movie",
+            "name": f"Фільм номер {n}",
+            "genres": ["Бойовик", "Трилер"],
+            "poster": f"https://uakino.best/uploads/posts/2024-01/{n}.jpg",
+            "description": "Опис фільму, що показується під постером. " * 4,
+            "releaseInfo": str(2000 + n),
+        }
+        for n in range(CATALOG_SIZE)
+    ]
+
+
+def meta_data() -> dict:
+    item_id = "seriesss/drama_series/1235-khodyachi-mertsi"
+    return {
+        "id": item_id,
+        "type": "series",
+        "name": "Ходячі мерці",
+        "genres": ["Драма", "Жахи"],
+        "poster": "https://uakino.best/uploads/posts/1235.jpg",
+        "description": "Опис серіалу. " * 20,
+        "releaseInfo": "2010",
+        "director": ["Френк Дарабонт"],
+        "runtime": "45 хв",
+        "background": "https://uakino.best/uploads/posts/1235.jpg",
+        "videos": [
+            {
+                "id": f"{item_id}/{n // 20 + 1}:{n % 20 + 1}",
+                "title": f"{n % 20 + 1} серія",
+                "thumbnail": "https://uakino.best/uploads/posts/1235.jpg",
+                "released": None,
+                "season": n // 20 + 1,
+                "episode": n % 20 + 1,
+            }
+            for n in range(EPISODES)
+        ],
+    }
+
+
+def _legacy_dumps(value: Any) -> bytes:
+    # How cache entries were encoded before app.serialization
+    return json.dumps(jsonable_encoder(value), ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+
+
+def _served(fn: Callable[[], Any], accept_encoding: Optional[str]) -> Callable[[], Any]:
+    def served():
+        token = compression.accepted.set(accept_encoding)
+        try:
+            return fn()
+        finally:
+            compression.accepted.reset(token)
+
+    return served
+
+
+def _response_cases(name: str, value: dict, adapter: TypeAdapter) -> dict[str, Callable[[], Any]]:
+    stored = Entry.build(time.time() + 60, value).pack()
+
+    def decoded_hit():
+        # A hit decoded, validated and encoded again, as routes answered them before
+        return adapter.dump_json(adapter.validate_python(Entry.unpack(stored).value()))
+
+    return {
+        f"{name}.encode.jsonable_encoder": lambda: _legacy_dumps(value),
+        f"{name}.encode.fast": lambda: serialization.dumps(value),
+        f"{name}.response_model": lambda: adapter.dump_json(adapter.validate_python(value)),
+        f"{name}.hit.decoded": decoded_hit,
+        f"{name}.hit.raw": _served(lambda: Entry.unpack(stored).response(), compression.best()),
+        f"{name}.hit.inflated": _served(lambda: Entry.unpack(stored).response(), ""),
+    }
+
+
+def cases() -> dict[str, tuple[int, Callable[[], Any]]]:
+    """Case name -> (items it handles, function)."""
+    previews = catalog_data()
+    meta = meta_data()
+    episodes = meta["videos"]
+    catalog = {"metas": [Preview(**preview) for preview in previews]}
+    series = {"meta": Series(**meta)}
+
+    def meta_validate():
+        return Series(**{**meta, "videos": [Videos(**video) for video in episodes]})
+
+    def meta_construct():
+        return Series(**{**meta, "videos": [Videos.model_construct(**video) for video in episodes]})
+
+    built = {
+        "catalog.build.validate": lambda: [Preview(**preview) for preview in previews],
+        "catalog.build.construct": lambda: [Preview.model_construct(**preview) for preview in previews],
+        "meta.build.validate": meta_validate,
+        "meta.build.construct": meta_construct,
+    }
+    responses = {
+        **_response_cases("catalog", catalog, TypeAdapter(dict[str, list[Preview]])),
+        **_response_cases("meta", series, TypeAdapter(dict[str, Series])),
+    }
+    return {
+        name: (CATALOG_SIZE if name.startswith("catalog.") else EPISODES, fn)
+        for name, fn in {**built, **responses}.items()
+    }
+
+
+def run(rounds: int, only: Optional[str] = None) -> dict[str, Any]:
+    results = {}
+    for name, (items, fn) in cases().items():
+        if only and only not in name:
+            continue
+        result = measure(fn, rounds)
+        result["items"] = items
+        result["per_item_us"] = result["median_s"] / items * 1_000_000
+        results[name] = result
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "created": time.time(),
+        "json": "orjson" if serialization.orjson is not None else "json",
+        "encoding": compression.best(),
+        "results": results,
+    }
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=200)
+    parser.add_argument("--only", help="Run only cases whose name contains this string")
+    parser.add_argument("--output", type=Path, help="Write results JSON here instead of stdout")
+    parser.add_argument("--baseline", type=Path, help="Results JSON of a previous run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="Allowed relative slowdown of the median before failing")
+    args = parser.parse_args(argv)
+
+    report = run(args.rounds, args.only)
+    regressions = []
+    if args.baseline:
+        regressions = compare(report, json.loads(args.baseline.read_text()), args.threshold)
+        report["regressions"] = regressions
+
+    payload = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        args.output.write_text(payload + "\n")
+    else:
+        print(payload)
+    for regression in regressions:
+        print(f"REGRESSION {regression}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
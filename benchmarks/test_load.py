@@ -0,0 +1,48 @@
+import json
+
+import pytest
+
+from app import search, store
+from app.parsers.eneyida.settings import settings as eneyida_settings
+from app.parsers.uakino.settings import settings as uakino_settings
+from app.settings import settings
+from benchmarks import load
+
+
+@pytest.fixture
+def restore_settings(monkeypatch):
+    # The harness repoints the providers at its fake upstream
+    for target, name in [
+        (eneyida_settings, "main_url"),
+        (uakino_settings, "main_url"),
+        (settings, "redis_url"),
+        (settings, "redis_retry_interval"),
+        (settings, "warmup_enabled"),
+        (settings, "warmup_providers"),
+        (settings, "health_enabled"),
+        (search, "index"),
+        (store, "metadata"),
+    ]:
+        monkeypatch.setattr(target, name, getattr(target, name))
+
+
+def test_traffic_mix_is_served_from_the_fake_upstream(tmp_path, restore_settings):
+    output = tmp_path / "load.json"
+    argv = ["--rate", "40", "--duration", "1", "--titles", "3", "--latency", "0", "--jitter", "0"]
+    assert load.main(argv + ["--seed", "7", "--output", str(output)]) == 0
+
+    step = json.loads(output.read_text())["steps"][0]
+    assert step["total"]["requests"] > 0
+    assert step["total"]["errors"] == 0
+    assert {"meta", "stream"} <= set(step["endpoints"])
+    assert step["upstream_requests"]["eneyida.detail"] > 0
+    assert step["upstream_requests"]["uakino.player"] > 0
+    # Three titles per type are requested over and over
+    assert step["endpoints"]["meta"]["cache_hit_ratio"] > 0
+
+
+def test_percentiles_use_nearest_rank():
+    ordered = [i / 100 for i in range(1, 101)]
+    assert load.percentile(ordered, 50) == 0.5
+    assert load.percentile(ordered, 99) == 0.99
+    assert load.percentile([], 99) == 0.0
@@ -0,0 +1,19 @@
+import json
+
+from benchmarks import parsers
+
+
+def test_report_covers_every_case(tmp_path):
+    output = tmp_path / "bench.json"
+    assert parsers.main(["--rounds", "1", "--backend", "html.parser", "--output", str(output)]) == 0
+
+    report = json.loads(output.read_text())
+    assert set(report["results"]) == {f"{name}[html.parser]" for name in parsers.cases()}
+    assert all(result["median_s"] > 0 and result["peak_bytes"] > 0 for result in report["results"].values())
+
+
+def test_slower_cases_are_reported_as_regressions():
+    baseline = {"results": {"case[lxml]": {"median_s": 0.001}}}
+    current = {"results": {"case[lxml]": {"median_s": 0.002}}}
+    assert parsers.compare(current, baseline, threshold=0.5) == ["case[lxml]: 1.000ms -> 2.000ms (+100%)"]
+    assert parsers.compare(current, baseline, threshold=1.5) == []
@@ -0,0 +1,13 @@
+import json
+
+from benchmarks import serialization
+
+
+def test_report_covers_every_case(tmp_path):
+    output = tmp_path / "serialization.json"
+    assert serialization.main(["--rounds", "1", "--output", str(output)]) == 0
+
+    report = json.loads(output.read_text())
+    assert set(report["results"]) == set(serialization.cases())
+    assert report["results"]["meta.hit.raw"]["items"] == serialization.EPISODES
+    assert all(result["per_item_us"] > 0 for result in report["results"].values())